@@ -1,79 +1,52 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, Response, stream_with_context
 from flask_login import login_required, current_user, login_user, logout_user
 from models import db, User, Patient, Doctor, UserType, VerificationStatus, VerificationDocument
-from werkzeug.security import generate_password_hash
 import os
 from datetime import datetime
-from flask_bcrypt import Bcrypt
-
-# Create bcrypt instance
-bcrypt = Bcrypt()
+from search import doctor_search_index
+from utils import sync_doctor_lookups
+from authz import admin_required, get_identity, is_admin
+from passwords import hash_password, check_and_upgrade
+from throttle import login_throttle
+from schedules import ScheduleError, detect_format, parse_schedule, import_schedules, export_schedules
+from exports import EXPORTS, EXPORT_FORMATS, stream_export
+from user_listing import DEFAULT_PAGE_SIZE, parse_fields, parse_filters, list_users
 
 admin_panel = Blueprint('admin_panel', __name__, url_prefix='/admin_panel')
 
-def admin_required(f):
-    """Decorator to check if user is an admin."""
-    def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated:
-            return redirect(url_for('auth.login'))
-        
-        # Check if user is an admin
-        if current_user.user_type == UserType.ADMIN:
-            return f(*args, **kwargs)
-            
-        # Check if user is a doctor with admin privileges
-        if current_user.user_type == UserType.DOCTOR:
-            doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-            if doctor and doctor.specialty == "Administration":
-                return f(*args, **kwargs)
-        
-        flash('Access denied. Admin privileges required.', 'danger')
-        return redirect(url_for('main.index'))
-    
-    # Preserve the original function name and docstring
-    decorated_function.__name__ = f.__name__
-    decorated_function.__doc__ = f.__doc__
-    return decorated_function
-
 @admin_panel.route('/login', methods=['GET', 'POST'])
 def login():
     """Admin login page."""
     # If user is already logged in and is an admin, redirect to dashboard
     if current_user.is_authenticated:
-        if current_user.user_type == UserType.ADMIN or (
-            current_user.user_type == UserType.DOCTOR and 
-            Doctor.query.filter_by(user_id=current_user.id).first() and 
-            Doctor.query.filter_by(user_id=current_user.id).first().specialty == "Administration"
-        ):
+        if get_identity().is_admin:
             return redirect(url_for('admin_panel.dashboard'))
     
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
         
+        # Turn away throttled clients before any database lookup or hashing
+        retry_after = login_throttle.check(request.remote_addr, email)
+        if retry_after:
+            flash(f'Too many failed login attempts. Please try again in {retry_after} seconds.', 'danger')
+            return render_template('admin/login.html'), 429, {'Retry-After': str(retry_after)}
+        
         user = User.query.filter_by(email=email).first()
         
-        if user:
-            # Try to verify password directly
-            try:
-                # Check if the password hash is valid
-                if bcrypt.check_password_hash(user.password_hash, password):
-                    # Check if user is an admin or a doctor with admin privileges
-                    if user.user_type == UserType.ADMIN or (
-                        user.user_type == UserType.DOCTOR and 
-                        Doctor.query.filter_by(user_id=user.id).first() and 
-                        Doctor.query.filter_by(user_id=user.id).first().specialty == "Administration"
-                    ):
-                        login_user(user)
-                        return redirect(url_for('admin_panel.dashboard'))
-                    else:
-                        flash('Access denied. Admin privileges required.', 'danger')
-                else:
-                    flash('Login failed. Please check your email and password.', 'danger')
-            except ValueError:
-                # If there's an issue with the password hash, show error
-                flash('Login failed. Invalid password format.', 'danger')
+        if user and check_and_upgrade(user, password):
+            # Store the rehashed password if the hashing settings changed
+            db.session.commit()
+            login_throttle.success(request.remote_addr, email)
+            
+            # Check if user is an admin or a doctor with admin privileges
+            if is_admin(user):
+                login_user(user)
+                return redirect(url_for('admin_panel.dashboard'))
+            else:
+                flash('Access denied. Admin privileges required.', 'danger')
         else:
+            login_throttle.failure(request.remote_addr, email)
             flash('Login failed. Please check your email and password.', 'danger')
     
     return render_template('admin/login.html')
@@ -196,7 +169,7 @@ def create_user():
         # Create user
         user = User(
             email=email,
-            password_hash=bcrypt.generate_password_hash(password),
+            password_hash=hash_password(password),
             first_name=first_name,
             last_name=last_name,
             phone=phone,
@@ -230,9 +203,12 @@ def create_user():
                 bio=request.form.get('bio', ''),
                 verification_status=VerificationStatus.VERIFIED
             )
+            sync_doctor_lookups(doctor)
             db.session.add(doctor)
         
         db.session.commit()
+        if user.user_type == UserType.DOCTOR:
+            doctor_search_index.update_doctor(doctor)
         flash('User created successfully', 'success')
         return redirect(url_for('admin_panel.users'))
     
@@ -257,7 +233,7 @@ def edit_user(user_id):
         
         # Update password if provided
         if request.form.get('password'):
-            user.password_hash = bcrypt.generate_password_hash(request.form.get('password'))
+            user.password_hash = hash_password(request.form.get('password'))
         
         # Update profile data
         if user.user_type == UserType.PATIENT:
@@ -277,8 +253,11 @@ def edit_user(user_id):
                 doctor.education = request.form.get('education')
                 doctor.bio = request.form.get('bio')
                 doctor.verification_status = VerificationStatus(request.form.get('verification_status'))
+                sync_doctor_lookups(doctor)
         
         db.session.commit()
+        if user.user_type == UserType.DOCTOR and doctor:
+            doctor_search_index.update_doctor(doctor)
         flash('User updated successfully', 'success')
         return redirect(url_for('admin_panel.user_detail', user_id=user.id))
     
@@ -319,6 +298,7 @@ def delete_user(user_id):
                     os.remove(doc.file_path)
                 db.session.delete(doc)
             db.session.delete(doctor)
+            doctor_search_index.remove_doctor(doctor.id)
     
     # Delete the user
     db.session.delete(user)
@@ -345,6 +325,7 @@ def verify_doctor(doctor_id, action):
         flash('Doctor rejected', 'info')
     
     db.session.commit()
+    doctor_search_index.update_doctor(doctor)
     return redirect(url_for('admin_panel.doctors'))
 
 # API endpoints for AJAX operations
@@ -352,21 +333,44 @@ def verify_doctor(doctor_id, action):
 @login_required
 @admin_required
 def api_users():
-    """API endpoint to get users."""
-    users = User.query.all()
-    result = []
-    
-    for user in users:
-        result.append({
-            'id': user.id,
-            'email': user.email,
-            'name': f"{user.first_name} {user.last_name}",
-            'user_type': user.user_type.name,
-            'is_active': user.is_active,
-            'created_at': user.created_at.strftime('%Y-%m-%d %H:%M:%S')
-        })
-    
-    return jsonify(result)
+    """
+    API endpoint to get a page of users, newest first.
+    
+    Query parameters: limit (at most 200), cursor (next_cursor of the previous
+    page), fields (comma-separated, see user_listing.USER_FIELDS) and the
+    filters user_type, is_active, verification_status, created_from and
+    created_to.
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        conditions, joins = parse_filters(request.args)
+        page = list_users(
+            fields, conditions, joins,
+            limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    return jsonify(page)
+
+@admin_panel.route('/api/export/<kind>')
+@login_required
+@admin_required
+def api_export(kind):
+    """API endpoint to download all users, patients or doctors as CSV or JSON Lines (?format=jsonl)."""
+    if kind not in EXPORTS:
+        return jsonify({'success': False, 'message': f'Unknown export: {kind}'}), 404
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'message': f'Unknown export format: {fmt}'}), 400
+    
+    filename = f"{kind}-{datetime.utcnow().strftime('%Y%m%d')}.{fmt}"
+    return Response(
+        stream_with_context(stream_export(kind, fmt)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 @admin_panel.route('/api/activate-user/<int:user_id>', methods=['POST'])
 @login_required
@@ -380,3 +384,69 @@ def api_activate_user(user_id):
     db.session.commit()
     
     return jsonify({'success': True, 'message': 'User activated successfully'})
+
+@admin_panel.route('/api/login-metrics')
+@login_required
+@admin_required
+def api_login_metrics():
+    """API endpoint with the login throttling counters of this process."""
+    return jsonify(login_throttle.metrics())
+
+@admin_panel.route('/api/schedules/import', methods=['POST'])
+@login_required
+@admin_required
+def api_import_schedules():
+    """
+    API endpoint to import weekly schedules of one or many doctors.
+    
+    The schedule is an uploaded 'file' or the request body, as CSV or JSON
+    (see schedules.py). Query parameters: format (csv or json, otherwise from
+    the file name or content type), replace (default true; false adds to the
+    current windows) and dry_run.
+    """
+    upload = request.files.get('file')
+    try:
+        if upload:
+            text = upload.read().decode('utf-8-sig')
+            fmt = detect_format(request.args.get('format'), upload.filename, upload.content_type)
+        else:
+            text = request.get_data().decode('utf-8-sig')
+            fmt = detect_format(request.args.get('format'), content_type=request.content_type)
+    except UnicodeDecodeError:
+        return jsonify({'success': False, 'errors': ['The schedule must be UTF-8 text']}), 400
+    replace = request.args.get('replace', 'true').lower() != 'false'
+    dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+    
+    try:
+        windows, errors = parse_schedule(text, fmt)
+    except ScheduleError as e:
+        return jsonify({'success': False, 'errors': [str(e)]}), 400
+    if errors:
+        return jsonify({'success': False, 'errors': errors}), 400
+    
+    result = import_schedules(windows, replace=replace, dry_run=dry_run)
+    if result.errors:
+        return jsonify({'success': False, 'errors': result.errors}), 400
+    
+    return jsonify({
+        'success': True,
+        'dry_run': dry_run,
+        'doctors': result.doctors,
+        'windows': result.windows
+    })
+
+@admin_panel.route('/api/schedules/export')
+@login_required
+@admin_required
+def api_export_schedules():
+    """API endpoint to download weekly schedules in the import format, optionally for some doctor_id values."""
+    fmt = detect_format(request.args.get('format'))
+    doctor_ids = request.args.getlist('doctor_id', type=int)
+    try:
+        output = export_schedules(doctor_ids or None, fmt)
+    except ScheduleError as e:
+        return jsonify({'success': False, 'errors': [str(e)]}), 400
+    
+    mimetype = 'application/json' if fmt == 'json' else 'text/csv'
+    return Response(output, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=schedules.{fmt}'})
@@ -3,22 +3,21 @@ import sys
 from flask import Flask, session
 from flask_login import LoginManager
 from flask_mail import Mail
-from flask_bcrypt import Bcrypt
-from models import db, User
+from models import db
 from routes import main, auth, patient, doctor, admin
 from admin_routes import admin_panel
 from config import get_config
+from user_cache import load_user_with_profile
 import datetime
 import uuid
 
 # Initialize extensions
 login_manager = LoginManager()
 mail = Mail()
-bcrypt = Bcrypt()
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_user_with_profile(int(user_id))
 
 def create_app():
     """Create and configure the Flask application."""
@@ -37,7 +36,6 @@ def create_app():
     login_manager.login_view = 'auth.login'
     login_manager.login_message_category = 'info'
     mail.init_app(app)
-    bcrypt.init_app(app)
     
     # Register blueprints
     app.register_blueprint(main)
@@ -0,0 +1,104 @@
+"""
+Role checks for the Health Appointment System.
+
+The role of the logged-in user, their patient or doctor profile and whether
+they may use the admin panel are resolved once per request and kept on
+``flask.g``. The decorators below check the role and pass the profile to the
+view, so views no longer repeat the user_type check and profile lookup.
+
+Use them below ``@login_required``:
+
+    @patient.route('/dashboard')
+    @login_required
+    @patient_required
+    def dashboard(patient):
+        ...
+"""
+
+from collections import namedtuple
+from functools import wraps
+
+from flask import g, flash, redirect, url_for, current_app
+from flask_login import current_user
+from models import UserType
+
+# Doctors with this specialty may use the admin panel
+ADMIN_SPECIALTY = "Administration"
+
+Identity = namedtuple('Identity', ['role', 'profile', 'is_admin'])
+
+
+def is_admin(user):
+    """Check whether a user may use the admin panel."""
+    if user.user_type == UserType.ADMIN:
+        return True
+    return (
+        user.user_type == UserType.DOCTOR
+        and user.doctor is not None
+        and user.doctor.specialty == ADMIN_SPECIALTY
+    )
+
+
+def get_identity():
+    """
+    Get the role, profile and admin status of the logged-in user.
+
+    Resolved once per request; the profile comes with the user from the
+    user loader, so this normally issues no query.
+
+    Returns:
+        An Identity, or None for anonymous users
+    """
+    if 'identity' not in g:
+        if not current_user.is_authenticated:
+            g.identity = None
+        else:
+            role = current_user.user_type
+            if role == UserType.PATIENT:
+                profile = current_user.patient
+            elif role == UserType.DOCTOR:
+                profile = current_user.doctor
+            else:
+                profile = None
+            g.identity = Identity(role, profile, is_admin(current_user))
+    return g.identity
+
+
+def _role_required(role, profile_name, denied_message):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            identity = get_identity()
+            if identity is None:
+                return current_app.login_manager.unauthorized()
+            if identity.role != role:
+                flash(denied_message, 'danger')
+                return redirect(url_for('main.index'))
+            if identity.profile is None:
+                flash(f'{profile_name.capitalize()} profile not found.', 'danger')
+                return redirect(url_for('main.index'))
+            kwargs[profile_name] = identity.profile
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+patient_required = _role_required(UserType.PATIENT, 'patient', 'Access denied.')
+patient_required.__doc__ = "Allow only patients; the view receives their profile as `patient`."
+
+doctor_required = _role_required(UserType.DOCTOR, 'doctor', 'Access denied. Doctor privileges required.')
+doctor_required.__doc__ = "Allow only doctors; the view receives their profile as `doctor`."
+
+
+def admin_required(f):
+    """Allow only admins and doctors with admin privileges."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        identity = get_identity()
+        if identity is None:
+            return redirect(url_for('auth.login'))
+        if not identity.is_admin:
+            flash('Access denied. Admin privileges required.', 'danger')
+            return redirect(url_for('main.index'))
+        return f(*args, **kwargs)
+    return decorated_function
@@ -0,0 +1,567 @@
+"""
+Slot availability engine for the Health Appointment System.
+
+A doctor's working windows and booked appointments for a single day are
+represented as integer bitmasks with one bit per minute of the day (bit 0 is
+00:00, bit 1439 is 23:59). Checking whether a slot is free is then a single
+AND against the booked mask instead of a comparison against every appointment.
+
+A day's working windows are the weekly windows of its weekday combined with
+the doctor's exceptions for that date (closures, blocked periods and extra
+hours). Windows and exception periods are kept as sorted lists of (start, end)
+minute intervals, so combining them is a single linear merge.
+
+Weekly windows, per-day windows, per-day booked masks and each doctor's
+next free slot are cached per process for a short time (``SLOT_CACHE_TTL`` seconds) and invalidated
+explicitly by the routes that change availability, exceptions or bookings.
+"""
+
+import threading
+import time as _time
+from datetime import time, timedelta
+
+from flask import current_app
+from models import (
+    db, DoctorAvailability, AvailabilityException, AvailabilityExceptionType, Appointment, AppointmentStatus
+)
+
+DEFAULT_SLOT_MINUTES = 30
+
+# Longest date range served by a single range lookup
+MAX_RANGE_DAYS = 62
+
+# Upper bound on cached (doctor, date) entries before expired ones are purged
+MAX_CACHE_ENTRIES = 10000
+
+_lock = threading.Lock()
+_weekly_cache = {}  # doctor_id -> (expires_at, {day_of_week: [(start, end), ...]})
+_day_cache = {}  # (doctor_id, date) -> (expires_at, [(start, end), ...] after exceptions)
+_booked_cache = {}  # (doctor_id, date) -> (expires_at, booked_mask)
+_next_slot_cache = {}  # doctor_id -> (expires_at, (start_date, end_date, (date, start_time, end_time) or None))
+
+
+def to_minutes(t):
+    """Convert a time object to minutes since midnight."""
+    return t.hour * 60 + t.minute
+
+
+def from_minutes(minutes):
+    """Convert minutes since midnight back to a time object."""
+    return time(minutes // 60, minutes % 60)
+
+
+def interval_mask(start, end):
+    """
+    Build the bitmask covering the minutes in [start, end).
+
+    Args:
+        start: Start of the interval in minutes since midnight
+        end: End of the interval in minutes since midnight
+
+    Returns:
+        An integer with one bit set per minute of the interval
+    """
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+def build_mask(intervals):
+    """Combine (start, end) minute intervals into a single bitmask."""
+    mask = 0
+    for start, end in intervals:
+        mask |= interval_mask(start, end)
+    return mask
+
+
+def merge_intervals(intervals):
+    """Sort intervals and merge the ones that overlap or touch."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def union_intervals(a, b):
+    """
+    Union of two sorted lists of non-overlapping intervals, in one linear pass.
+
+    Returns:
+        A sorted list of non-overlapping intervals
+    """
+    result = []
+    i = j = 0
+    while i < len(a) or j < len(b):
+        if j == len(b) or (i < len(a) and a[i][0] <= b[j][0]):
+            start, end = a[i]
+            i += 1
+        else:
+            start, end = b[j]
+            j += 1
+        if result and start <= result[-1][1]:
+            if end > result[-1][1]:
+                result[-1] = (result[-1][0], end)
+        else:
+            result.append((start, end))
+    return result
+
+
+def subtract_intervals(a, b):
+    """
+    Remove the minutes covered by b from a, both sorted and non-overlapping, in one linear pass.
+
+    Returns:
+        A sorted list of non-overlapping intervals
+    """
+    result = []
+    j = 0
+    for start, end in a:
+        # Skip removals that end before this interval
+        while j < len(b) and b[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] < end:
+            if b[k][0] > start:
+                result.append((start, b[k][0]))
+            start = max(start, b[k][1])
+            k += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def apply_exceptions(windows, exceptions):
+    """
+    Apply a date's exceptions to the weekly windows of its weekday.
+
+    Args:
+        windows: Sorted list of (start, end) weekly windows in minutes
+        exceptions: List of (kind, start, end) tuples, start and end in
+            minutes (None for closures)
+
+    Returns:
+        The sorted (start, end) windows in which the doctor works on the date
+    """
+    if not exceptions:
+        return windows
+    extra = []
+    blocked = []
+    for kind, start, end in exceptions:
+        if kind == AvailabilityExceptionType.CLOSED:
+            return []
+        if kind == AvailabilityExceptionType.EXTRA:
+            extra.append((start, end))
+        else:
+            blocked.append((start, end))
+    return subtract_intervals(union_intervals(windows, merge_intervals(extra)), merge_intervals(blocked))
+
+
+def iter_free_slots(windows, booked_mask, slot_minutes=DEFAULT_SLOT_MINUTES):
+    """
+    Yield the free slots inside a day's availability windows.
+
+    Slots are laid out back to back from the start of each window; the last
+    slot of a window is shortened so it never runs past the window end. A slot
+    is free when none of its minutes are set in the booked mask.
+
+    Args:
+        windows: Sorted list of (start, end) availability windows in minutes
+        booked_mask: Bitmask of booked minutes for the day
+        slot_minutes: Length of each slot in minutes
+
+    Yields:
+        (start, end) tuples in minutes since midnight
+    """
+    for window_start, window_end in windows:
+        slot_start = window_start
+        while slot_start < window_end:
+            slot_end = min(slot_start + slot_minutes, window_end)
+            if not booked_mask & interval_mask(slot_start, slot_end):
+                yield slot_start, slot_end
+            slot_start = slot_end
+
+
+def _cache_ttl():
+    return current_app.config.get('SLOT_CACHE_TTL', 30)
+
+
+def _purge(cache, now):
+    """Drop expired entries, and everything if the cache is still too large."""
+    if len(cache) <= MAX_CACHE_ENTRIES:
+        return
+    for key in [key for key, (expires_at, _) in cache.items() if expires_at <= now]:
+        del cache[key]
+    if len(cache) > MAX_CACHE_ENTRIES:
+        cache.clear()
+
+
+def get_weekly_windows(doctor_id):
+    """
+    Get a doctor's recurring availability windows for every day of the week.
+
+    Args:
+        doctor_id: The ID of the doctor
+
+    Returns:
+        A dict mapping day_of_week (0=Monday) to a sorted list of
+        non-overlapping (start, end) windows in minutes since midnight
+    """
+    now = _time.monotonic()
+    with _lock:
+        cached = _weekly_cache.get(doctor_id)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    rows = db.session.query(
+        DoctorAvailability.day_of_week,
+        DoctorAvailability.start_time,
+        DoctorAvailability.end_time
+    ).filter(
+        DoctorAvailability.doctor_id == doctor_id,
+        DoctorAvailability.is_available == True
+    ).all()
+
+    weekly = {}
+    for day_of_week, start_time, end_time in rows:
+        weekly.setdefault(day_of_week, []).append((to_minutes(start_time), to_minutes(end_time)))
+    # Windows entered before edits were checked for overlaps may still overlap
+    weekly = {day: merge_intervals(windows) for day, windows in weekly.items()}
+
+    with _lock:
+        _purge(_weekly_cache, now)
+        _weekly_cache[doctor_id] = (now + _cache_ttl(), weekly)
+    return weekly
+
+
+def load_exceptions(doctor_ids, start_date, end_date):
+    """
+    Load the exceptions of several doctors over a date range with one query.
+
+    Args:
+        doctor_ids: IDs of the doctors, or None for every doctor
+        start_date: First date of the range (inclusive)
+        end_date: Last date of the range (inclusive)
+
+    Returns:
+        A dict mapping (doctor_id, date) to a list of (kind, start, end)
+        tuples in minutes, for the dates that have exceptions
+    """
+    rows = db.session.query(
+        AvailabilityException.doctor_id,
+        AvailabilityException.exception_date,
+        AvailabilityException.kind,
+        AvailabilityException.start_time,
+        AvailabilityException.end_time
+    ).filter(
+        AvailabilityException.exception_date >= start_date,
+        AvailabilityException.exception_date <= end_date
+    )
+    if doctor_ids is not None:
+        rows = rows.filter(AvailabilityException.doctor_id.in_(doctor_ids))
+
+    exceptions = {}
+    for doctor_id, exception_date, kind, start_time, end_time in rows.all():
+        exceptions.setdefault((doctor_id, exception_date), []).append((
+            kind,
+            to_minutes(start_time) if start_time else None,
+            to_minutes(end_time) if end_time else None
+        ))
+    return exceptions
+
+
+def get_day_windows_range(doctor_id, start_date, end_date):
+    """
+    Get a doctor's working windows for every date in a range, exceptions applied.
+
+    Returns:
+        A dict mapping each date to a sorted list of (start, end) windows in minutes
+    """
+    dates = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    now = _time.monotonic()
+    result = {}
+    with _lock:
+        for d in dates:
+            cached = _day_cache.get((doctor_id, d))
+            if cached and cached[0] > now:
+                result[d] = cached[1]
+    missing = [d for d in dates if d not in result]
+    if not missing:
+        return result
+
+    weekly = get_weekly_windows(doctor_id)
+    exceptions = load_exceptions([doctor_id], missing[0], missing[-1])
+    computed = {
+        d: apply_exceptions(weekly.get(d.weekday(), []), exceptions.get((doctor_id, d)))
+        for d in missing
+    }
+
+    expires_at = now + _cache_ttl()
+    with _lock:
+        _purge(_day_cache, now)
+        for d, windows in computed.items():
+            _day_cache[(doctor_id, d)] = (expires_at, windows)
+    result.update(computed)
+    return result
+
+
+def get_day_windows(doctor_id, date):
+    """Get a doctor's working windows on one date, exceptions applied."""
+    return get_day_windows_range(doctor_id, date, date)[date]
+
+
+def get_booked_mask(doctor_id, date):
+    """
+    Get the bitmask of minutes taken by non-cancelled appointments on a date.
+
+    Args:
+        doctor_id: The ID of the doctor
+        date: The date to check
+
+    Returns:
+        An integer bitmask of booked minutes
+    """
+    key = (doctor_id, date)
+    now = _time.monotonic()
+    with _lock:
+        cached = _booked_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    rows = db.session.query(Appointment.start_time, Appointment.end_time).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.appointment_date == date,
+        Appointment.status != AppointmentStatus.CANCELLED
+    ).all()
+    mask = build_mask((to_minutes(start), to_minutes(end)) for start, end in rows)
+
+    with _lock:
+        _purge(_booked_cache, now)
+        _booked_cache[key] = (now + _cache_ttl(), mask)
+    return mask
+
+
+def get_free_slots(doctor_id, date, slot_minutes=DEFAULT_SLOT_MINUTES):
+    """
+    Get the free appointment slots for a doctor on a specific date.
+
+    Args:
+        doctor_id: The ID of the doctor
+        date: The date to check for availability
+        slot_minutes: Length of each slot in minutes
+
+    Returns:
+        A sorted list of (start_time, end_time) tuples of time objects
+    """
+    windows = get_day_windows(doctor_id, date)
+    if not windows:
+        return []
+
+    booked_mask = get_booked_mask(doctor_id, date)
+    return [
+        (from_minutes(start), from_minutes(end))
+        for start, end in iter_free_slots(windows, booked_mask, slot_minutes)
+    ]
+
+
+def get_free_slots_range(doctor_id, start_date, end_date, slot_minutes=DEFAULT_SLOT_MINUTES):
+    """
+    Get the free appointment slots for a doctor over a range of dates.
+
+    Uses the cached day windows and a single range query over appointments,
+    whose per-day masks are stored in the cache for later single-day lookups.
+
+    Args:
+        doctor_id: The ID of the doctor
+        start_date: First date of the range (inclusive)
+        end_date: Last date of the range (inclusive)
+        slot_minutes: Length of each slot in minutes
+
+    Returns:
+        A dict mapping each date in the range to a sorted list of
+        (start_time, end_time) tuples; fully booked or closed days map to []
+    """
+    windows_by_date = get_day_windows_range(doctor_id, start_date, end_date)
+    dates = sorted(windows_by_date)
+    if not any(windows_by_date.values()):
+        return {d: [] for d in dates}
+
+    rows = db.session.query(
+        Appointment.appointment_date,
+        Appointment.start_time,
+        Appointment.end_time
+    ).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.appointment_date >= start_date,
+        Appointment.appointment_date <= end_date,
+        Appointment.status != AppointmentStatus.CANCELLED
+    ).all()
+
+    masks = dict.fromkeys(dates, 0)
+    for appointment_date, start, end in rows:
+        masks[appointment_date] |= interval_mask(to_minutes(start), to_minutes(end))
+
+    now = _time.monotonic()
+    expires_at = now + _cache_ttl()
+    with _lock:
+        _purge(_booked_cache, now)
+        for d, mask in masks.items():
+            _booked_cache[(doctor_id, d)] = (expires_at, mask)
+
+    return {
+        d: [
+            (from_minutes(start), from_minutes(end))
+            for start, end in iter_free_slots(windows_by_date[d], masks[d], slot_minutes)
+        ]
+        for d in dates
+    }
+
+
+def get_next_available_slots(doctor_ids, start_date, end_date, not_before=None,
+                             slot_minutes=DEFAULT_SLOT_MINUTES):
+    """
+    Find the earliest free slot of several doctors within a date range.
+
+    Loads the availability windows, the exceptions and the non-cancelled
+    appointments of all the doctors with one query each, however many doctors
+    are passed.
+
+    Args:
+        doctor_ids: IDs of the doctors to check
+        start_date: First date of the range (inclusive)
+        end_date: Last date of the range (inclusive)
+        not_before: Optional datetime; slots starting before it are skipped
+        slot_minutes: Length of each slot in minutes
+
+    Returns:
+        A dict mapping each doctor ID to a (date, start_time, end_time) tuple,
+        or to None when the doctor has no free slot in the range
+    """
+    doctor_ids = list(set(doctor_ids))
+    if not doctor_ids:
+        return {}
+
+    weekly_by_doctor = {doctor_id: {} for doctor_id in doctor_ids}
+    rows = db.session.query(
+        DoctorAvailability.doctor_id,
+        DoctorAvailability.day_of_week,
+        DoctorAvailability.start_time,
+        DoctorAvailability.end_time
+    ).filter(
+        DoctorAvailability.doctor_id.in_(doctor_ids),
+        DoctorAvailability.is_available == True
+    ).all()
+    for doctor_id, day_of_week, start_time, end_time in rows:
+        weekly_by_doctor[doctor_id].setdefault(day_of_week, []).append(
+            (to_minutes(start_time), to_minutes(end_time))
+        )
+    for weekly in weekly_by_doctor.values():
+        for day_of_week, windows in weekly.items():
+            weekly[day_of_week] = merge_intervals(windows)
+
+    booked = {}
+    rows = db.session.query(
+        Appointment.doctor_id,
+        Appointment.appointment_date,
+        Appointment.start_time,
+        Appointment.end_time
+    ).filter(
+        Appointment.doctor_id.in_(doctor_ids),
+        Appointment.appointment_date >= start_date,
+        Appointment.appointment_date <= end_date,
+        Appointment.status != AppointmentStatus.CANCELLED
+    ).all()
+    for doctor_id, appointment_date, start, end in rows:
+        key = (doctor_id, appointment_date)
+        booked[key] = booked.get(key, 0) | interval_mask(to_minutes(start), to_minutes(end))
+
+    now = _time.monotonic()
+    with _lock:
+        _purge(_weekly_cache, now)
+        for doctor_id, weekly in weekly_by_doctor.items():
+            _weekly_cache[doctor_id] = (now + _cache_ttl(), weekly)
+
+    exceptions = load_exceptions(doctor_ids, start_date, end_date)
+
+    dates = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    result = {}
+    for doctor_id, weekly in weekly_by_doctor.items():
+        result[doctor_id] = None
+        for d in dates:
+            windows = apply_exceptions(weekly.get(d.weekday(), []), exceptions.get((doctor_id, d)))
+            if not windows:
+                continue
+            earliest = 0
+            if not_before is not None and d == not_before.date():
+                earliest = to_minutes(not_before.time())
+            elif not_before is not None and d < not_before.date():
+                continue
+            slot = next(
+                (slot for slot in iter_free_slots(windows, booked.get((doctor_id, d), 0), slot_minutes)
+                 if slot[0] >= earliest),
+                None
+            )
+            if slot:
+                result[doctor_id] = (d, from_minutes(slot[0]), from_minutes(slot[1]))
+                break
+    return result
+
+
+def get_cached_next_available_slots(doctor_ids, start_date, end_date, not_before=None):
+    """
+    Like get_next_available_slots with the default slot length, but cached per doctor.
+
+    A cached next slot stays valid until it starts before not_before, the
+    date range changes, or the doctor's availability, exceptions or bookings
+    are invalidated; only the doctors without a valid entry are computed.
+
+    Returns:
+        A dict mapping each doctor ID to a (date, start_time, end_time) tuple, or to None
+    """
+    now = _time.monotonic()
+    result = {}
+    missing = []
+    with _lock:
+        for doctor_id in set(doctor_ids):
+            cached = _next_slot_cache.get(doctor_id)
+            if cached and cached[0] > now and cached[1][:2] == (start_date, end_date):
+                slot = cached[1][2]
+                if slot is None or not_before is None or (slot[0], slot[1]) >= (not_before.date(), not_before.time()):
+                    result[doctor_id] = slot
+                    continue
+            missing.append(doctor_id)
+
+    if missing:
+        computed = get_next_available_slots(missing, start_date, end_date, not_before=not_before)
+        with _lock:
+            _purge(_next_slot_cache, now)
+            for doctor_id, slot in computed.items():
+                _next_slot_cache[doctor_id] = (now + _cache_ttl(), (start_date, end_date, slot))
+        result.update(computed)
+    return result
+
+
+def invalidate_availability(doctor_id):
+    """Forget a doctor's cached weekly and day windows after availability edits."""
+    with _lock:
+        _weekly_cache.pop(doctor_id, None)
+        _next_slot_cache.pop(doctor_id, None)
+        for key in [key for key in _day_cache if key[0] == doctor_id]:
+            del _day_cache[key]
+
+
+def invalidate_exceptions(doctor_id, date):
+    """Forget a doctor's cached windows on one date after its exceptions change."""
+    with _lock:
+        _day_cache.pop((doctor_id, date), None)
+        _next_slot_cache.pop(doctor_id, None)
+
+
+def invalidate_bookings(doctor_id, date):
+    """Forget the cached bookings of a doctor on one date."""
+    with _lock:
+        _booked_cache.pop((doctor_id, date), None)
+        _next_slot_cache.pop(doctor_id, None)
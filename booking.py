@@ -0,0 +1,293 @@
+"""
+Appointment booking for the Health Appointment System.
+
+Two patients can pick the same free slot at the same moment, so the check
+that a slot is free is not what prevents double bookings. The database does:
+``uq_appointments_active_slot`` is a unique index on (doctor, date, start
+time) over appointments that are not cancelled, so of any number of
+concurrent inserts for one slot exactly one commits and the others fail with
+an IntegrityError, which ``book_slot`` reports as ``SlotUnavailable``.
+
+While a patient fills in the booking form the slot they selected is held for
+them for ``APPOINTMENT_HOLD_SECONDS`` (one ``appointment_holds`` row per
+slot, also unique), and is hidden from other patients' slot lists. Holds
+are advisory: an expired hold is simply replaced, and a booking by the
+holder releases it. Holds nobody comes back for are purged by the slot
+calendar refresher, and go with their doctor or patient when deleted. A patient cannot book two appointments that overlap in
+time, with the same doctor or not.
+
+Transient failures of a transaction (SQLite "database is locked", PostgreSQL
+serialization failures and deadlocks) are retried up to
+``BOOKING_MAX_RETRIES`` times with a short randomised backoff.
+"""
+
+import random
+import time as _time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models import db, Appointment, AppointmentHold, AppointmentStatus
+from availability import get_free_slots, invalidate_bookings
+from slot_calendar import sync_bookings
+from intervals import IntervalSet
+from push import publish_unread_count
+from utils import add_notification
+
+# First retry delay in seconds after a transient conflict; doubles per retry
+RETRY_BASE_DELAY = 0.02
+
+
+class SlotUnavailable(Exception):
+    """The slot is booked, held by another patient, or not offered."""
+
+
+def _config(key, default):
+    return current_app.config.get(key, default)
+
+
+def _with_retries(operation):
+    """Run a transaction, retrying it when the database reports a transient conflict."""
+    max_retries = _config('BOOKING_MAX_RETRIES', 5)
+    for attempt in range(max_retries + 1):
+        try:
+            return operation()
+        except OperationalError:
+            db.session.rollback()
+            if attempt == max_retries:
+                raise
+            _time.sleep(RETRY_BASE_DELAY * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def patient_appointments(patient_id, start_date, end_date):
+    """
+    Get the times a patient already has appointments, with any doctor.
+
+    Returns:
+        A dict mapping each date with appointments to an IntervalSet of
+        (start_time, end_time)
+    """
+    rows = db.session.execute(
+        select(Appointment.appointment_date, Appointment.start_time, Appointment.end_time).where(
+            Appointment.patient_id == patient_id,
+            Appointment.appointment_date >= start_date,
+            Appointment.appointment_date <= end_date,
+            Appointment.status != AppointmentStatus.CANCELLED
+        )
+    )
+    busy = {}
+    for date, start_time, end_time in rows:
+        busy.setdefault(date, IntervalSet()).add(start_time, end_time)
+    return busy
+
+
+def check_bookable(doctor_id, date, start_time, end_time, patient_id=None):
+    """
+    Check that a slot is offered by the doctor, in the booking window and not booked.
+
+    Args:
+        patient_id: Also check that this patient has no other appointment at that time
+
+    Raises:
+        SlotUnavailable: If the slot cannot be booked
+    """
+    now = datetime.now()
+    last_date = now.date() + timedelta(days=_config('BOOKING_DAYS_AHEAD', 30))
+    if date < now.date() or date > last_date:
+        raise SlotUnavailable('Appointments can only be booked for the next '
+                              f"{_config('BOOKING_DAYS_AHEAD', 30)} days.")
+    if date == now.date() and start_time <= now.time():
+        raise SlotUnavailable('This time slot has already passed.')
+
+    if patient_id is not None:
+        own = patient_appointments(patient_id, date, date).get(date)
+        if own and own.overlaps(start_time, end_time):
+            raise SlotUnavailable('You already have an appointment at this time.')
+
+    # Read the bookings of the day fresh rather than from the slot cache
+    invalidate_bookings(doctor_id, date)
+    if (start_time, end_time) not in get_free_slots(doctor_id, date):
+        raise SlotUnavailable('This time slot is no longer available.')
+
+
+def unavailable_intervals(doctor_id, start_date, end_date, patient_id=None):
+    """
+    Get the times to leave out of a doctor's slot list for a patient.
+
+    These are the slots other patients hold, and the times the patient
+    already has appointments with any doctor.
+
+    Args:
+        doctor_id: The ID of the doctor
+        start_date: First date to check
+        end_date: Last date to check, inclusive
+        patient_id: The patient viewing the slots, if any
+
+    Returns:
+        A dict mapping dates to an IntervalSet of (start_time, end_time)
+    """
+    query = select(
+        AppointmentHold.appointment_date, AppointmentHold.start_time, AppointmentHold.end_time
+    ).where(
+        AppointmentHold.doctor_id == doctor_id,
+        AppointmentHold.appointment_date >= start_date,
+        AppointmentHold.appointment_date <= end_date,
+        AppointmentHold.expires_at > datetime.utcnow()
+    )
+    busy = {}
+    if patient_id is not None:
+        query = query.where(AppointmentHold.patient_id != patient_id)
+        busy = patient_appointments(patient_id, start_date, end_date)
+    for date, start_time, end_time in db.session.execute(query):
+        busy.setdefault(date, IntervalSet()).add(start_time, end_time)
+    return busy
+
+
+def _slot_filter(doctor_id, date, start_time):
+    return (
+        AppointmentHold.doctor_id == doctor_id,
+        AppointmentHold.appointment_date == date,
+        AppointmentHold.start_time == start_time,
+    )
+
+
+def hold_slot(patient, doctor_id, date, start_time, end_time):
+    """
+    Hold a slot for a patient while they confirm the booking.
+
+    Any other hold of the patient is released; holding the same slot again
+    extends the hold.
+
+    Args:
+        patient: The Patient holding the slot
+        doctor_id: The ID of the doctor
+        date: Date of the slot
+        start_time: Start of the slot
+        end_time: End of the slot
+
+    Returns:
+        The committed AppointmentHold
+
+    Raises:
+        SlotUnavailable: If the slot is booked or held by another patient
+    """
+    check_bookable(doctor_id, date, start_time, end_time, patient.id)
+
+    def attempt():
+        now = datetime.utcnow()
+        db.session.execute(
+            delete(AppointmentHold).where(
+                *_slot_filter(doctor_id, date, start_time),
+                AppointmentHold.expires_at <= now
+            ).execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            delete(AppointmentHold).where(
+                AppointmentHold.patient_id == patient.id
+            ).execution_options(synchronize_session=False)
+        )
+        hold = AppointmentHold(
+            doctor_id=doctor_id,
+            patient_id=patient.id,
+            appointment_date=date,
+            start_time=start_time,
+            end_time=end_time,
+            expires_at=now + timedelta(seconds=_config('APPOINTMENT_HOLD_SECONDS', 300))
+        )
+        db.session.add(hold)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise SlotUnavailable('Another patient is booking this time slot.')
+        return hold
+
+    return _with_retries(attempt)
+
+
+def release_holds(patient_id):
+    """Release every hold of a patient, e.g. when they leave the booking page."""
+    db.session.execute(
+        delete(AppointmentHold).where(
+            AppointmentHold.patient_id == patient_id
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def book_slot(patient, doctor, date, start_time, end_time, reason, notes=None):
+    """
+    Book a slot for a patient, at most once per slot whatever the concurrency.
+
+    The doctor and the patient are notified. The patient's hold, if any, is
+    released.
+
+    Args:
+        patient: The Patient booking the appointment
+        doctor: The Doctor to see
+        date: Date of the appointment
+        start_time: Start of the slot
+        end_time: End of the slot
+        reason: Reason for the visit
+        notes: Optional notes from the patient
+
+    Returns:
+        The committed Appointment
+
+    Raises:
+        SlotUnavailable: If the slot is booked, held by another patient or not offered
+    """
+    def attempt():
+        hold_owner = db.session.execute(
+            select(AppointmentHold.patient_id).where(
+                *_slot_filter(doctor.id, date, start_time),
+                AppointmentHold.expires_at > datetime.utcnow()
+            )
+        ).scalar()
+        if hold_owner is not None and hold_owner != patient.id:
+            raise SlotUnavailable('Another patient is booking this time slot.')
+        check_bookable(doctor.id, date, start_time, end_time, patient.id)
+
+        appointment = Appointment(
+            patient_id=patient.id,
+            doctor_id=doctor.id,
+            appointment_date=date,
+            start_time=start_time,
+            end_time=end_time,
+            status=AppointmentStatus.PENDING,
+            reason=reason,
+            notes=notes
+        )
+        db.session.add(appointment)
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # Someone else's booking of the slot committed first
+            db.session.rollback()
+            invalidate_bookings(doctor.id, date)
+            raise SlotUnavailable('This time slot is no longer available.')
+
+        db.session.execute(
+            delete(AppointmentHold).where(
+                AppointmentHold.patient_id == patient.id
+            ).execution_options(synchronize_session=False)
+        )
+        sync_bookings(doctor.id, date)
+        when = f"{date.strftime('%d/%m/%Y')} at {start_time.strftime('%H:%M')}"
+        add_notification(
+            patient.user_id, "Appointment Booked",
+            f"Your appointment with Dr. {doctor.user.last_name} on {when} has been booked."
+        )
+        add_notification(
+            doctor.user_id, "New Appointment",
+            f"{patient.user.first_name} {patient.user.last_name} booked an appointment on {when}."
+        )
+        db.session.commit()
+        return appointment
+
+    appointment = _with_retries(attempt)
+    invalidate_bookings(doctor.id, date)
+    publish_unread_count(patient.user_id)
+    publish_unread_count(doctor.user_id)
+    return appointment
@@ -0,0 +1,108 @@
+"""
+Fire many simultaneous bookings at one slot and check that exactly one wins.
+
+Runs against a scratch database so no real data is touched: a temporary
+SQLite file by default, or the (empty) database given as second argument,
+e.g. a PostgreSQL scratch database.
+
+Usage:
+    python check_booking_concurrency.py [threads] [database_url]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, time, timedelta
+
+THREADS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+if len(sys.argv) > 2:
+    os.environ['DATABASE_URL'] = sys.argv[2]
+else:
+    scratch = os.path.join(tempfile.mkdtemp(), 'booking_check.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{scratch}'
+
+from app import create_app, db
+from models import User, Patient, Doctor, DoctorAvailability, Appointment, AppointmentStatus, UserType
+from booking import book_slot, SlotUnavailable
+
+def seed(patients):
+    """Create one doctor available every day from 09:00 to 17:00 and the given number of patients."""
+    db.create_all()
+    doctor_user = User(email='doctor@example.com', phone='+10000000000', password_hash='x',
+                       first_name='Test', last_name='Doctor', user_type=UserType.DOCTOR, is_active=True)
+    doctor = Doctor(user=doctor_user, specialty='General Practice', license_number='CHECK-1')
+    db.session.add(doctor)
+    for day in range(7):
+        db.session.add(DoctorAvailability(doctor=doctor, day_of_week=day,
+                                          start_time=time(9, 0), end_time=time(17, 0)))
+
+    for number in range(patients):
+        user = User(email=f'patient{number}@example.com', phone=f'+2{number:09d}', password_hash='x',
+                    first_name='Test', last_name=f'Patient{number}', user_type=UserType.PATIENT, is_active=True)
+        db.session.add(Patient(user=user))
+    db.session.commit()
+
+    patient_ids = [patient_id for (patient_id,) in db.session.query(Patient.id).order_by(Patient.id)]
+    return doctor.id, patient_ids
+
+def check_booking_concurrency():
+    """Check that concurrent bookings of one slot produce exactly one appointment"""
+    app = create_app()
+    with app.app_context():
+        print(f'Database: {db.engine.url.render_as_string(hide_password=True)}')
+        doctor_id, patient_ids = seed(THREADS)
+
+    slot_date = datetime.now().date() + timedelta(days=1)
+    start_time, end_time = time(9, 0), time(9, 30)
+    barrier = threading.Barrier(THREADS)
+    outcomes = {'booked': 0, 'unavailable': 0, 'error': 0}
+    errors = []
+    lock = threading.Lock()
+
+    def attempt(patient_id):
+        with app.app_context():
+            barrier.wait()
+            try:
+                book_slot(db.session.get(Patient, patient_id), db.session.get(Doctor, doctor_id),
+                          slot_date, start_time, end_time, 'Concurrency check')
+                outcome = 'booked'
+            except SlotUnavailable:
+                outcome = 'unavailable'
+            except Exception as e:
+                outcome = 'error'
+                with lock:
+                    errors.append(repr(e))
+            finally:
+                db.session.remove()
+            with lock:
+                outcomes[outcome] += 1
+
+    print(f'Booking {slot_date} {start_time.strftime("%H:%M")} from {THREADS} threads at once...')
+    threads = [threading.Thread(target=attempt, args=(patient_id,)) for patient_id in patient_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        stored = Appointment.query.filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.appointment_date == slot_date,
+            Appointment.start_time == start_time,
+            Appointment.status != AppointmentStatus.CANCELLED
+        ).count()
+
+    print(f"Booked: {outcomes['booked']}, rejected: {outcomes['unavailable']}, errors: {outcomes['error']}")
+    print(f'Appointments stored for the slot: {stored}')
+    for error in errors[:5]:
+        print(f'  {error}')
+
+    assert outcomes['booked'] == 1, f"{outcomes['booked']} bookings succeeded"
+    assert stored == 1, f'{stored} appointments stored'
+    assert outcomes['error'] == 0, f"{outcomes['error']} bookings failed with errors"
+    print('OK: exactly one booking won')
+
+if __name__ == '__main__':
+    check_booking_concurrency()
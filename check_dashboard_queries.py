@@ -0,0 +1,74 @@
+from app import create_app, db
+from models import Patient, Doctor, Appointment
+from sqlalchemy import event, func
+
+# Highest number of SQL statements a dashboard render may issue, whatever
+# the number of appointments shown
+MAX_QUERIES = {
+    '/patient/dashboard': 8,
+    '/patient/appointments': 8,
+    '/doctor/dashboard': 8,
+    '/doctor/appointments': 8,
+}
+
+def count_queries(app, client, user_id, url):
+    """Render a page as the given user and return the number of SQL statements issued."""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    
+    assert response.status_code == 200, f'{url} returned {response.status_code}'
+    return len(statements)
+
+def check_dashboard_queries():
+    """Check that dashboard renders issue a bounded number of queries"""
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        # Use the patient and doctor with the most appointments
+        patient = db.session.query(Patient).join(Appointment).group_by(Patient.id).order_by(
+            func.count(Appointment.id).desc()
+        ).first()
+        doctor = db.session.query(Doctor).join(Appointment).group_by(Doctor.id).order_by(
+            func.count(Appointment.id).desc()
+        ).first()
+        if not patient or not doctor:
+            print('No appointments found; seed the database first.')
+            return
+        
+        users = {
+            '/patient/dashboard': (patient.user_id, len(patient.appointments)),
+            '/patient/appointments': (patient.user_id, len(patient.appointments)),
+            '/doctor/dashboard': (doctor.user_id, len(doctor.appointments)),
+            '/doctor/appointments': (doctor.user_id, len(doctor.appointments)),
+        }
+    
+    # Each request runs in its own app context so no session state is shared
+    print('Dashboard Query Counts')
+    print('-' * 50)
+    failures = []
+    client = app.test_client()
+    for url, limit in MAX_QUERIES.items():
+        user_id, appointment_count = users[url]
+        count = count_queries(app, client, user_id, url)
+        status = 'OK' if count <= limit else 'TOO MANY'
+        print(f'{url:<25} {appointment_count:>4} appointments {count:>3} queries (max {limit}) {status}')
+        if count > limit:
+            failures.append(url)
+    
+    assert not failures, f'Query count regression on: {", ".join(failures)}'
+
+if __name__ == "__main__":
+    check_dashboard_queries()
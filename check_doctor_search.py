@@ -1,6 +1,7 @@
 from app import create_app, db
-from models import Doctor
+from models import Doctor, Specialty
 from sqlalchemy import or_
+from search import filter_by_specialty, filter_by_language
 
 def check_doctor_search():
     """Check the doctor search functionality"""
@@ -11,7 +12,7 @@ def check_doctor_search():
         
         # Search by specialty
         print('\nSearch by Specialty: Cardiology')
-        doctors = Doctor.query.filter_by(specialty='Cardiology').all()
+        doctors = filter_by_specialty(Doctor.query, 'Cardiology').all()
         for doctor in doctors:
             print(f'Name: {doctor.user.first_name} {doctor.user.last_name}')
             print(f'Specialty: {doctor.specialty}')
@@ -33,7 +34,7 @@ def check_doctor_search():
         
         # Search by language
         print('\nSearch by Language: French')
-        doctors = Doctor.query.filter(Doctor.languages.like('%French%')).all()
+        doctors = filter_by_language(Doctor.query, 'French').all()
         for doctor in doctors:
             print(f'Name: {doctor.user.first_name} {doctor.user.last_name}')
             print(f'Specialty: {doctor.specialty}')
@@ -44,9 +45,9 @@ def check_doctor_search():
         
         # Combined search
         print('\nCombined Search: Specialty=Neurology OR Location=Oran')
-        doctors = Doctor.query.filter(
+        doctors = Doctor.query.outerjoin(Specialty, Doctor.specialty_id == Specialty.id).filter(
             or_(
-                Doctor.specialty == 'Neurology',
+                Specialty.normalized_name == 'neurology',
                 Doctor.location == 'Oran'
             )
         ).all()
@@ -0,0 +1,70 @@
+"""
+Check IntervalSet against a brute-force model of the minutes it covers.
+
+Needs no database. Random intervals are added to an IntervalSet and to a
+plain set of covered minutes; after every addition the intervals must be
+sorted, disjoint and not touching (touching ones are merged, which the
+availability overlap checks rely on), and overlaps() must agree with the
+model for random queries.
+
+Usage:
+    python check_intervals.py [rounds]
+"""
+
+import random
+import sys
+
+from intervals import IntervalSet
+
+ROUNDS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+def check_examples():
+    """Check the cases the availability pages depend on"""
+    windows = IntervalSet([(540, 720)])  # 09:00-12:00
+    assert windows.overlaps(600, 660), 'inside'
+    assert windows.overlaps(480, 600), 'across the start'
+    assert not windows.overlaps(720, 780), 'touching the end is not an overlap'
+    assert not windows.overlaps(480, 540), 'touching the start is not an overlap'
+
+    windows.add(720, 840)  # 12:00-14:00 touches 09:00-12:00
+    assert list(windows) == [(540, 840)], f'touching intervals not merged: {windows}'
+    windows.add(900, 960)
+    windows.add(600, 930)  # bridges both
+    assert list(windows) == [(540, 960)], f'bridging interval not merged: {windows}'
+    windows.add(1000, 1000)
+    assert len(windows) == 1, 'empty interval added'
+    assert not IntervalSet(), 'empty set is truthy'
+
+def check_random():
+    """Compare random sets with a set of covered minutes"""
+    rng = random.Random(1)
+    for _ in range(ROUNDS):
+        intervals = IntervalSet()
+        minutes = set()
+        for _ in range(rng.randint(1, 12)):
+            start = rng.randrange(0, 1440)
+            end = start + rng.randint(1, 180)
+            intervals.add(start, end)
+            minutes.update(range(start, end))
+
+            pairs = list(intervals)
+            assert all(s < e for s, e in pairs), f'empty interval in {pairs}'
+            assert all(pairs[k][1] < pairs[k + 1][0] for k in range(len(pairs) - 1)), \
+                f'intervals not sorted, disjoint and apart: {pairs}'
+            assert {m for s, e in pairs for m in range(s, e)} == minutes, f'coverage differs: {pairs}'
+
+            for _ in range(5):
+                q_start = rng.randrange(0, 1600)
+                q_end = q_start + rng.randint(1, 120)
+                expected = any(m in minutes for m in range(q_start, q_end))
+                assert intervals.overlaps(q_start, q_end) == expected, \
+                    f'overlaps({q_start}, {q_end}) wrong for {pairs}'
+
+def check_intervals():
+    """Run all IntervalSet checks"""
+    check_examples()
+    check_random()
+    print(f'OK: IntervalSet agrees with the brute-force model over {ROUNDS} rounds')
+
+if __name__ == '__main__':
+    check_intervals()
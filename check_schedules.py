@@ -0,0 +1,139 @@
+"""
+Check the bulk schedule import: parsing, the overlap sweep and the all-or-nothing write.
+
+Runs against a scratch database so no real data is touched: a temporary
+SQLite file by default, or the (empty) database given as argument.
+
+Usage:
+    python check_schedules.py [database_url]
+"""
+
+import os
+import random
+import sys
+import tempfile
+from datetime import time
+
+if len(sys.argv) > 1:
+    os.environ['DATABASE_URL'] = sys.argv[1]
+else:
+    scratch = os.path.join(tempfile.mkdtemp(), 'schedules_check.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{scratch}'
+
+from app import create_app, db
+from models import User, Doctor, DoctorAvailability, UserType
+from schedules import parse_schedule, find_overlaps, import_schedules, export_schedules
+
+HEADER = 'license_number,doctor_id,day,start_time,end_time\n'
+
+def seed():
+    """Create two doctors, the first with a Monday morning window"""
+    db.create_all()
+    doctors = []
+    for number in (1, 2):
+        user = User(email=f'doctor{number}@example.com', phone=f'+1000000000{number}', password_hash='x',
+                    first_name='Test', last_name=f'Doctor{number}', user_type=UserType.DOCTOR, is_active=True)
+        doctors.append(Doctor(user=user, specialty='General Practice', license_number=f'CHECK-{number}'))
+    db.session.add_all(doctors)
+    db.session.add(DoctorAvailability(doctor=doctors[0], day_of_week=0, start_time=time(9, 0), end_time=time(12, 0)))
+    db.session.commit()
+    return [doctor.id for doctor in doctors]
+
+def windows_of(doctor_id):
+    return sorted(
+        (a.day_of_week, a.start_time, a.end_time)
+        for a in DoctorAvailability.query.filter_by(doctor_id=doctor_id)
+    )
+
+def check_parsing():
+    """Check that every bad line is reported and good lines parse"""
+    windows, errors = parse_schedule(
+        HEADER +
+        'CHECK-1,,Monday,09:00,12:00\n'
+        ',,Mon,09:00,10:00\n'
+        'CHECK-1,,Funday,09:00,10:00\n'
+        'CHECK-1,,Tue,11:00,10:00\n'
+        'CHECK-1,,Wed,9am,10:00\n'
+        ',,,,\n'
+    )
+    assert len(windows) == 1 and windows[0].day == 0, windows
+    assert [error.split(':')[0] for error in errors] == ['Line 3', 'Line 4', 'Line 5', 'Line 6'], errors
+
+    windows, errors = parse_schedule(
+        '[1, "x", {"license_number": "CHECK-1", "day": 2, "start_time": "09:00", "end_time": "10:00"}]', 'json'
+    )
+    assert len(windows) == 1, windows
+    assert errors == ['Line 1: expected an object', 'Line 2: expected an object'], errors
+
+def check_sweep():
+    """Compare find_overlaps with checking every pair"""
+    rng = random.Random(1)
+    for _ in range(500):
+        windows = []
+        for label in range(rng.randint(1, 15)):
+            start = rng.randrange(0, 20)
+            windows.append((rng.randint(1, 2), rng.randint(0, 1), start, start + rng.randint(1, 5), label))
+        pairs = {frozenset((a[4], b[4])) for a, b in
+                 ((a, b) for a in windows for b in windows if a[4] < b[4])
+                 if a[:2] == b[:2] and a[2] < b[3] and b[2] < a[3]}
+        found = {frozenset(pair) for pair in find_overlaps(windows)}
+        # The sweep reports each overlapping window once, against the window reaching furthest
+        assert found <= pairs, (windows, found - pairs)
+        assert bool(found) == bool(pairs), (windows, pairs)
+        flagged = {label for pair in found for label in pair}
+        overlapping = {label for pair in pairs for label in pair}
+        assert flagged <= overlapping, windows
+
+def check_import(doctor_ids):
+    """Check that a schedule with any problem writes nothing, and a valid one replaces or adds"""
+    first, second = doctor_ids
+    before = windows_of(first), windows_of(second)
+
+    windows, errors = parse_schedule(
+        HEADER +
+        f',{second},Tuesday,09:00,12:00\n'
+        'CHECK-1,,Monday,13:00,15:00\n'
+        'CHECK-1,,Monday,14:00,16:00\n'
+    )
+    assert not errors, errors
+    result = import_schedules(windows)
+    assert result.errors == ['Overlapping windows: line 3 and line 4'], result.errors
+    assert (windows_of(first), windows_of(second)) == before, 'a rejected import wrote windows'
+
+    windows, _ = parse_schedule(HEADER + 'CHECK-1,,Monday,11:00,13:00\n')
+    result = import_schedules(windows, replace=False)
+    assert len(result.errors) == 1 and 'existing Monday 09:00-12:00' in result.errors[0], result.errors
+
+    windows, _ = parse_schedule(HEADER + 'CHECK-1,,Monday,12:00,13:00\n')
+    assert not import_schedules(windows, replace=False).errors
+    assert windows_of(first) == [(0, time(9, 0), time(12, 0)), (0, time(12, 0), time(13, 0))], windows_of(first)
+
+    windows, _ = parse_schedule(HEADER + 'CHECK-1,,Friday,08:00,10:00\n' + f',{second},Sat,10:00,11:00\n')
+    result = import_schedules(windows, dry_run=True)
+    assert not result.errors and result.windows == 2
+    assert windows_of(first)[0][0] == 0, 'a dry run wrote windows'
+    import_schedules(windows)
+    assert windows_of(first) == [(4, time(8, 0), time(10, 0))], windows_of(first)
+    assert windows_of(second) == [(5, time(10, 0), time(11, 0))], windows_of(second)
+
+    windows, _ = parse_schedule(HEADER + f'CHECK-1,{second},Monday,09:00,10:00\n' + ',999,Monday,09:00,10:00\n')
+    assert len(import_schedules(windows).errors) == 2
+
+    for fmt in ('csv', 'json'):
+        exported = export_schedules(None, fmt)
+        windows, errors = parse_schedule(exported, fmt)
+        assert not errors and not import_schedules(windows).errors
+        assert export_schedules(None, fmt) == exported, f'{fmt} export does not round-trip'
+
+def check_schedules():
+    """Run all schedule import checks"""
+    app = create_app()
+    with app.app_context():
+        doctor_ids = seed()
+        check_parsing()
+        check_sweep()
+        check_import(doctor_ids)
+    print('OK: schedules parse, overlaps are found and imports are all-or-nothing')
+
+if __name__ == '__main__':
+    check_schedules()
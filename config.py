@@ -18,14 +18,106 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', MAIL_USERNAME)
     
+    # Email outbox: messages are queued in the database and sent by background workers
+    MAIL_OUTBOX_WORKERS = int(os.environ.get('MAIL_OUTBOX_WORKERS', 2))
+    # Off by default (on in DevelopmentConfig): emails are sent by the Procfile's
+    # worker process (`python manage_db.py run_mail_worker`). Enable to start the
+    # workers inside the web process on the first queued email when no worker runs.
+    MAIL_OUTBOX_IN_PROCESS = os.environ.get('MAIL_OUTBOX_IN_PROCESS', 'False').lower() in ['true', 'yes', '1']
+    MAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('MAIL_OUTBOX_BATCH_SIZE', 20))
+    MAIL_OUTBOX_POLL_INTERVAL = float(os.environ.get('MAIL_OUTBOX_POLL_INTERVAL', 5))
+    MAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('MAIL_OUTBOX_MAX_ATTEMPTS', 6))
+    # Retry delays grow as base * 2 ** (attempt - 1), up to the maximum (seconds)
+    MAIL_OUTBOX_RETRY_BASE_DELAY = int(os.environ.get('MAIL_OUTBOX_RETRY_BASE_DELAY', 30))
+    MAIL_OUTBOX_RETRY_MAX_DELAY = int(os.environ.get('MAIL_OUTBOX_RETRY_MAX_DELAY', 3600))
+    # Messages claimed longer ago than this are assumed lost by a dead worker
+    MAIL_OUTBOX_CLAIM_TIMEOUT = int(os.environ.get('MAIL_OUTBOX_CLAIM_TIMEOUT', 300))
+    
+    # SMS dispatch: provider name registered in sms.py ('fake' logs messages locally)
+    SMS_PROVIDER = os.environ.get('SMS_PROVIDER', 'fake')
+    SMS_WORKERS = int(os.environ.get('SMS_WORKERS', 2))
+    # Off by default (on in DevelopmentConfig): texts are sent by the Procfile's
+    # sms_worker process (`python manage_db.py run_sms_worker`). Every process
+    # sending texts has its own rate limiter, so also sending from each web process
+    # would multiply the rate sent to the provider. Enable only when no separate worker runs.
+    SMS_IN_PROCESS = os.environ.get('SMS_IN_PROCESS', 'False').lower() in ['true', 'yes', '1']
+    SMS_POLL_INTERVAL = float(os.environ.get('SMS_POLL_INTERVAL', 2))
+    # Provider throughput per process: messages per second and requests in flight
+    SMS_RATE_LIMIT = float(os.environ.get('SMS_RATE_LIMIT', 10))
+    SMS_MAX_CONCURRENCY = int(os.environ.get('SMS_MAX_CONCURRENCY', 4))
+    SMS_MAX_ATTEMPTS = int(os.environ.get('SMS_MAX_ATTEMPTS', 5))
+    SMS_RETRY_BASE_DELAY = int(os.environ.get('SMS_RETRY_BASE_DELAY', 10))
+    SMS_RETRY_MAX_DELAY = int(os.environ.get('SMS_RETRY_MAX_DELAY', 600))
+    SMS_CLAIM_TIMEOUT = int(os.environ.get('SMS_CLAIM_TIMEOUT', 120))
+    # Shared secret the provider sends with delivery status callbacks
+    SMS_STATUS_TOKEN = os.environ.get('SMS_STATUS_TOKEN')
+    
+    # Password hashing: 'bcrypt' or a Werkzeug method such as 'pbkdf2:sha256:600000'.
+    # Changing these rehashes each password the next time its owner logs in.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'bcrypt')
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    # Hashes computed at once per process; defaults to the number of CPUs
+    PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 0)) or None
+    
+    # Login throttling: failed logins allowed per IP and per account within a
+    # sliding window (seconds) before lockouts start, doubling from the base delay
+    LOGIN_THROTTLE_ENABLED = os.environ.get('LOGIN_THROTTLE_ENABLED', 'True').lower() in ['true', 'yes', '1']
+    LOGIN_IP_MAX_FAILURES = int(os.environ.get('LOGIN_IP_MAX_FAILURES', 20))
+    LOGIN_IP_WINDOW = int(os.environ.get('LOGIN_IP_WINDOW', 300))
+    LOGIN_ACCOUNT_MAX_FAILURES = int(os.environ.get('LOGIN_ACCOUNT_MAX_FAILURES', 5))
+    LOGIN_ACCOUNT_WINDOW = int(os.environ.get('LOGIN_ACCOUNT_WINDOW', 900))
+    LOGIN_BACKOFF_BASE = int(os.environ.get('LOGIN_BACKOFF_BASE', 30))
+    LOGIN_BACKOFF_MAX = int(os.environ.get('LOGIN_BACKOFF_MAX', 3600))
+    
     # Upload settings
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
+    
+    # Slot availability cache lifetime in seconds
+    SLOT_CACHE_TTL = int(os.environ.get('SLOT_CACHE_TTL', 30))
+    
+    # Notification streams served at once per web process; each holds a gunicorn
+    # thread, so keep this well below GUNICORN_THREADS (300 in the Procfile).
+    # Further tabs poll instead. Site-wide push capacity is WEB_CONCURRENCY times this.
+    NOTIFICATION_STREAMS_PER_PROCESS = int(os.environ.get('NOTIFICATION_STREAMS_PER_PROCESS', 250))
+    
+    # Materialized slot calendar: serve slot lists from the doctor_slots table, kept this many days ahead
+    # and extended every night at SLOT_CALENDAR_REFRESH_HOUR (local time) by the refresher
+    SLOT_CALENDAR_ENABLED = os.environ.get('SLOT_CALENDAR_ENABLED', 'false').lower() in ['true', 'yes', '1']
+    SLOT_CALENDAR_DAYS = int(os.environ.get('SLOT_CALENDAR_DAYS', 60))
+    SLOT_CALENDAR_REFRESH_HOUR = int(os.environ.get('SLOT_CALENDAR_REFRESH_HOUR', 2))
+    
+    # Booking: how long a selected slot is held for a patient, and retries on transient database conflicts
+    APPOINTMENT_HOLD_SECONDS = int(os.environ.get('APPOINTMENT_HOLD_SECONDS', 300))
+    BOOKING_MAX_RETRIES = int(os.environ.get('BOOKING_MAX_RETRIES', 5))
+    BOOKING_DAYS_AHEAD = int(os.environ.get('BOOKING_DAYS_AHEAD', 30))
+    
+    # Doctor search index is rebuilt from the database after this many seconds
+    SEARCH_INDEX_TTL = int(os.environ.get('SEARCH_INDEX_TTL', 300))
+    
+    # Seconds a logged-in user and their profile are cached per process (0 disables)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 5))
+    
+    # Notification retention: read notifications older than this are archived
+    NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))
+    NOTIFICATION_ARCHIVE_BATCH_SIZE = int(os.environ.get('NOTIFICATION_ARCHIVE_BATCH_SIZE', 500))
+    # Seconds to pause between archive batches, longer during business hours
+    NOTIFICATION_ARCHIVE_PAUSE = float(os.environ.get('NOTIFICATION_ARCHIVE_PAUSE', 0.1))
+    NOTIFICATION_ARCHIVE_BUSINESS_PAUSE = float(os.environ.get('NOTIFICATION_ARCHIVE_BUSINESS_PAUSE', 2))
+    # Business hours as "start-end" in local server hours
+    BUSINESS_HOURS = os.environ.get('BUSINESS_HOURS', '8-18')
+    
+    # Rows fetched and written at a time by the streaming user, patient and doctor exports
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
 
 class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
+    # `python app.py` runs no separate workers, so send emails and texts
+    # (verification codes) from the web process; the fake SMS provider prints them
+    MAIL_OUTBOX_IN_PROCESS = os.environ.get('MAIL_OUTBOX_IN_PROCESS', 'True').lower() in ['true', 'yes', '1']
+    SMS_IN_PROCESS = os.environ.get('SMS_IN_PROCESS', 'True').lower() in ['true', 'yes', '1']
 
 class ProductionConfig(Config):
     """Production configuration."""
@@ -1,4 +1,5 @@
-from app import create_app, bcrypt
+from app import create_app
+from passwords import hash_password
 from models import db, User, UserType
 
 def create_admin_user(email, password, first_name, last_name, phone):
@@ -12,7 +13,7 @@ def create_admin_user(email, password, first_name, last_name, phone):
             return
         
         # Create new admin user
-        password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        password_hash = hash_password(password)
         admin_user = User(
             email=email,
             password_hash=password_hash,
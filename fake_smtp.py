@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Local fake SMTP server that accepts every message and keeps it in memory.
+
+Usage:
+- Run standalone: python fake_smtp.py [port]   (default port 1025)
+  then set MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=False
+- From a script: server = FakeSMTPServer(port=0).start(); ...; server.messages
+
+Only the commands smtplib needs to deliver a message are implemented; any
+AUTH credentials are accepted.
+"""
+
+import socketserver
+import sys
+import threading
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """One SMTP session."""
+
+    def _reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        server = self.server
+        sender = None
+        recipients = []
+        self._reply('220 localhost fake SMTP ready')
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+
+            if verb == 'EHLO':
+                self._reply('250-localhost')
+                self._reply('250-AUTH PLAIN LOGIN')
+                self._reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self._reply('250 localhost')
+            elif verb == 'AUTH':
+                # Any credentials are accepted
+                if command.upper().startswith('AUTH LOGIN'):
+                    for _ in range(2 if len(command.split()) == 2 else 1):
+                        self._reply('334 ')
+                        self.rfile.readline()
+                self._reply('235 Authentication successful')
+            elif verb == 'MAIL':
+                sender = command.split(':', 1)[1].strip()
+                recipients = []
+                self._reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1].strip())
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b'.\r\n', b'.\n'):
+                        break
+                    if data_line.startswith(b'..'):
+                        data_line = data_line[1:]
+                    lines.append(data_line)
+                if server.take_failure():
+                    self._reply('451 Temporary failure, try again later')
+                else:
+                    server.record(sender, recipients, b''.join(lines))
+                    self._reply('250 OK queued')
+                sender = None
+                recipients = []
+            elif verb == 'RSET':
+                sender = None
+                recipients = []
+                self._reply('250 OK')
+            elif verb == 'NOOP':
+                self._reply('250 OK')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """Threaded fake SMTP server recording delivered messages."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='localhost', port=1025, verbose=False):
+        super().__init__((host, port), _SMTPHandler)
+        self.verbose = verbose
+        self.messages = []
+        self.connections = 0
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def fail_next(self, count=1):
+        """Reject the next `count` messages with a temporary failure."""
+        with self._lock:
+            self._failures += count
+
+    def take_failure(self):
+        with self._lock:
+            if self._failures:
+                self._failures -= 1
+                return True
+            return False
+
+    def record(self, sender, recipients, data):
+        with self._lock:
+            self.messages.append({'sender': sender, 'recipients': recipients, 'data': data})
+        if self.verbose:
+            print(f"Message from {sender} to {', '.join(recipients)} ({len(data)} bytes)")
+            print(data.decode('utf-8', 'replace'))
+            print("-" * 80)
+
+    def start(self):
+        """Serve in a background thread and return the server."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 1025
+    server = FakeSMTPServer(port=port, verbose=True)
+    print(f"Fake SMTP server listening on localhost:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
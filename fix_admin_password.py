@@ -1,4 +1,5 @@
-from app import create_app, bcrypt
+from app import create_app
+from passwords import hash_password
 from models import db, User, UserType
 
 def fix_admin_password():
@@ -14,7 +15,7 @@ def fix_admin_password():
         
         # Update password with proper hash
         new_password = "Admin123!"
-        admin_user.password_hash = bcrypt.generate_password_hash(new_password).decode('utf-8')
+        admin_user.password_hash = hash_password(new_password)
         
         db.session.commit()
         print(f"Admin password reset successfully to: {new_password}")
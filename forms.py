@@ -143,17 +143,64 @@ class DoctorAvailabilityForm(FlaskForm):
     ])
     submit = SubmitField('Add Availability')
 
+class WeeklyTemplateForm(FlaskForm):
+    """Form for setting the availability of the whole week at once."""
+    monday = StringField('Monday', validators=[Optional()])
+    tuesday = StringField('Tuesday', validators=[Optional()])
+    wednesday = StringField('Wednesday', validators=[Optional()])
+    thursday = StringField('Thursday', validators=[Optional()])
+    friday = StringField('Friday', validators=[Optional()])
+    saturday = StringField('Saturday', validators=[Optional()])
+    sunday = StringField('Sunday', validators=[Optional()])
+    replace_existing = BooleanField('Replace my current weekly availability', default=True)
+    submit = SubmitField('Apply Weekly Template')
+    
+    def day_fields(self):
+        """The day fields in day_of_week order (0=Monday)."""
+        return [self.monday, self.tuesday, self.wednesday, self.thursday, self.friday, self.saturday, self.sunday]
+
+class ScheduleImportForm(FlaskForm):
+    """Form for importing a weekly schedule file."""
+    schedule_file = FileField('Schedule File (CSV or JSON)', validators=[
+        FileRequired(),
+        FileAllowed(['csv', 'json'], 'CSV or JSON files only!')
+    ])
+    replace_existing = BooleanField('Replace my current weekly availability', default=True)
+    submit = SubmitField('Import Schedule')
+
+class AvailabilityExceptionForm(FlaskForm):
+    """Form for closing a date, blocking part of it or adding extra hours."""
+    exception_date = DateField('Date', validators=[DataRequired()])
+    kind = SelectField('Change', choices=[
+        ('closed', 'Closed all day'), ('blocked', 'Unavailable between'), ('extra', 'Extra hours between')
+    ], validators=[DataRequired()])
+    start_time = StringField('Start Time (HH:MM)', validators=[
+        Optional(),
+        Regexp(r'^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$', message='Time must be in HH:MM format')
+    ])
+    end_time = StringField('End Time (HH:MM)', validators=[
+        Optional(),
+        Regexp(r'^([0-1]?[0-9]|2[0-3]):[0-5][0-9]$', message='Time must be in HH:MM format')
+    ])
+    reason = StringField('Reason', validators=[Optional(), Length(max=255)])
+    submit = SubmitField('Add Exception')
+
 class DoctorSearchForm(FlaskForm):
     """Form for searching doctors."""
     specialty = StringField('Specialty')
     location = StringField('Location')
     language = StringField('Language')
+    sort_by = SelectField('Sort By', choices=[
+        ('', 'Default'), ('availability', 'Soonest Availability')
+    ], validators=[Optional()])
     submit = SubmitField('Search')
 
 class AppointmentBookingForm(FlaskForm):
     """Form for booking appointments."""
     appointment_date = DateField('Appointment Date', validators=[DataRequired()])
-    time_slot = SelectField('Time Slot', validators=[DataRequired()])
+    # Options are filled in by the page from the slot endpoints; the booking service checks the slot
+    time_slot = SelectField('Time Slot', choices=[('', 'Select a time slot')], validators=[DataRequired()],
+                            validate_choice=False)
     reason = TextAreaField('Reason for Visit', validators=[DataRequired()])
     notes = TextAreaField('Additional Notes')
     submit = SubmitField('Book Appointment')
@@ -0,0 +1,54 @@
+"""
+Sorted interval sets for the Health Appointment System.
+
+``IntervalSet`` keeps disjoint half-open [start, end) intervals in two
+parallel sorted lists, merging intervals that overlap or touch as they are
+added. Overlap queries are a binary search, so checking a new availability
+window or appointment against everything already on a day costs O(log n)
+instead of a comparison with every existing row.
+
+Bounds can be any comparable values: minutes since midnight, ``time``
+objects or datetimes, as long as one set does not mix them.
+"""
+
+from bisect import bisect_left, bisect_right
+
+
+class IntervalSet:
+    """A set of disjoint [start, end) intervals, kept sorted."""
+
+    def __init__(self, intervals=()):
+        self._starts = []
+        self._ends = []
+        for start, end in sorted(intervals):
+            self.add(start, end)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __bool__(self):
+        return bool(self._starts)
+
+    def __iter__(self):
+        return iter(zip(self._starts, self._ends))
+
+    def __repr__(self):
+        return f'IntervalSet({list(self)!r})'
+
+    def add(self, start, end):
+        """Add [start, end), merging it with the intervals it overlaps or touches."""
+        if end <= start:
+            return
+        # Intervals from i to j - 1 overlap or touch the new one
+        i = bisect_left(self._ends, start)
+        j = bisect_right(self._starts, end)
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def overlaps(self, start, end):
+        """Check whether [start, end) shares any point with the set; touching does not count."""
+        i = bisect_right(self._ends, start)
+        return i < len(self._starts) and self._starts[i] < end
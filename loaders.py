@@ -0,0 +1,27 @@
+"""
+Reusable eager-loading options for the Health Appointment System.
+
+Templates that list appointments walk ``appointment.doctor.user`` or
+``appointment.patient.user``. Without eager loading every row triggers its own
+lazy SELECT through the backrefs declared in models.py; these options load the
+related rows in the same query instead. They are functions because the
+backref attributes only exist once the mappers are configured.
+"""
+
+from sqlalchemy.orm import joinedload
+from models import Appointment, Doctor, Patient
+
+
+def appointment_with_doctor():
+    """Options for appointments rendered with the doctor's name and specialty."""
+    return [joinedload(Appointment.doctor).joinedload(Doctor.user)]
+
+
+def appointment_with_patient():
+    """Options for appointments rendered with the patient's name."""
+    return [joinedload(Appointment.patient).joinedload(Patient.user)]
+
+
+def doctor_with_user():
+    """Options for doctors rendered with their user's name."""
+    return [joinedload(Doctor.user)]
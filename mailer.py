@@ -0,0 +1,228 @@
+"""
+Outgoing email for the Health Appointment System.
+
+Request handlers never talk to the SMTP server. ``queue_email`` stores the
+message in the ``email_outbox`` table and returns; background workers claim
+due messages in batches, deliver them over an SMTP connection that is kept
+open while there is work, and retry failures with exponential backoff.
+
+Workers run in a dedicated process with ``python manage_db.py
+run_mail_worker`` (the Procfile's ``worker``), or, with
+``MAIL_OUTBOX_IN_PROCESS`` as in development, as daemon threads inside the
+web process, started on the first queued email. Claiming is done with a conditional
+UPDATE, so any number of workers in any number of processes can share the
+outbox without sending a message twice.
+
+For local testing, point ``MAIL_SERVER``/``MAIL_PORT`` at ``fake_smtp.py``.
+"""
+
+import logging
+import random
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import and_, or_, select, update
+from models import db, EmailOutbox, EmailStatus
+
+logger = logging.getLogger(__name__)
+
+# Longest error message kept on a failed outbox row
+MAX_ERROR_LENGTH = 1000
+
+_workers_lock = threading.Lock()
+_workers = []
+_wake = threading.Event()
+_stop = threading.Event()
+
+
+def queue_email(subject, recipients, body, html=None):
+    """
+    Queue an email for delivery by the mail workers.
+
+    Args:
+        subject: Subject line
+        recipients: List of recipient addresses
+        body: Plain-text body
+        html: Optional HTML body
+
+    Returns:
+        The EmailOutbox row, committed
+    """
+    email = EmailOutbox(
+        recipients=','.join(recipients),
+        subject=subject,
+        body=body,
+        html=html
+    )
+    db.session.add(email)
+    db.session.commit()
+
+    if current_app.config.get('MAIL_OUTBOX_IN_PROCESS', False):
+        start_workers(current_app._get_current_object())
+    _wake.set()
+    return email
+
+
+def _due_filter(now):
+    """Messages ready to send, including claims abandoned by a dead worker."""
+    stale = now - timedelta(seconds=current_app.config.get('MAIL_OUTBOX_CLAIM_TIMEOUT', 300))
+    return or_(
+        and_(EmailOutbox.status == EmailStatus.PENDING, EmailOutbox.next_attempt_at <= now),
+        and_(EmailOutbox.status == EmailStatus.SENDING, EmailOutbox.claimed_at < stale)
+    )
+
+
+def claim_batch(batch_size):
+    """
+    Claim a batch of due messages for this worker.
+
+    Returns:
+        The claimed EmailOutbox rows, oldest first
+    """
+    now = datetime.utcnow()
+    candidate_ids = db.session.execute(
+        select(EmailOutbox.id).where(_due_filter(now)).order_by(EmailOutbox.id).limit(batch_size)
+    ).scalars().all()
+    if not candidate_ids:
+        return []
+
+    # Only rows still due when the UPDATE runs are claimed, so a message
+    # claimed by another worker in the meantime is skipped here
+    token = uuid.uuid4().hex
+    db.session.execute(
+        update(EmailOutbox).where(
+            EmailOutbox.id.in_(candidate_ids),
+            _due_filter(now)
+        ).values(
+            status=EmailStatus.SENDING,
+            claimed_by=token,
+            claimed_at=now
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    return EmailOutbox.query.filter_by(claimed_by=token, status=EmailStatus.SENDING).order_by(EmailOutbox.id).all()
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt after the given number of failed attempts."""
+    config = current_app.config
+    delay = config.get('MAIL_OUTBOX_RETRY_BASE_DELAY', 30) * 2 ** (attempts - 1)
+    delay = min(delay, config.get('MAIL_OUTBOX_RETRY_MAX_DELAY', 3600))
+    # A little jitter keeps retries from many workers from lining up
+    return delay * random.uniform(1, 1.1)
+
+
+def _build_message(email):
+    return Message(
+        email.subject,
+        recipients=email.recipients.split(','),
+        body=email.body,
+        html=email.html
+    )
+
+
+class OutboxSender:
+    """Delivers claimed outbox messages over one reusable SMTP connection."""
+
+    def __init__(self, mail):
+        self.mail = mail
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = self.mail.connect().__enter__()
+        return self._connection
+
+    def close(self):
+        """Close the SMTP connection, e.g. once the outbox is empty."""
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+
+    def send_due(self, batch_size=None):
+        """
+        Claim and deliver one batch of due messages.
+
+        Returns:
+            A (sent, failed) tuple of message counts
+        """
+        if batch_size is None:
+            batch_size = current_app.config.get('MAIL_OUTBOX_BATCH_SIZE', 20)
+        max_attempts = current_app.config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 6)
+
+        sent = failed = 0
+        for email in claim_batch(batch_size):
+            email.attempts += 1
+            try:
+                self._connect().send(_build_message(email))
+            except Exception as e:
+                # The connection may be broken; open a fresh one for the next message
+                self.close()
+                failed += 1
+                email.last_error = str(e)[:MAX_ERROR_LENGTH]
+                email.claimed_by = None
+                if email.attempts >= max_attempts:
+                    email.status = EmailStatus.FAILED
+                    logger.error(f"Giving up on email {email.id} to {email.recipients}: {e}")
+                else:
+                    email.status = EmailStatus.PENDING
+                    email.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(email.attempts))
+                    logger.warning(f"Email {email.id} to {email.recipients} failed, will retry: {e}")
+            else:
+                sent += 1
+                email.status = EmailStatus.SENT
+                email.sent_at = datetime.utcnow()
+                email.last_error = None
+            db.session.commit()
+        return sent, failed
+
+
+def run_worker(app, stop_event=None):
+    """
+    Deliver outbox messages until stop_event is set.
+
+    Sleeps for MAIL_OUTBOX_POLL_INTERVAL seconds when the outbox is empty,
+    or until queue_email in the same process wakes it up.
+    """
+    stop_event = stop_event or _stop
+    with app.app_context():
+        sender = OutboxSender(app.extensions['mail'])
+        poll_interval = app.config.get('MAIL_OUTBOX_POLL_INTERVAL', 5)
+        try:
+            while not stop_event.is_set():
+                try:
+                    sent, failed = sender.send_due()
+                except Exception as e:
+                    logger.error(f"Mail worker error: {e}")
+                    db.session.rollback()
+                    sent = failed = 0
+                finally:
+                    db.session.remove()
+
+                if not sent and not failed:
+                    # Nothing due: release the SMTP connection and wait for work
+                    sender.close()
+                    _wake.wait(poll_interval)
+                    _wake.clear()
+        finally:
+            sender.close()
+
+
+def start_workers(app):
+    """Start the in-process mail worker threads once per process."""
+    with _workers_lock:
+        if _workers:
+            return
+        for number in range(app.config.get('MAIL_OUTBOX_WORKERS', 2)):
+            worker = threading.Thread(
+                target=run_worker, args=(app,), name=f'mail-worker-{number}', daemon=True
+            )
+            worker.start()
+            _workers.append(worker)
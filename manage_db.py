@@ -5,52 +5,93 @@ Usage:
 - List all users: python manage_db.py list_users
 - List all patients: python manage_db.py list_patients
 - List all doctors: python manage_db.py list_doctors
+- Export users, patients or doctors: python manage_db.py export_users|export_patients|export_doctors [file.csv|file.jsonl] [--format csv|jsonl]
 - Add admin user: python manage_db.py add_admin <email> <password>
 - Delete user: python manage_db.py delete_user <user_id>
 - Verify doctor: python manage_db.py verify_doctor <doctor_id>
 - Activate user: python manage_db.py activate_user <user_id>
+- Recompute unread notification counters: python manage_db.py reconcile_notification_counts
+- Run the email outbox worker: python manage_db.py run_mail_worker
+- Run the SMS outbox worker: python manage_db.py run_sms_worker
+- Benchmark password hashing costs: python manage_db.py benchmark_password_hash [target_ms]
+- Archive old read notifications: python manage_db.py archive_notifications [days] [--file <path.jsonl.gz>] [--dry-run]
+- Purge expired holds and build or extend the slot calendar: python manage_db.py refresh_slot_calendar
+- Run the nightly slot calendar refresher: python manage_db.py run_slot_calendar_refresher
+- Import weekly schedules: python manage_db.py import_schedules <file.csv|file.json> [--add] [--dry-run]
+- Export weekly schedules: python manage_db.py export_schedules [file.csv|file.json] [--format json] [doctor_id ...]
 """
 
 import sys
 import os
 from app import create_app
 from models import db, User, Patient, Doctor, UserType, VerificationStatus, VerificationDocument
-from werkzeug.security import generate_password_hash
+from passwords import hash_password, benchmark
+from utils import sync_doctor_lookups, reconcile_unread_counts
+from retention import archive_notifications as archive_old_notifications
+from mailer import run_worker
+from sms import run_worker as run_sms_outbox_worker
+from slot_calendar import (
+    extend_horizon, horizon_end, run_refresher, purge_expired_holds, is_enabled as slot_calendar_enabled
+)
+from schedules import (
+    ScheduleError, detect_format, parse_schedule,
+    import_schedules as import_schedule_windows, export_schedules as export_schedule_windows
+)
+from exports import count_rows, iter_rows, stream_export
 
 def list_users():
     """List all users in the database."""
-    users = User.query.all()
-    print(f"Total users: {len(users)}")
+    print(f"Total users: {count_rows('users')}")
     print("-" * 80)
     print(f"{'ID':<5} {'Email':<30} {'User Type':<15} {'Active':<10} {'Created At'}")
     print("-" * 80)
-    for user in users:
+    for user in iter_rows('users'):
         print(f"{user.id:<5} {user.email:<30} {user.user_type.name:<15} {user.is_active:<10} {user.created_at}")
 
 def list_patients():
     """List all patients in the database."""
-    patients = Patient.query.all()
-    print(f"Total patients: {len(patients)}")
+    print(f"Total patients: {count_rows('patients')}")
     print("-" * 80)
     print(f"{'ID':<5} {'User ID':<10} {'Name':<20} {'Gender':<10} {'Blood Type':<10} {'DOB'}")
     print("-" * 80)
-    for patient in patients:
-        user = User.query.get(patient.user_id)
-        name = f"{user.first_name} {user.last_name}" if user else "Unknown"
-        print(f"{patient.id:<5} {patient.user_id:<10} {name:<20} {patient.gender:<10} {patient.blood_type:<10} {patient.date_of_birth}")
+    for patient in iter_rows('patients'):
+        name = f"{patient.first_name} {patient.last_name}"
+        print(f"{patient.id:<5} {patient.user_id:<10} {name:<20} {patient.gender or '':<10} {patient.blood_type or '':<10} {patient.date_of_birth}")
 
 def list_doctors():
     """List all doctors in the database."""
-    doctors = Doctor.query.all()
-    print(f"Total doctors: {len(doctors)}")
+    print(f"Total doctors: {count_rows('doctors')}")
     print("-" * 80)
     print(f"{'ID':<5} {'User ID':<10} {'Name':<20} {'Specialty':<20} {'License':<15} {'Status'}")
     print("-" * 80)
-    for doctor in doctors:
-        user = User.query.get(doctor.user_id)
-        name = f"{user.first_name} {user.last_name}" if user else "Unknown"
-        status = doctor.verification_status.name
-        print(f"{doctor.id:<5} {doctor.user_id:<10} {name:<20} {doctor.specialty:<20} {doctor.license_number:<15} {status}")
+    for doctor in iter_rows('doctors'):
+        name = f"{doctor.first_name} {doctor.last_name}"
+        status = doctor.verification_status.name if doctor.verification_status else ''
+        print(f"{doctor.id:<5} {doctor.user_id:<10} {name:<20} {doctor.specialty or '':<20} {doctor.license_number:<15} {status}")
+
+def export_table(kind, args):
+    """Write all users, patients or doctors as CSV or JSON Lines, to a file or stdout."""
+    path = None
+    fmt = None
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--format" and args:
+            fmt = args.pop(0)
+        else:
+            path = arg
+    if fmt is None:
+        fmt = "jsonl" if path and path.endswith(".jsonl") else "csv"
+    
+    chunks = stream_export(kind, fmt)
+    if path is None:
+        for chunk in chunks:
+            sys.stdout.write(chunk)
+        return
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    print(f"Exported {kind} to {path}.")
 
 def add_admin(email, password):
     """Add an admin user to the database."""
@@ -63,7 +104,7 @@ def add_admin(email, password):
     # Create new admin user - since there's no ADMIN type, we'll use DOCTOR type
     admin = User(
         email=email,
-        password_hash=generate_password_hash(password),
+        password_hash=hash_password(password),
         first_name="Admin",
         last_name="User",
         phone="+1234567890",  # Placeholder
@@ -86,6 +127,7 @@ def add_admin(email, password):
         bio="System Administrator",
         verification_status=VerificationStatus.VERIFIED
     )
+    sync_doctor_lookups(doctor)
     
     db.session.add(doctor)
     db.session.commit()
@@ -148,6 +190,153 @@ def activate_user(user_id):
     db.session.commit()
     print(f"User with ID {user_id} has been activated.")
 
+def reconcile_notification_counts():
+    """Recompute every user's unread notification counter from scratch."""
+    updated = reconcile_unread_counts()
+    print(f"Unread notification counters updated for {updated} users.")
+
+def archive_notifications(args):
+    """Move read notifications past the retention age out of the live table."""
+    days = None
+    archive_path = None
+    dry_run = False
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--file" and args:
+            archive_path = args.pop(0)
+        elif arg == "--dry-run":
+            dry_run = True
+        else:
+            days = int(arg)
+    
+    count = archive_old_notifications(older_than_days=days, archive_path=archive_path, dry_run=dry_run)
+    if dry_run:
+        print(f"{count} notifications would be archived.")
+    else:
+        destination = archive_path or "the notification_archive table"
+        print(f"Archived {count} notifications to {destination}.")
+
+def run_mail_worker(app):
+    """Deliver queued emails until interrupted."""
+    print("Mail worker started. Press Ctrl+C to stop.")
+    try:
+        run_worker(app)
+    except KeyboardInterrupt:
+        print("Mail worker stopped.")
+
+def run_sms_worker(app):
+    """Send queued text messages until interrupted."""
+    print("SMS worker started. Press Ctrl+C to stop.")
+    try:
+        run_sms_outbox_worker(app)
+    except KeyboardInterrupt:
+        print("SMS worker stopped.")
+
+def refresh_slot_calendar():
+    """Purge expired holds, drop past slots and generate every doctor's slots up to the horizon."""
+    print(f"Purged {purge_expired_holds()} expired appointment holds.")
+    if not slot_calendar_enabled():
+        print("The slot calendar is disabled; set SLOT_CALENDAR_ENABLED=true to build it.")
+        return
+    deleted, created = extend_horizon()
+    print(f"Slot calendar now runs to {horizon_end()}: {deleted} past slots dropped, {created} slots added.")
+
+def run_slot_calendar_refresher(app):
+    """Extend the slot calendar now and every night until interrupted."""
+    print("Slot calendar refresher started. Press Ctrl+C to stop.")
+    try:
+        run_refresher(app)
+    except KeyboardInterrupt:
+        print("Slot calendar refresher stopped.")
+
+def import_schedules(args):
+    """Replace (or with --add, extend) doctors' weekly availability from a CSV or JSON file."""
+    path = None
+    replace = True
+    dry_run = False
+    for arg in args:
+        if arg == "--add":
+            replace = False
+        elif arg == "--dry-run":
+            dry_run = True
+        else:
+            path = arg
+    if path is None:
+        print("A schedule file is required.")
+        return
+    
+    with open(path, encoding='utf-8-sig') as f:
+        text = f.read()
+    try:
+        windows, errors = parse_schedule(text, detect_format(filename=path))
+    except ScheduleError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not errors:
+        result = import_schedule_windows(windows, replace=replace, dry_run=dry_run)
+        errors = result.errors
+    if errors:
+        print(f"Schedule not imported, {len(errors)} problems found:")
+        for error in errors:
+            print(f"  {error}")
+        sys.exit(1)
+    
+    action = "would be imported" if dry_run else "imported"
+    print(f"{result.windows} availability windows for {result.doctors} doctors {action}.")
+
+def export_schedules(args):
+    """Write doctors' weekly availability as CSV or JSON, to a file or stdout."""
+    path = None
+    fmt = None
+    doctor_ids = []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--format" and args:
+            fmt = args.pop(0)
+        elif arg.isdigit():
+            doctor_ids.append(int(arg))
+        else:
+            path = arg
+    
+    output = export_schedule_windows(doctor_ids or None, detect_format(fmt, path))
+    if path:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(output)
+        print(f"Schedules written to {path}.")
+    else:
+        sys.stdout.write(output)
+
+def benchmark_password_hash(target_ms=250):
+    """Time password hashing at several costs and suggest one under the target login time."""
+    cores = os.cpu_count() or 1
+    candidates = [('bcrypt', rounds) for rounds in range(10, 15)] + [
+        (f'pbkdf2:sha256:{iterations}', None) for iterations in (260000, 600000, 1000000)
+    ]
+    
+    print(f"Target: {target_ms} ms per hash, {cores} CPU cores")
+    print("-" * 80)
+    print(f"{'Method':<28} {'Cost':<6} {'ms/hash':<10} {'Hashes/s/core':<15} {'Logins/s (all cores)'}")
+    print("-" * 80)
+    best = {}
+    for method, rounds in candidates:
+        seconds, per_second = benchmark(method, rounds)
+        print(f"{method:<28} {rounds or '-':<6} {seconds * 1000:<10.1f} {per_second:<15.1f} {per_second * cores:.1f}")
+        family = method.split(':')[0]
+        if seconds * 1000 <= target_ms:
+            best[family] = (method, rounds)
+    
+    print("-" * 80)
+    if not best:
+        print("No tested cost fits the target; lower the cost or raise the target.")
+    for family, (method, rounds) in best.items():
+        if family == 'bcrypt':
+            print(f"Suggested: PASSWORD_HASH_METHOD=bcrypt BCRYPT_LOG_ROUNDS={rounds}")
+        else:
+            print(f"Suggested: PASSWORD_HASH_METHOD={method}")
+    print("Leave headroom: under load, logins queue for PASSWORD_HASH_CONCURRENCY slots.")
+
 def main():
     """Main function to handle command line arguments."""
     if len(sys.argv) < 2:
@@ -165,6 +354,8 @@ def main():
             list_patients()
         elif command == "list_doctors":
             list_doctors()
+        elif command in ("export_users", "export_patients", "export_doctors"):
+            export_table(command[len("export_"):], sys.argv[2:])
         elif command == "add_admin" and len(sys.argv) == 4:
             add_admin(sys.argv[2], sys.argv[3])
         elif command == "delete_user" and len(sys.argv) == 3:
@@ -173,6 +364,24 @@ def main():
             verify_doctor(int(sys.argv[2]))
         elif command == "activate_user" and len(sys.argv) == 3:
             activate_user(int(sys.argv[2]))
+        elif command == "reconcile_notification_counts":
+            reconcile_notification_counts()
+        elif command == "run_mail_worker":
+            run_mail_worker(app)
+        elif command == "run_sms_worker":
+            run_sms_worker(app)
+        elif command == "benchmark_password_hash":
+            benchmark_password_hash(int(sys.argv[2]) if len(sys.argv) == 3 else 250)
+        elif command == "archive_notifications":
+            archive_notifications(sys.argv[2:])
+        elif command == "refresh_slot_calendar":
+            refresh_slot_calendar()
+        elif command == "run_slot_calendar_refresher":
+            run_slot_calendar_refresher(app)
+        elif command == "import_schedules":
+            import_schedules(sys.argv[2:])
+        elif command == "export_schedules":
+            export_schedules(sys.argv[2:])
         else:
             print("Invalid command or missing arguments.")
             print(__doc__)
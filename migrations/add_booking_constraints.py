@@ -0,0 +1,58 @@
+import os
+import sys
+
+# Add the parent directory to sys.path to import app
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from sqlalchemy import func
+from app import create_app, db
+from models import Appointment, AppointmentHold, AppointmentStatus
+
+def find_double_bookings():
+    """Slots taken by more than one appointment that is not cancelled."""
+    return db.session.query(
+        Appointment.doctor_id,
+        Appointment.appointment_date,
+        Appointment.start_time,
+        func.count(Appointment.id)
+    ).filter(
+        Appointment.status != AppointmentStatus.CANCELLED
+    ).group_by(
+        Appointment.doctor_id,
+        Appointment.appointment_date,
+        Appointment.start_time
+    ).having(func.count(Appointment.id) > 1).all()
+
+def migrate():
+    """Add the appointment holds table and the one-booking-per-slot unique index."""
+    app = create_app()
+    with app.app_context():
+        engine = db.engine
+        inspector = db.inspect(engine)
+        
+        if 'appointment_holds' not in inspector.get_table_names():
+            print("Creating 'appointment_holds' table")
+            AppointmentHold.__table__.create(bind=engine)
+        
+        index = next(index for index in Appointment.__table__.indexes if index.name == 'uq_appointments_active_slot')
+        if index.name in {existing['name'] for existing in inspector.get_indexes('appointments')}:
+            print(f"Index '{index.name}' already exists")
+            print("Migration completed successfully!")
+            return
+        
+        duplicates = find_double_bookings()
+        if duplicates:
+            print("These slots are booked more than once; cancel the extra appointments and run again:")
+            for doctor_id, appointment_date, start_time, count in duplicates:
+                print(f"  Doctor {doctor_id} on {appointment_date} at {start_time.strftime('%H:%M')}: {count} appointments")
+            sys.exit(1)
+        
+        print(f"Creating unique index '{index.name}' on appointments")
+        with engine.begin() as conn:
+            index.create(bind=conn, checkfirst=True)
+        
+        print("Migration completed successfully!")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,52 @@
+import os
+import sys
+
+# Add the parent directory to sys.path to import app
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from app import create_app, db
+import models  # noqa: F401  (registers every table and index on db.metadata)
+
+def migrate():
+    """Create the secondary indexes declared in models.py that are missing from the database."""
+    app = create_app()
+    with app.app_context():
+        engine = db.engine
+        inspector = db.inspect(engine)
+        tables = set(inspector.get_table_names())
+        postgresql = engine.dialect.name == 'postgresql'
+        print(f"Adding indexes to {engine.dialect.name} database")
+        
+        for table in db.metadata.sorted_tables:
+            if table.name not in tables:
+                print(f"Skipping table '{table.name}' (not created yet)")
+                continue
+            
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in existing_indexes:
+                    print(f"Index '{index.name}' already exists")
+                    continue
+                
+                missing = [column.name for column in index.columns if column.name not in existing_columns]
+                if missing:
+                    print(f"Skipping index '{index.name}' (missing columns: {', '.join(missing)})")
+                    continue
+                
+                print(f"Creating index '{index.name}' on {table.name}")
+                if postgresql:
+                    # Build without holding a write lock on the table; needs to run outside a transaction
+                    index.dialect_options['postgresql']['concurrently'] = True
+                    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                        index.create(bind=conn, checkfirst=True)
+                else:
+                    with engine.begin() as conn:
+                        index.create(bind=conn, checkfirst=True)
+        
+        print("Migration completed successfully!")
+
+if __name__ == "__main__":
+    migrate()
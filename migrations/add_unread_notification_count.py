@@ -0,0 +1,31 @@
+import os
+import sys
+
+# Add the parent directory to sys.path to import app
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from sqlalchemy import text
+from app import create_app, db
+from utils import reconcile_unread_counts
+
+def migrate():
+    """Add the unread notification counter to users and fill it in."""
+    app = create_app()
+    with app.app_context():
+        inspector = db.inspect(db.engine)
+        columns = [column['name'] for column in inspector.get_columns('users')]
+        
+        if 'unread_notification_count' not in columns:
+            print("Adding 'unread_notification_count' column to users table")
+            db.session.execute(text(
+                "ALTER TABLE users ADD COLUMN unread_notification_count INTEGER NOT NULL DEFAULT 0"
+            ))
+            db.session.commit()
+        
+        updated = reconcile_unread_counts()
+        print(f"Unread notification counters updated for {updated} users.")
+        print("Migration completed successfully!")
+
+if __name__ == "__main__":
+    migrate()
@@ -6,7 +6,7 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_dir)
 
 from app import create_app, db
-from models import User, Patient, Doctor, Appointment, DoctorAvailability, Notification, VerificationDocument
+from models import User, Patient, Doctor, Appointment, AppointmentHold, DoctorAvailability, DoctorSlot, AvailabilityException, Notification, NotificationArchive, EmailOutbox, SmsOutbox, VerificationDocument, Specialty, Language
 
 def create_tables():
     """Create all tables defined in models.py"""
@@ -26,7 +26,9 @@ def create_tables():
         # Verify specific tables
         expected_tables = [
             'users', 'patients', 'doctors', 'appointments', 
-            'doctor_availability', 'notifications', 'verification_documents'
+            'doctor_availability', 'notifications', 'verification_documents',
+            'specialties', 'languages', 'doctor_languages', 'notification_archive', 'email_outbox', 'sms_outbox',
+            'appointment_holds', 'doctor_slots', 'availability_exceptions'
         ]
         
         for table in expected_tables:
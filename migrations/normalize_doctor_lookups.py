@@ -0,0 +1,55 @@
+import os
+import sys
+
+# Add the parent directory to sys.path to import app
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parent_dir)
+
+from sqlalchemy import text
+from app import create_app, db
+from models import Doctor
+from utils import sync_doctor_lookups
+
+# Number of doctors backfilled per transaction
+BATCH_SIZE = 500
+
+def migrate():
+    """Create the specialty/language lookup tables and backfill them from existing doctors."""
+    app = create_app()
+    with app.app_context():
+        # Create the new lookup and association tables (existing tables are left alone)
+        print("Creating lookup tables...")
+        db.create_all()
+        
+        # Add the canonical specialty reference to doctors if it doesn't exist
+        inspector = db.inspect(db.engine)
+        columns = [column['name'] for column in inspector.get_columns('doctors')]
+        if 'specialty_id' not in columns:
+            print("Adding 'specialty_id' column to doctors table")
+            db.session.execute(text("ALTER TABLE doctors ADD COLUMN specialty_id INTEGER REFERENCES specialties(id)"))
+        
+        print("Creating index 'ix_doctors_specialty_status'")
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_doctors_specialty_status ON doctors (specialty_id, verification_status)"
+        ))
+        db.session.commit()
+        
+        # Backfill canonical specialties and languages in batches
+        print("Backfilling specialties and languages...")
+        last_id = 0
+        total = 0
+        while True:
+            doctors = Doctor.query.filter(Doctor.id > last_id).order_by(Doctor.id).limit(BATCH_SIZE).all()
+            if not doctors:
+                break
+            for doctor in doctors:
+                sync_doctor_lookups(doctor)
+            db.session.commit()
+            total += len(doctors)
+            last_id = doctors[-1].id
+            print(f"  {total} doctors processed")
+        
+        print("Migration completed successfully!")
+
+if __name__ == "__main__":
+    migrate()
@@ -2,18 +2,21 @@ import os
 import sys
 import random
 from datetime import datetime, timedelta, time
-from werkzeug.security import generate_password_hash
 
 # Add the parent directory to sys.path to import app
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_dir)
 
 from app import create_app, db
+from passwords import hash_password
 from models import (
     User, Patient, Doctor, Appointment, DoctorAvailability, 
     Notification, VerificationDocument, UserType, VerificationStatus,
-    AppointmentStatus
+    AppointmentStatus, AppointmentHold, AvailabilityException, DoctorSlot,
+    doctor_languages
 )
+from utils import sync_doctor_lookups, reconcile_unread_counts
+from availability import DEFAULT_SLOT_MINUTES, from_minutes
 
 def seed_database():
     """Seed the database with test data"""
@@ -24,19 +27,26 @@ def seed_database():
         # Clear existing data
         print("Clearing existing data...")
         Notification.query.delete()
+        AppointmentHold.query.delete()
         Appointment.query.delete()
+        DoctorSlot.query.delete()
+        AvailabilityException.query.delete()
         DoctorAvailability.query.delete()
         VerificationDocument.query.delete()
+        db.session.execute(doctor_languages.delete())
         Doctor.query.delete()
         Patient.query.delete()
         User.query.delete()
         db.session.commit()
         print("Existing data cleared.")
         
+        # Every test user has the same password, so hash it only once
+        password_hash = hash_password('password')
+        
         # Create admin user
         admin_user = User(
             email='admin@example.com',
-            password_hash=generate_password_hash('password'),
+            password_hash=password_hash,
             first_name='Admin',
             last_name='User',
             phone='+213500000000',
@@ -67,7 +77,7 @@ def seed_database():
             # Create user for doctor
             doctor_user = User(
                 email=f'doctor{i}@example.com',
-                password_hash=generate_password_hash('password'),
+                password_hash=password_hash,
                 first_name=f'Doctor{i}',
                 last_name=f'LastName{i}',
                 phone=f'+21351{i}000000',
@@ -93,6 +103,7 @@ def seed_database():
                 consultation_fee=random.randint(2000, 5000),
                 profile_picture=None
             )
+            sync_doctor_lookups(doctor)
             db.session.add(doctor)
             db.session.commit()  # Commit to get the ID
             doctors.append(doctor)
@@ -138,7 +149,7 @@ def seed_database():
             # Create user for patient
             patient_user = User(
                 email=f'patient{i}@example.com',
-                password_hash=generate_password_hash('password'),
+                password_hash=password_hash,
                 first_name=f'Patient{i}',
                 last_name=f'LastName{i}',
                 phone=f'+21352{i}000000',
@@ -176,11 +187,27 @@ def seed_database():
         # Today's date
         today = datetime.now().date()
         
+        # Slots already given out per (doctor, date): two appointments that
+        # are not cancelled may not share a slot (uq_appointments_active_slot)
+        taken_slots = {}
+        slot_starts = range(9 * 60, 17 * 60, DEFAULT_SLOT_MINUTES)
+        
+        def pick_slot(appointment_date):
+            """Pick a random doctor and one of their free slots on a date"""
+            while True:
+                doctor = random.choice(doctors)
+                taken = taken_slots.setdefault((doctor.id, appointment_date), set())
+                free = [start for start in slot_starts if start not in taken]
+                if free:
+                    start = random.choice(free)
+                    taken.add(start)
+                    return doctor, from_minutes(start), from_minutes(start + DEFAULT_SLOT_MINUTES)
+        
         # Create some past appointments
         past_appointments = []
         for _ in range(15):
             appointment_date = today - timedelta(days=random.randint(1, 30))
-            doctor = random.choice(doctors)
+            doctor, start_time, end_time = pick_slot(appointment_date)
             patient = random.choice(patients)
             
             # Create a completed appointment
@@ -188,8 +215,8 @@ def seed_database():
                 patient_id=patient.id,
                 doctor_id=doctor.id,
                 appointment_date=appointment_date,
-                start_time=time(9 + random.randint(0, 7), 0),
-                end_time=time(10 + random.randint(0, 7), 0),
+                start_time=start_time,
+                end_time=end_time,
                 status=AppointmentStatus.COMPLETED,
                 reason=random.choice(appointment_reasons),
                 notes=f'Appointment completed on {appointment_date}',
@@ -216,7 +243,7 @@ def seed_database():
         # Create today's appointments
         today_appointments = []
         for _ in range(5):
-            doctor = random.choice(doctors)
+            doctor, start_time, end_time = pick_slot(today)
             patient = random.choice(patients)
             
             # Create appointment for today
@@ -224,8 +251,8 @@ def seed_database():
                 patient_id=patient.id,
                 doctor_id=doctor.id,
                 appointment_date=today,
-                start_time=time(9 + random.randint(0, 7), 0),
-                end_time=time(10 + random.randint(0, 7), 0),
+                start_time=start_time,
+                end_time=end_time,
                 status=random.choice([AppointmentStatus.CONFIRMED, AppointmentStatus.PENDING]),
                 reason=random.choice(appointment_reasons),
                 notes=f'Today\'s appointment',
@@ -253,7 +280,7 @@ def seed_database():
         future_appointments = []
         for _ in range(10):
             appointment_date = today + timedelta(days=random.randint(1, 14))
-            doctor = random.choice(doctors)
+            doctor, start_time, end_time = pick_slot(appointment_date)
             patient = random.choice(patients)
             
             # Create a future appointment
@@ -261,8 +288,8 @@ def seed_database():
                 patient_id=patient.id,
                 doctor_id=doctor.id,
                 appointment_date=appointment_date,
-                start_time=time(9 + random.randint(0, 7), 0),
-                end_time=time(10 + random.randint(0, 7), 0),
+                start_time=start_time,
+                end_time=end_time,
                 status=random.choice([AppointmentStatus.CONFIRMED, AppointmentStatus.PENDING]),
                 reason=random.choice(appointment_reasons),
                 notes=f'Future appointment scheduled for {appointment_date}',
@@ -290,7 +317,7 @@ def seed_database():
         cancelled_appointments = []
         for _ in range(3):
             appointment_date = today + timedelta(days=random.randint(-10, 10))
-            doctor = random.choice(doctors)
+            doctor, start_time, end_time = pick_slot(appointment_date)
             patient = random.choice(patients)
             
             # Create a cancelled appointment
@@ -298,8 +325,8 @@ def seed_database():
                 patient_id=patient.id,
                 doctor_id=doctor.id,
                 appointment_date=appointment_date,
-                start_time=time(9 + random.randint(0, 7), 0),
-                end_time=time(10 + random.randint(0, 7), 0),
+                start_time=start_time,
+                end_time=end_time,
                 status=AppointmentStatus.CANCELLED,
                 reason=random.choice(appointment_reasons),
                 notes=f'Appointment cancelled',
@@ -323,6 +350,9 @@ def seed_database():
         db.session.commit()
         print(f"Created {len(cancelled_appointments)} cancelled appointments.")
         
+        # Notifications were added directly, so bring the unread counters in line
+        reconcile_unread_counts()
+        
         # Print summary
         print("\nDatabase Seeding Summary:")
         print(f"Created {len(doctors)} doctors")
@@ -21,9 +21,32 @@ class AppointmentStatus(enum.Enum):
     CANCELLED = "cancelled"
     COMPLETED = "completed"
 
+class AvailabilityExceptionType(enum.Enum):
+    CLOSED = "closed"  # No appointments on the whole date
+    BLOCKED = "blocked"  # No appointments between start_time and end_time
+    EXTRA = "extra"  # Available between start_time and end_time besides the weekly hours
+
+class EmailStatus(enum.Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+class SmsStatus(enum.Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    DELIVERED = "delivered"
+    UNDELIVERED = "undelivered"
+    FAILED = "failed"
+
 class User(db.Model, UserMixin):
     """Base user model for both patients and doctors."""
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_email_verification_token', 'email_verification_token'),
+        db.Index('ix_users_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -46,6 +69,9 @@ class User(db.Model, UserMixin):
     email_verification_token = db.Column(db.String(100))
     email_verification_sent_at = db.Column(db.DateTime)
     
+    # Denormalized count of unread notifications, maintained with every insert/read
+    unread_notification_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relationship with specific user type
     patient = db.relationship('Patient', backref='user', uselist=False, cascade='all, delete-orphan')
     doctor = db.relationship('Doctor', backref='user', uselist=False, cascade='all, delete-orphan')
@@ -73,13 +99,48 @@ class Patient(db.Model):
     def __repr__(self):
         return f'<Patient {self.user.first_name} {self.user.last_name}>'
 
+# Association between doctors and the languages they speak
+doctor_languages = db.Table(
+    'doctor_languages',
+    db.Column('doctor_id', db.Integer, db.ForeignKey('doctors.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('language_id', db.Integer, db.ForeignKey('languages.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_doctor_languages_language_doctor', 'language_id', 'doctor_id')
+)
+
+class Specialty(db.Model):
+    """Canonical medical specialty."""
+    __tablename__ = 'specialties'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    normalized_name = db.Column(db.String(100), unique=True, nullable=False)
+    
+    def __repr__(self):
+        return f'<Specialty {self.name}>'
+
+class Language(db.Model):
+    """Canonical spoken language."""
+    __tablename__ = 'languages'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), nullable=False)
+    normalized_name = db.Column(db.String(50), unique=True, nullable=False)
+    
+    def __repr__(self):
+        return f'<Language {self.name}>'
+
 class Doctor(db.Model):
     """Doctor-specific information with credential verification."""
     __tablename__ = 'doctors'
+    __table_args__ = (
+        db.Index('ix_doctors_specialty_status', 'specialty_id', 'verification_status'),
+        db.Index('ix_doctors_verification_status', 'verification_status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     specialty = db.Column(db.String(100))
+    specialty_id = db.Column(db.Integer, db.ForeignKey('specialties.id'))
     license_number = db.Column(db.String(50), unique=True, nullable=False)
     years_of_experience = db.Column(db.Integer)
     education = db.Column(db.Text)
@@ -89,7 +150,7 @@ class Doctor(db.Model):
     
     # Profile information
     location = db.Column(db.String(255))
-    languages = db.Column(db.String(255))  # Comma-separated list of languages
+    languages = db.Column(db.String(255))  # Comma-separated list of languages, as entered
     consultation_fee = db.Column(db.Float)
     profile_picture = db.Column(db.String(255))
     
@@ -100,6 +161,9 @@ class Doctor(db.Model):
     # Relationships
     availability = db.relationship('DoctorAvailability', backref='doctor', lazy=True, cascade='all, delete-orphan')
     appointments = db.relationship('Appointment', backref='doctor', lazy=True, cascade='all, delete-orphan')
+    specialty_ref = db.relationship('Specialty', backref=db.backref('doctors', lazy=True))
+    language_list = db.relationship('Language', secondary=doctor_languages, lazy='selectin',
+                                    backref=db.backref('doctors', lazy=True))
     
     def __repr__(self):
         return f'<Doctor {self.user.first_name} {self.user.last_name}>'
@@ -107,6 +171,9 @@ class Doctor(db.Model):
 class DoctorAvailability(db.Model):
     """Doctor's available consultation times."""
     __tablename__ = 'doctor_availability'
+    __table_args__ = (
+        db.Index('ix_doctor_availability_doctor_day', 'doctor_id', 'day_of_week', 'is_available'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
@@ -120,6 +187,43 @@ class DoctorAvailability(db.Model):
         day_name = days[self.day_of_week]
         return f'<Availability: {day_name}, {self.start_time.strftime("%H:%M")} - {self.end_time.strftime("%H:%M")}>'
 
+class AvailabilityException(db.Model):
+    """Change to a doctor's weekly availability on one date: a closure, a blocked period or extra hours."""
+    __tablename__ = 'availability_exceptions'
+    __table_args__ = (
+        db.Index('ix_availability_exceptions_doctor_date', 'doctor_id', 'exception_date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id', ondelete='CASCADE'), nullable=False)
+    exception_date = db.Column(db.Date, nullable=False)
+    kind = db.Column(db.Enum(AvailabilityExceptionType), nullable=False)
+    start_time = db.Column(db.Time)  # Not set for CLOSED
+    end_time = db.Column(db.Time)
+    reason = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AvailabilityException {self.kind.name} for Doctor {self.doctor_id} on {self.exception_date}>'
+
+class DoctorSlot(db.Model):
+    """A bookable slot of a doctor on a date, materialized from the weekly availability."""
+    __tablename__ = 'doctor_slots'
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'slot_date', 'start_time', name='uq_doctor_slots_slot'),
+        db.Index('ix_doctor_slots_doctor_booked_date', 'doctor_id', 'is_booked', 'slot_date', 'start_time'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id', ondelete='CASCADE'), nullable=False)
+    slot_date = db.Column(db.Date, nullable=False)
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    is_booked = db.Column(db.Boolean, nullable=False, default=False)
+    
+    def __repr__(self):
+        return f'<DoctorSlot Doctor {self.doctor_id} on {self.slot_date} at {self.start_time}>'
+
 class VerificationDocument(db.Model):
     """Documents uploaded by doctors for verification."""
     __tablename__ = 'verification_documents'
@@ -139,6 +243,15 @@ class VerificationDocument(db.Model):
 class Appointment(db.Model):
     """Appointment booking between patients and doctors."""
     __tablename__ = 'appointments'
+    __table_args__ = (
+        db.Index('ix_appointments_doctor_date_status', 'doctor_id', 'appointment_date', 'status'),
+        db.Index('ix_appointments_patient_date', 'patient_id', 'appointment_date'),
+        # A slot can be taken by only one appointment that is not cancelled
+        db.Index('uq_appointments_active_slot', 'doctor_id', 'appointment_date', 'start_time',
+                 unique=True,
+                 sqlite_where=db.text("status != 'CANCELLED'"),
+                 postgresql_where=db.text("status != 'CANCELLED'")),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
@@ -155,9 +268,33 @@ class Appointment(db.Model):
     def __repr__(self):
         return f'<Appointment {self.id}: Patient {self.patient_id} with Doctor {self.doctor_id} on {self.appointment_date}>'
 
+class AppointmentHold(db.Model):
+    """Short-lived reservation of a slot while a patient confirms the booking."""
+    __tablename__ = 'appointment_holds'
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'appointment_date', 'start_time', name='uq_appointment_holds_slot'),
+        db.Index('ix_appointment_holds_patient', 'patient_id'),
+        db.Index('ix_appointment_holds_expires_at', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id', ondelete='CASCADE'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id', ondelete='CASCADE'), nullable=False)
+    appointment_date = db.Column(db.Date, nullable=False)
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AppointmentHold Doctor {self.doctor_id} on {self.appointment_date} at {self.start_time} for Patient {self.patient_id}>'
+
 class Notification(db.Model):
     """Notifications for users."""
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_read_created', 'user_id', 'is_read', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -168,3 +305,75 @@ class Notification(db.Model):
     
     def __repr__(self):
         return f'<Notification {self.id} for User {self.user_id}>'
+
+class NotificationArchive(db.Model):
+    """Read notifications moved out of the live table by the retention job."""
+    __tablename__ = 'notification_archive'
+    __table_args__ = (
+        db.Index('ix_notification_archive_user_created', 'user_id', 'created_at'),
+        db.Index('ix_notification_archive_notification', 'notification_id'),
+    )
+    
+    # Own key: notification IDs can be reused once the highest rows are deleted
+    # (SQLite without AUTOINCREMENT), so the original ID is kept only as data.
+    # No foreign keys, so that archived rows never hold up deleting a user.
+    id = db.Column(db.Integer, primary_key=True)
+    notification_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(100), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<NotificationArchive {self.id} of Notification {self.notification_id} for User {self.user_id}>'
+
+class EmailOutbox(db.Model):
+    """Outgoing emails waiting to be delivered by the mail worker."""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recipients = db.Column(db.Text, nullable=False)  # Comma-separated addresses
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text)
+    status = db.Column(db.Enum(EmailStatus), nullable=False, default=EmailStatus.PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} to {self.recipients} ({self.status.name})>'
+
+class SmsOutbox(db.Model):
+    """Outgoing text messages and their delivery status."""
+    __tablename__ = 'sms_outbox'
+    __table_args__ = (
+        db.Index('ix_sms_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+        db.Index('ix_sms_outbox_provider_message', 'provider', 'provider_message_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    phone = db.Column(db.String(20), nullable=False)
+    body = db.Column(db.String(640), nullable=False)
+    provider = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.Enum(SmsStatus), nullable=False, default=SmsStatus.PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    provider_message_id = db.Column(db.String(100))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    delivered_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<SmsOutbox {self.id} to {self.phone} ({self.status.name})>'
@@ -0,0 +1,159 @@
+"""
+Password hashing for the Health Appointment System.
+
+All password hashes are created and checked here, with the method set by
+``PASSWORD_HASH_METHOD``: ``bcrypt`` (cost ``BCRYPT_LOG_ROUNDS``) or any
+Werkzeug method such as ``pbkdf2:sha256:600000``.
+Existing hashes of either family keep working. ``check_and_upgrade`` rehashes
+a password at login whenever its stored hash was made with other settings,
+so changing the configuration upgrades accounts as their owners log in.
+
+Hashing is deliberately slow. Both bcrypt and hashlib release the GIL while
+they work, so with threaded workers other requests keep running; at most
+``PASSWORD_HASH_CONCURRENCY`` hashes run at once per process so that a burst
+of logins cannot take every CPU. Use ``python manage_db.py benchmark_password_hash``
+to pick a cost that fits the login latency target on the host.
+"""
+
+import os
+import statistics
+import threading
+import time as _time
+
+import bcrypt
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# bcrypt only uses the first 72 bytes of a password
+BCRYPT_MAX_PASSWORD_BYTES = 72
+
+_hash_slots = None
+_hash_slots_lock = threading.Lock()
+_prefix_cache = {}  # Werkzeug method -> prefix of the hashes it writes
+
+
+def _slots():
+    """Semaphore capping concurrent hash computations in this process."""
+    global _hash_slots
+    with _hash_slots_lock:
+        if _hash_slots is None:
+            limit = current_app.config.get('PASSWORD_HASH_CONCURRENCY') or os.cpu_count() or 1
+            _hash_slots = threading.BoundedSemaphore(limit)
+        return _hash_slots
+
+
+def _configured_method():
+    return current_app.config.get('PASSWORD_HASH_METHOD', 'bcrypt')
+
+
+def _bcrypt_rounds():
+    return current_app.config.get('BCRYPT_LOG_ROUNDS', 12)
+
+
+def _bcrypt_bytes(password):
+    return password.encode('utf-8')[:BCRYPT_MAX_PASSWORD_BYTES]
+
+
+def _as_text(password_hash):
+    if isinstance(password_hash, bytes):
+        return password_hash.decode('utf-8')
+    return password_hash or ''
+
+
+def is_bcrypt_hash(password_hash):
+    return _as_text(password_hash).startswith(('$2a$', '$2b$', '$2y$'))
+
+
+def hash_with(password, method, rounds=None):
+    """
+    Hash a password with an explicit method, bypassing the configuration.
+
+    Args:
+        password: The plain-text password
+        method: 'bcrypt' or a Werkzeug method string
+        rounds: bcrypt cost; required when method is 'bcrypt'
+
+    Returns:
+        The hash as a string
+    """
+    if method == 'bcrypt':
+        return bcrypt.hashpw(_bcrypt_bytes(password), bcrypt.gensalt(rounds)).decode('utf-8')
+    return generate_password_hash(password, method)
+
+
+def hash_password(password):
+    """Hash a password with the configured method and cost."""
+    with _slots():
+        return hash_with(password, _configured_method(), _bcrypt_rounds())
+
+
+def verify_password(password_hash, password):
+    """
+    Check a password against a stored hash of any supported method.
+
+    Returns:
+        True if the password matches
+    """
+    password_hash = _as_text(password_hash)
+    if not password_hash or not password:
+        return False
+    with _slots():
+        if is_bcrypt_hash(password_hash):
+            try:
+                return bcrypt.checkpw(_bcrypt_bytes(password), password_hash.encode('utf-8'))
+            except ValueError:
+                return False
+        return check_password_hash(password_hash, password)
+
+
+def _werkzeug_prefix(method):
+    """The 'method:params' prefix Werkzeug writes for a method, defaults filled in."""
+    return generate_password_hash('', method, salt_length=1).split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    """Check whether a stored hash was made with other settings than the configured ones."""
+    password_hash = _as_text(password_hash)
+    method = _configured_method()
+    if method == 'bcrypt':
+        if not is_bcrypt_hash(password_hash):
+            return True
+        return int(password_hash.split('$')[2]) != _bcrypt_rounds()
+
+    if is_bcrypt_hash(password_hash):
+        return True
+    if method not in _prefix_cache:
+        _prefix_cache[method] = _werkzeug_prefix(method)
+    return password_hash.split('$', 1)[0] != _prefix_cache[method]
+
+
+def check_and_upgrade(user, password):
+    """
+    Check a user's password and rehash it with the current settings if needed.
+
+    The new hash is only set on the user; the caller commits it.
+
+    Returns:
+        True if the password matches
+    """
+    if not verify_password(user.password_hash, password):
+        return False
+    if needs_rehash(user.password_hash):
+        user.password_hash = hash_password(password)
+    return True
+
+
+def benchmark(method, rounds=None, samples=5):
+    """
+    Time hashing one password with a method and cost.
+
+    Returns:
+        A (median seconds per hash, hashes per second per core) tuple
+    """
+    timings = []
+    for _ in range(samples):
+        start = _time.perf_counter()
+        hash_with('benchmark-password', method, rounds)
+        timings.append(_time.perf_counter() - start)
+    median = statistics.median(timings)
+    return median, 1 / median
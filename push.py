@@ -0,0 +1,252 @@
+"""
+Server-pushed notification events for the Health Appointment System.
+
+Each open tab keeps one Server-Sent Events stream to ``main.notification_stream``.
+When a notification is created for a user, the code that created it calls
+``publish_unread_count`` after committing, and every stream of that user
+receives the new unread count immediately.
+
+Every open stream holds one thread of a threaded gunicorn worker (see the
+Procfile) until it ends, and a closed tab is only noticed at the next write,
+so streams are not free. A process serves at most
+``NOTIFICATION_STREAMS_PER_PROCESS`` streams at once, which must stay well
+below ``GUNICORN_THREADS`` so ordinary requests always find a thread; further
+tabs are turned away with 204 No Content and fall back to polling
+``main.unread_notifications_count``. A stream holds no database connection,
+only its thread, so the site pushes to ``WEB_CONCURRENCY`` times
+``NOTIFICATION_STREAMS_PER_PROCESS`` tabs at once (4 x 250 = 1000 with the
+defaults); raise ``WEB_CONCURRENCY`` for more.
+
+On PostgreSQL the ID of the user is published with ``pg_notify`` on the
+request's own connection, and every process runs a listener thread that reads
+the count, on its own connection, only for the users it has streams for, so
+a notification reaches the user's tabs whichever process serves them. On
+other databases (SQLite in development, a single process) events stay
+in-process.
+"""
+
+import json
+import logging
+import queue
+import select
+import threading
+import time as _time
+
+from flask import current_app
+from sqlalchemy import text
+from models import db, User
+
+logger = logging.getLogger(__name__)
+
+# Seconds between keep-alive comments on an idle stream; a write is what
+# reveals a closed tab and frees its thread
+HEARTBEAT_INTERVAL = 10
+
+# Streams are closed after this many seconds; the browser reconnects on its own
+MAX_STREAM_SECONDS = 300
+
+# Milliseconds the browser waits before reconnecting a closed stream
+RECONNECT_DELAY_MS = 3000
+
+# Events kept per subscriber before the oldest is dropped
+MAX_PENDING_EVENTS = 20
+
+# PostgreSQL channel carrying unread counts between processes
+NOTIFY_CHANNEL = 'unread_counts'
+
+# Seconds before the listener reconnects after losing its connection
+LISTEN_RETRY_DELAY = 5
+
+
+class NotificationBroker:
+    """Fan-out of notification events to the open streams of each user."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # user_id -> set of queues
+        self._streams = 0
+
+    def subscribe(self, user_id, max_streams=None):
+        """
+        Register a new stream for a user.
+
+        Returns:
+            The stream's event queue, or None if max_streams streams are already open
+        """
+        events = queue.Queue(maxsize=MAX_PENDING_EVENTS)
+        with self._lock:
+            if max_streams is not None and self._streams >= max_streams:
+                return None
+            self._subscribers.setdefault(user_id, set()).add(events)
+            self._streams += 1
+        return events
+
+    def unsubscribe(self, user_id, events):
+        """Remove a stream's queue once the client has gone away."""
+        with self._lock:
+            streams = self._subscribers.get(user_id)
+            if streams is None or events not in streams:
+                return
+            streams.discard(events)
+            self._streams -= 1
+            if not streams:
+                del self._subscribers[user_id]
+
+    def stream_count(self):
+        with self._lock:
+            return self._streams
+
+    def has_subscribers(self, user_id):
+        with self._lock:
+            return bool(self._subscribers.get(user_id))
+
+    def publish(self, user_id, event):
+        """Send an event to every open stream of a user."""
+        with self._lock:
+            streams = list(self._subscribers.get(user_id, ()))
+        for events in streams:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                # Slow consumer: drop the oldest event, the latest count wins anyway
+                try:
+                    events.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    events.put_nowait(event)
+                except queue.Full:
+                    pass
+
+
+broker = NotificationBroker()
+
+_listener_lock = threading.Lock()
+_listener = None
+
+
+def _shared():
+    """Check whether events go through PostgreSQL to the streams of every process."""
+    return db.engine.dialect.name == 'postgresql'
+
+
+def count_unread(user_id):
+    """Read a user's unread notification counter."""
+    count = db.session.query(User.unread_notification_count).filter(User.id == user_id).scalar()
+    return count or 0
+
+
+def publish_unread_count(user_id):
+    """
+    Push a user's current unread notification count to their open streams.
+
+    Call after the transaction that created or read the notifications has
+    been committed. Nothing is counted here: on PostgreSQL the listeners
+    count for the users they stream to, elsewhere nothing is queried when
+    the user has no open stream in this process.
+
+    Args:
+        user_id: The ID of the user whose notifications changed
+    """
+    if _shared():
+        # Delivered to the listeners when this short transaction commits
+        db.session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                           {'channel': NOTIFY_CHANNEL, 'payload': str(user_id)})
+        db.session.commit()
+        return
+    if not broker.has_subscribers(user_id):
+        return
+    broker.publish(user_id, {'count': count_unread(user_id)})
+
+
+def _listener_count(pg, user_id):
+    """Read a user's unread counter on the listener's own connection."""
+    cursor = pg.cursor()
+    cursor.execute('SELECT unread_notification_count FROM users WHERE id = %s', (user_id,))
+    row = cursor.fetchone()
+    return (row[0] or 0) if row else 0
+
+
+def _listen(app):
+    """Relay the changes published by every process to this process's streams."""
+    while True:
+        connection = None
+        try:
+            with app.app_context():
+                # A connection of its own, outside the pool, for as long as the process runs
+                connection = db.engine.raw_connection()
+                connection.detach()
+            pg = connection.driver_connection
+            pg.autocommit = True
+            pg.cursor().execute(f'LISTEN {NOTIFY_CHANNEL}')
+            while True:
+                if select.select([pg], [], [], MAX_STREAM_SECONDS) == ([], [], []):
+                    continue
+                pg.poll()
+                # Count once per user however many changes arrived together
+                user_ids = {int(notify.payload) for notify in pg.notifies}
+                pg.notifies.clear()
+                for user_id in user_ids:
+                    if broker.has_subscribers(user_id):
+                        broker.publish(user_id, {'count': _listener_count(pg, user_id)})
+        except Exception as e:
+            logger.error(f"Notification listener failed, reconnecting: {e}")
+            if connection is not None:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            _time.sleep(LISTEN_RETRY_DELAY)
+
+
+def _ensure_listener(app):
+    global _listener
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, args=(app,), name='notification-listener', daemon=True)
+            _listener.start()
+
+
+def open_stream(user_id):
+    """
+    Register a stream for a user if this process can serve one more.
+
+    Returns:
+        The stream's event queue for stream_events, or None if the process
+        already serves NOTIFICATION_STREAMS_PER_PROCESS streams
+    """
+    if _shared():
+        _ensure_listener(current_app._get_current_object())
+    return broker.subscribe(user_id, current_app.config.get('NOTIFICATION_STREAMS_PER_PROCESS', 50))
+
+
+def format_event(event, name='unread'):
+    """Serialize an event in the text/event-stream wire format."""
+    return f"event: {name}\ndata: {json.dumps(event)}\n\n"
+
+
+def stream_events(user_id, events, initial_count):
+    """
+    Generate the Server-Sent Events stream of one client.
+
+    Args:
+        user_id: The ID of the user the stream belongs to
+        events: The stream's event queue from open_stream
+        initial_count: Unread count sent as soon as the stream opens
+
+    Yields:
+        Chunks of the text/event-stream response body
+    """
+    deadline = _time.monotonic() + MAX_STREAM_SECONDS
+    try:
+        yield f"retry: {RECONNECT_DELAY_MS}\n"
+        yield format_event({'count': initial_count})
+        while _time.monotonic() < deadline:
+            try:
+                event = events.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(user_id, events)
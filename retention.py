@@ -0,0 +1,160 @@
+"""
+Notification retention for the Health Appointment System.
+
+Read notifications older than ``NOTIFICATION_RETENTION_DAYS`` are moved out of
+the live ``notifications`` table, either into the ``notification_archive``
+table or into a gzip-compressed JSONL file. Unread notifications are never
+touched, so the per-user unread counters stay correct.
+
+Rows are moved in batches of ``NOTIFICATION_ARCHIVE_BATCH_SIZE``, each batch
+in its own short transaction, with a pause in between that is longer during
+``BUSINESS_HOURS`` so the job never holds locks on the table for long while
+the site is busy.
+"""
+
+import gzip
+import json
+import time as _time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert, select
+from models import db, Notification, NotificationArchive
+
+ARCHIVED_COLUMNS = ('id', 'user_id', 'title', 'message', 'created_at')
+
+
+def parse_business_hours(value):
+    """
+    Parse a "start-end" hours range such as "8-18".
+
+    Returns:
+        A (start_hour, end_hour) tuple, or None if the value is empty or malformed
+    """
+    try:
+        start, end = (int(part) for part in value.split('-', 1))
+    except (AttributeError, ValueError):
+        return None
+    if not (0 <= start <= 24 and 0 <= end <= 24):
+        return None
+    return start, end
+
+
+def in_business_hours(now=None):
+    """Check whether the local time falls within the configured business hours."""
+    hours = parse_business_hours(current_app.config.get('BUSINESS_HOURS', '8-18'))
+    if hours is None:
+        return False
+    hour = (now or datetime.now()).hour
+    start, end = hours
+    if start <= end:
+        return start <= hour < end
+    # Ranges such as "22-6" wrap around midnight
+    return hour >= start or hour < end
+
+
+def _batch_pause():
+    if in_business_hours():
+        return current_app.config.get('NOTIFICATION_ARCHIVE_BUSINESS_PAUSE', 2)
+    return current_app.config.get('NOTIFICATION_ARCHIVE_PAUSE', 0.1)
+
+
+def _next_batch_ids(cutoff, after_id, batch_size):
+    """IDs of the next batch of archivable notifications, in ID order."""
+    return db.session.execute(
+        select(Notification.id).where(
+            Notification.is_read == True,
+            Notification.created_at < cutoff,
+            Notification.id > after_id
+        ).order_by(Notification.id).limit(batch_size)
+    ).scalars().all()
+
+
+def _archive_to_table(ids):
+    columns = [getattr(Notification, name) for name in ARCHIVED_COLUMNS]
+    # The archive has its own IDs; the notification's ID goes to notification_id
+    targets = ['notification_id' if name == 'id' else name for name in ARCHIVED_COLUMNS]
+    db.session.execute(
+        insert(NotificationArchive).from_select(
+            targets, select(*columns).where(Notification.id.in_(ids))
+        )
+    )
+
+
+def _archive_to_file(ids, archive_file):
+    rows = db.session.execute(
+        select(*[getattr(Notification, name) for name in ARCHIVED_COLUMNS])
+        .where(Notification.id.in_(ids))
+        .order_by(Notification.id)
+    ).all()
+    for row in rows:
+        record = dict(row._mapping)
+        if record['created_at'] is not None:
+            record['created_at'] = record['created_at'].isoformat()
+        archive_file.write(json.dumps(record) + '\n')
+    # Make sure the rows are on disk before they are deleted from the database
+    archive_file.flush()
+
+
+def archive_notifications(older_than_days=None, batch_size=None, archive_path=None,
+                          max_batches=None, dry_run=False):
+    """
+    Move old read notifications out of the live table in bounded batches.
+
+    Args:
+        older_than_days: Age in days after which read notifications are archived;
+            defaults to NOTIFICATION_RETENTION_DAYS
+        batch_size: Rows moved per transaction; defaults to NOTIFICATION_ARCHIVE_BATCH_SIZE
+        archive_path: Optional path of a .jsonl.gz file to append to instead of
+            the notification_archive table
+        max_batches: Optional limit on the number of batches in this run
+        dry_run: Only count the notifications that would be archived
+
+    Returns:
+        The number of notifications archived (or that would be archived)
+    """
+    config = current_app.config
+    if older_than_days is None:
+        older_than_days = config.get('NOTIFICATION_RETENTION_DAYS', 90)
+    if batch_size is None:
+        batch_size = config.get('NOTIFICATION_ARCHIVE_BATCH_SIZE', 500)
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+
+    if dry_run:
+        return Notification.query.filter(
+            Notification.is_read == True,
+            Notification.created_at < cutoff
+        ).count()
+
+    archive_file = gzip.open(archive_path, 'at', encoding='utf-8') if archive_path else None
+    archived = 0
+    batches = 0
+    last_id = 0
+    try:
+        while max_batches is None or batches < max_batches:
+            ids = _next_batch_ids(cutoff, last_id, batch_size)
+            if not ids:
+                break
+
+            try:
+                if archive_file:
+                    _archive_to_file(ids, archive_file)
+                else:
+                    _archive_to_table(ids)
+                Notification.query.filter(Notification.id.in_(ids)).delete(synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+            archived += len(ids)
+            batches += 1
+            last_id = ids[-1]
+            if len(ids) < batch_size:
+                break
+            _time.sleep(_batch_pause())
+    finally:
+        if archive_file:
+            archive_file.close()
+
+    return archived
@@ -1,8 +1,7 @@
 from datetime import datetime, time, timedelta
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, abort
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app, abort, Response
 from flask_login import login_required, current_user, login_user, logout_user
 from sqlalchemy import or_, and_, func, desc
-from werkzeug.security import generate_password_hash, check_password_hash
 import os
 import secrets
 from PIL import Image
@@ -10,15 +9,36 @@ import pytz
 import json
 from werkzeug.utils import secure_filename
 
-from models import User, Doctor, Patient, Appointment, DoctorAvailability, Notification, UserType, AppointmentStatus, VerificationStatus
+from models import User, Doctor, Patient, Appointment, DoctorAvailability, AvailabilityException, AvailabilityExceptionType, Notification, UserType, AppointmentStatus, VerificationStatus, VerificationDocument, SmsStatus
 from models import db
 from forms import (
-    DoctorProfileForm, DoctorAvailabilityForm, AppointmentBookingForm,
+    DoctorProfileForm, DoctorAvailabilityForm, WeeklyTemplateForm, ScheduleImportForm, AvailabilityExceptionForm,
+    AppointmentBookingForm,
     DoctorSearchForm, AppointmentCancellationForm, AppointmentRescheduleForm,
     LoginForm, ForgotPasswordForm, ResetPasswordForm, PhoneVerificationForm, ResendVerificationForm,
     PatientRegistrationForm, DoctorRegistrationForm
 )
-from utils import create_notification
+from utils import (
+    create_notification, add_notification, mark_notifications_read, get_available_slots,
+    get_available_slots_range, format_time_slot,
+    sync_doctor_lookups, generate_verification_code, generate_verification_token, send_verification_email,
+    send_verification_sms, send_password_reset_email, save_verification_document, save_profile_picture
+)
+from search import doctor_search_index, lookup_doctor_ids
+from loaders import appointment_with_doctor, appointment_with_patient, doctor_with_user
+from push import publish_unread_count, open_stream, stream_events
+from sms import update_delivery_status
+from authz import patient_required, doctor_required, admin_required
+from passwords import hash_password, check_and_upgrade
+from throttle import login_throttle
+from intervals import IntervalSet
+from booking import book_slot, hold_slot, release_holds, unavailable_intervals, SlotUnavailable
+from availability import (
+    invalidate_availability, invalidate_exceptions, invalidate_bookings,
+    get_cached_next_available_slots, MAX_RANGE_DAYS
+)
+from slot_calendar import rebuild_doctor as rebuild_slot_calendar, sync_bookings as sync_slot_calendar
+from schedules import ScheduleError, detect_format, parse_schedule, import_schedules, export_schedules
 
 # Create blueprints for different sections of the app
 main = Blueprint('main', __name__)
@@ -54,7 +74,7 @@ def register_patient():
     
     if form.validate_on_submit():
         # Create user
-        hashed_password = generate_password_hash(form.password.data)
+        hashed_password = hash_password(form.password.data)
         user = User(
             email=form.email.data,
             phone=form.phone.data,
@@ -90,7 +110,7 @@ def register_patient():
         db.session.commit()
         
         # Send verification emails and SMS
-        send_verification_email(current_app.extensions['mail'], user, email_token)
+        send_verification_email(user, email_token)
         send_verification_sms(user, phone_code)
         
         flash('Registration successful! Please verify your email and phone number.', 'success')
@@ -107,7 +127,7 @@ def register_doctor():
     
     if form.validate_on_submit():
         # Create user
-        hashed_password = generate_password_hash(form.password.data)
+        hashed_password = hash_password(form.password.data)
         user = User(
             email=form.email.data,
             phone=form.phone.data,
@@ -140,6 +160,7 @@ def register_doctor():
             bio=form.bio.data,
             verification_status=VerificationStatus.PENDING
         )
+        sync_doctor_lookups(doctor)
         
         db.session.add(doctor)
         db.session.flush()  # Get doctor ID without committing
@@ -180,7 +201,7 @@ def register_doctor():
         db.session.commit()
         
         # Send verification emails and SMS
-        send_verification_email(current_app.extensions['mail'], user, email_token)
+        send_verification_email(user, email_token)
         send_verification_sms(user, phone_code)
         
         flash('Registration successful! Please verify your email and phone number. Your account will be activated after credential verification.', 'success')
@@ -278,9 +299,19 @@ def login():
     form = LoginForm()
     
     if form.validate_on_submit():
+        # Turn away throttled clients before any database lookup or hashing
+        retry_after = login_throttle.check(request.remote_addr, form.email.data)
+        if retry_after:
+            flash(f'Too many failed login attempts. Please try again in {retry_after} seconds.', 'danger')
+            return render_template('auth/login.html', form=form), 429, {'Retry-After': str(retry_after)}
+        
         user = User.query.filter_by(email=form.email.data).first()
         
-        if user and check_password_hash(user.password_hash, form.password.data):
+        if user and check_and_upgrade(user, form.password.data):
+            # Store the rehashed password if the hashing settings changed
+            db.session.commit()
+            login_throttle.success(request.remote_addr, form.email.data)
+            
             # Check if user is active
             if not user.is_active:
                 # Check verification status
@@ -311,6 +342,7 @@ def login():
             else:
                 return redirect(next_page or url_for('doctor.dashboard'))
         else:
+            login_throttle.failure(request.remote_addr, form.email.data)
             flash('Login failed. Please check your email and password.', 'danger')
     
     return render_template('auth/login.html', form=form)
@@ -318,6 +350,10 @@ def login():
 @auth.route('/logout')
 @login_required
 def logout():
+    # Free any slot the patient was in the middle of booking
+    patient_id = current_patient_id()
+    if patient_id is not None:
+        release_holds(patient_id)
     logout_user()
     flash('You have been logged out.', 'info')
     return redirect(url_for('main.index'))
@@ -338,7 +374,7 @@ def forgot_password():
             user.email_verification_sent_at = datetime.utcnow()
             db.session.commit()
             
-            send_password_reset_email(current_app.extensions['mail'], user, token)
+            send_password_reset_email(user, token)
         
         # Always show success message to prevent email enumeration
         flash('If your email is registered, you will receive password reset instructions.', 'info')
@@ -360,7 +396,7 @@ def reset_password(token):
     form = ResetPasswordForm()
     
     if form.validate_on_submit():
-        user.password_hash = generate_password_hash(form.password.data)
+        user.password_hash = hash_password(form.password.data)
         user.email_verification_token = None
         db.session.commit()
         
@@ -372,30 +408,20 @@ def reset_password(token):
 # Patient routes
 @patient.route('/dashboard')
 @login_required
-def dashboard():
-    if current_user.user_type != UserType.PATIENT:
-        abort(403)
-    
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
-    if not patient:
-        flash('Patient profile not found.', 'danger')
-        return redirect(url_for('main.index'))
-    
+@patient_required
+def dashboard(patient):
     # Get today's date
     today = datetime.now().date()
     
     # Get upcoming appointments
-    upcoming_appointments = Appointment.query.filter(
+    upcoming_appointments = Appointment.query.options(*appointment_with_doctor()).filter(
         Appointment.patient_id == patient.id,
         Appointment.appointment_date >= today,
         Appointment.status != AppointmentStatus.CANCELLED
     ).order_by(Appointment.appointment_date, Appointment.start_time).all()
     
     # Get unread notifications count
-    unread_notifications = Notification.query.filter_by(
-        user_id=current_user.id, 
-        is_read=False
-    ).count()
+    unread_notifications = current_user.unread_notification_count
     
     return render_template(
         'patient/dashboard.html',
@@ -407,32 +433,24 @@ def dashboard():
 # Doctor routes
 @doctor.route('/dashboard')
 @login_required
-def dashboard():
-    if current_user.user_type != UserType.DOCTOR:
-        flash('Access denied. Doctor privileges required.', 'danger')
-        return redirect(url_for('main.index'))
-    
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-    
+@doctor_required
+def dashboard(doctor):
     # Get today's appointments
     today = datetime.now().date()
-    today_appointments = Appointment.query.filter_by(
+    today_appointments = Appointment.query.options(*appointment_with_patient()).filter_by(
         doctor_id=doctor.id, 
         appointment_date=today
     ).order_by(Appointment.start_time).all()
     
     # Get upcoming appointments (excluding today)
-    upcoming_appointments = Appointment.query.filter(
+    upcoming_appointments = Appointment.query.options(*appointment_with_patient()).filter(
         Appointment.doctor_id == doctor.id,
         Appointment.appointment_date > today,
         Appointment.status != AppointmentStatus.CANCELLED
     ).order_by(Appointment.appointment_date, Appointment.start_time).all()
     
     # Get unread notifications count
-    unread_notifications = Notification.query.filter_by(
-        user_id=current_user.id, 
-        is_read=False
-    ).count()
+    unread_notifications = current_user.unread_notification_count
     
     return render_template(
         'doctor/dashboard.html', 
@@ -444,17 +462,9 @@ def dashboard():
 
 @doctor.route('/profile', methods=['GET', 'POST'])
 @login_required
-def profile():
+@doctor_required
+def profile(doctor):
     """Doctor profile management."""
-    if current_user.user_type != UserType.DOCTOR:
-        flash('Access denied. Doctor privileges required.', 'danger')
-        return redirect(url_for('main.index'))
-    
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-    if not doctor:
-        flash('Doctor profile not found.', 'danger')
-        return redirect(url_for('main.index'))
-    
     form = DoctorProfileForm()
     
     if request.method == 'GET':
@@ -474,6 +484,7 @@ def profile():
         doctor.years_of_experience = form.years_of_experience.data
         doctor.education = form.education.data
         doctor.bio = form.bio.data
+        sync_doctor_lookups(doctor)
         
         try:
             doctor.consultation_fee = float(form.consultation_fee.data)
@@ -488,6 +499,7 @@ def profile():
                 doctor.profile_picture = profile_pic_path
         
         db.session.commit()
+        doctor_search_index.update_doctor(doctor)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('doctor.profile'))
     
@@ -498,17 +510,9 @@ def profile():
 
 @doctor.route('/availability', methods=['GET', 'POST'])
 @login_required
-def manage_availability():
+@doctor_required
+def manage_availability(doctor):
     """Manage doctor's available consultation times."""
-    if current_user.user_type != UserType.DOCTOR:
-        flash('Access denied. Doctor privileges required.', 'danger')
-        return redirect(url_for('main.index'))
-    
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-    if not doctor:
-        flash('Doctor profile not found.', 'danger')
-        return redirect(url_for('main.index'))
-    
     form = DoctorAvailabilityForm()
     
     if form.validate_on_submit():
@@ -528,15 +532,17 @@ def manage_availability():
             
             # Check for overlapping time slots
             day = form.day_of_week.data
-            existing_slots = DoctorAvailability.query.filter_by(
+            existing_slots = IntervalSet(db.session.query(
+                DoctorAvailability.start_time,
+                DoctorAvailability.end_time
+            ).filter_by(
                 doctor_id=doctor.id,
                 day_of_week=day
-            ).all()
+            ).all())
             
-            for slot in existing_slots:
-                if (start_time_obj < slot.end_time and end_time_obj > slot.start_time):
-                    flash('This time slot overlaps with an existing one.', 'danger')
-                    return redirect(url_for('doctor.manage_availability'))
+            if existing_slots.overlaps(start_time_obj, end_time_obj):
+                flash('This time slot overlaps with an existing one.', 'danger')
+                return redirect(url_for('doctor.manage_availability'))
             
             # Create new availability
             availability = DoctorAvailability(
@@ -549,6 +555,8 @@ def manage_availability():
             
             db.session.add(availability)
             db.session.commit()
+            invalidate_availability(doctor.id)
+            rebuild_slot_calendar(doctor.id)
             flash('Availability added successfully!', 'success')
             return redirect(url_for('doctor.manage_availability'))
             
@@ -556,24 +564,129 @@ def manage_availability():
             flash(f'Invalid time format: {str(e)}', 'danger')
     
     # Get all availabilities for display
-    availabilities = DoctorAvailability.query.filter_by(doctor_id=doctor.id).all()
+    availabilities = DoctorAvailability.query.filter_by(doctor_id=doctor.id).order_by(
+        DoctorAvailability.day_of_week, DoctorAvailability.start_time
+    ).all()
     days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
     
-    return render_template('doctor/availability.html', form=form, availabilities=availabilities, days=days)
+    # Fill the weekly template with the current windows
+    template_form = WeeklyTemplateForm(prefix='template')
+    for day, field in enumerate(template_form.day_fields()):
+        field.data = format_time_ranges(
+            (availability.start_time, availability.end_time)
+            for availability in availabilities if availability.day_of_week == day
+        )
+    
+    return render_template('doctor/availability.html', form=form, template_form=template_form,
+                           import_form=ScheduleImportForm(prefix='import'),
+                           availabilities=availabilities, days=days)
 
-@doctor.route('/availability/delete/<int:availability_id>', methods=['POST'])
+@doctor.route('/availability/template', methods=['POST'])
 @login_required
-def delete_availability(availability_id):
-    """Delete a doctor's availability time slot."""
-    if current_user.user_type != UserType.DOCTOR:
-        flash('Access denied. Doctor privileges required.', 'danger')
-        return redirect(url_for('main.index'))
+@doctor_required
+def apply_availability_template(doctor):
+    """Set the availability of every day of the week in one request."""
+    form = WeeklyTemplateForm(prefix='template')
+    if not form.validate_on_submit():
+        flash('The weekly template could not be applied. Please try again.', 'danger')
+        return redirect(url_for('doctor.manage_availability'))
     
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-    if not doctor:
-        flash('Doctor profile not found.', 'danger')
-        return redirect(url_for('main.index'))
+    days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+    replace = form.replace_existing.data
+    
+    # Windows already set for each day, unless the template replaces them
+    windows_by_day = {day: IntervalSet() for day in range(7)}
+    if not replace:
+        for day, start_time, end_time in db.session.query(
+            DoctorAvailability.day_of_week,
+            DoctorAvailability.start_time,
+            DoctorAvailability.end_time
+        ).filter_by(doctor_id=doctor.id):
+            windows_by_day[day].add(start_time, end_time)
+    
+    new_windows = []
+    for day, field in enumerate(form.day_fields()):
+        try:
+            time_ranges = parse_time_ranges(field.data)
+        except ValueError as e:
+            flash(f'{days[day]}: {e}', 'danger')
+            return redirect(url_for('doctor.manage_availability'))
+        
+        for start_time, end_time in time_ranges:
+            if windows_by_day[day].overlaps(start_time, end_time):
+                flash(f'{days[day]}: {format_time_slot((start_time, end_time))} overlaps with another window.', 'danger')
+                return redirect(url_for('doctor.manage_availability'))
+            windows_by_day[day].add(start_time, end_time)
+            new_windows.append(DoctorAvailability(
+                doctor_id=doctor.id,
+                day_of_week=day,
+                start_time=start_time,
+                end_time=end_time,
+                is_available=True
+            ))
     
+    if replace:
+        DoctorAvailability.query.filter_by(doctor_id=doctor.id).delete(synchronize_session=False)
+    db.session.add_all(new_windows)
+    db.session.commit()
+    invalidate_availability(doctor.id)
+    rebuild_slot_calendar(doctor.id)
+    
+    flash(f'Weekly availability updated: {len(new_windows)} time windows saved.', 'success')
+    return redirect(url_for('doctor.manage_availability'))
+
+@doctor.route('/availability/import', methods=['POST'])
+@login_required
+@doctor_required
+def import_availability(doctor):
+    """Import the doctor's weekly availability from a CSV or JSON schedule file."""
+    form = ScheduleImportForm(prefix='import')
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, 'danger')
+        return redirect(url_for('doctor.manage_availability'))
+    
+    upload = form.schedule_file.data
+    try:
+        windows, errors = parse_schedule(
+            upload.read().decode('utf-8-sig'),
+            detect_format(filename=upload.filename),
+            default_doctor_id=doctor.id
+        )
+    except (ScheduleError, UnicodeDecodeError) as e:
+        flash(f'The schedule file could not be read: {e}', 'danger')
+        return redirect(url_for('doctor.manage_availability'))
+    if not errors:
+        result = import_schedules(windows, replace=form.replace_existing.data, allowed_doctor_ids={doctor.id})
+        errors = result.errors
+    
+    if errors:
+        flash('The schedule was not imported:', 'danger')
+        for error in errors[:10]:
+            flash(error, 'danger')
+        if len(errors) > 10:
+            flash(f'... and {len(errors) - 10} more problems.', 'danger')
+    else:
+        flash(f'Weekly availability imported: {result.windows} time windows saved.', 'success')
+    return redirect(url_for('doctor.manage_availability'))
+
+@doctor.route('/availability/export')
+@login_required
+@doctor_required
+def export_availability(doctor):
+    """Download the doctor's weekly availability as a CSV or JSON schedule file."""
+    fmt = 'json' if request.args.get('format') == 'json' else 'csv'
+    output = export_schedules([doctor.id], fmt)
+    mimetype = 'application/json' if fmt == 'json' else 'text/csv'
+    return Response(output, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=availability.{fmt}'})
+
+@doctor.route('/availability/delete/<int:availability_id>', methods=['POST'])
+@login_required
+@doctor_required
+def delete_availability(availability_id, doctor):
+    """Delete a doctor's availability time slot."""
     availability = DoctorAvailability.query.get_or_404(availability_id)
     
     # Ensure the doctor can only delete their own availability
@@ -583,41 +696,190 @@ def delete_availability(availability_id):
     
     db.session.delete(availability)
     db.session.commit()
+    invalidate_availability(doctor.id)
+    rebuild_slot_calendar(doctor.id)
     flash('Availability deleted successfully!', 'success')
     return redirect(url_for('doctor.manage_availability'))
 
-# Main routes for doctor search
-@main.route('/doctors', methods=['GET', 'POST'])
-def find_doctors():
-    """Search for doctors by specialty, location, and language."""
-    form = DoctorSearchForm()
-    doctors = []
+@doctor.route('/availability/exceptions', methods=['GET', 'POST'])
+@login_required
+@doctor_required
+def availability_exceptions(doctor):
+    """Manage date-specific closures, blocked periods and extra hours."""
+    form = AvailabilityExceptionForm()
+    today = datetime.now().date()
     
-    if request.method == 'POST' and form.validate():
-        # Get search parameters
-        specialty = form.specialty.data
-        location = form.location.data
-        language = form.language.data
-        
-        # Build query
-        query = Doctor.query.filter_by(verification_status=VerificationStatus.VERIFIED)
+    if form.validate_on_submit():
+        kind = AvailabilityExceptionType(form.kind.data)
+        exception_date = form.exception_date.data
+        if exception_date < today:
+            flash('Exceptions can only be added for today or later.', 'danger')
+            return redirect(url_for('doctor.availability_exceptions'))
         
-        if specialty:
-            query = query.filter(Doctor.specialty.ilike(f'%{specialty}%'))
+        start_time_obj = end_time_obj = None
+        if kind != AvailabilityExceptionType.CLOSED:
+            if not form.start_time.data or not form.end_time.data:
+                flash('Start and end time are required unless the whole day is closed.', 'danger')
+                return redirect(url_for('doctor.availability_exceptions'))
+            start_time_obj = datetime.strptime(form.start_time.data, '%H:%M').time()
+            end_time_obj = datetime.strptime(form.end_time.data, '%H:%M').time()
+            if start_time_obj >= end_time_obj:
+                flash('End time must be after start time.', 'danger')
+                return redirect(url_for('doctor.availability_exceptions'))
         
-        if location:
-            query = query.filter(Doctor.location.ilike(f'%{location}%'))
+        exception = AvailabilityException(
+            doctor_id=doctor.id,
+            exception_date=exception_date,
+            kind=kind,
+            start_time=start_time_obj,
+            end_time=end_time_obj,
+            reason=form.reason.data or None
+        )
+        db.session.add(exception)
+        db.session.commit()
+        invalidate_exceptions(doctor.id, exception_date)
+        rebuild_slot_calendar(doctor.id)
         
-        if language:
-            query = query.filter(Doctor.languages.ilike(f'%{language}%'))
+        # Appointments already booked in the removed hours are kept
+        if kind != AvailabilityExceptionType.EXTRA:
+            affected = Appointment.query.filter(
+                Appointment.doctor_id == doctor.id,
+                Appointment.appointment_date == exception_date,
+                Appointment.status != AppointmentStatus.CANCELLED
+            )
+            if start_time_obj:
+                affected = affected.filter(
+                    Appointment.start_time < end_time_obj,
+                    Appointment.end_time > start_time_obj
+                )
+            count = affected.count()
+            if count:
+                flash(f'{count} appointment(s) already booked in this period were not cancelled.', 'warning')
         
-        doctors = query.all()
+        flash('Availability exception added successfully!', 'success')
+        return redirect(url_for('doctor.availability_exceptions'))
+    
+    exceptions = AvailabilityException.query.filter(
+        AvailabilityException.doctor_id == doctor.id,
+        AvailabilityException.exception_date >= today
+    ).order_by(AvailabilityException.exception_date, AvailabilityException.start_time).all()
+    
+    return render_template('doctor/availability_exceptions.html', form=form, exceptions=exceptions)
+
+@doctor.route('/availability/exceptions/delete/<int:exception_id>', methods=['POST'])
+@login_required
+@doctor_required
+def delete_availability_exception(exception_id, doctor):
+    """Delete one of the doctor's availability exceptions."""
+    exception = AvailabilityException.query.get_or_404(exception_id)
     
-    # For GET requests or if no search parameters, show all verified doctors
-    if not doctors and request.method == 'GET':
-        doctors = Doctor.query.filter_by(verification_status=VerificationStatus.VERIFIED).all()
+    if exception.doctor_id != doctor.id:
+        flash('You do not have permission to delete this exception.', 'danger')
+        return redirect(url_for('doctor.availability_exceptions'))
     
-    return render_template('main/find_doctors.html', form=form, doctors=doctors)
+    exception_date = exception.exception_date
+    db.session.delete(exception)
+    db.session.commit()
+    invalidate_exceptions(doctor.id, exception_date)
+    rebuild_slot_calendar(doctor.id)
+    flash('Availability exception deleted successfully!', 'success')
+    return redirect(url_for('doctor.availability_exceptions'))
+
+# Main routes for doctor search
+DOCTORS_PER_PAGE = 20
+
+# Best-matching doctors ranked by their next free slot; the rest follow in match order
+AVAILABILITY_SORT_CANDIDATES = 200
+
+@main.route('/doctors', methods=['GET', 'POST'])
+def find_doctors():
+    """Search for doctors by specialty, location, and language."""
+    # Searches are posted from the form; further pages come back as GET links
+    if request.method == 'POST':
+        form = DoctorSearchForm()
+        valid = form.validate()
+    else:
+        form = DoctorSearchForm(formdata=request.args)
+        valid = True
+    
+    # Cursor: ID of the last doctor shown on the previous page
+    after = request.args.get('after', type=int)
+    specialty = form.specialty.data
+    location = form.location.data
+    language = form.language.data
+    sort_by = form.sort_by.data
+    
+    doctors = []
+    next_cursor = None
+    now = datetime.now()
+    
+    if valid:
+        if any([specialty, location, language, sort_by]):
+            # Look up matching doctors in the search index, best match first,
+            # keeping those the lookup tables give for a canonical specialty or language
+            doctor_ids = doctor_search_index.search(specialty=specialty, location=location)
+            lookup_ids = lookup_doctor_ids(specialty=specialty, language=language)
+            if lookup_ids is not None:
+                doctor_ids = [doctor_id for doctor_id in doctor_ids if doctor_id in lookup_ids]
+            
+            if sort_by == 'availability':
+                # Earliest free slot of the best matches, cached per doctor between requests
+                candidates = doctor_ids[:AVAILABILITY_SORT_CANDIDATES]
+                candidate_slots = get_cached_next_available_slots(
+                    candidates, now.date(), (now + timedelta(days=30)).date(), not_before=now
+                )
+                # Doctors without any free slot go last
+                candidates.sort(key=lambda doctor_id: (candidate_slots[doctor_id] is None, candidate_slots[doctor_id] or ()))
+                doctor_ids = candidates + doctor_ids[AVAILABILITY_SORT_CANDIDATES:]
+            
+            # Resume after the cursor's position in the ranking; a cursor
+            # doctor that no longer matches ends the listing
+            positions = {doctor_id: position for position, doctor_id in enumerate(doctor_ids)}
+            start = 0
+            if after is not None:
+                start = positions[after] + 1 if after in positions else len(doctor_ids)
+            page_ids = doctor_ids[start:start + DOCTORS_PER_PAGE]
+            if start + DOCTORS_PER_PAGE < len(doctor_ids):
+                next_cursor = page_ids[-1]
+            
+            if page_ids:
+                doctors_by_id = {
+                    doctor.id: doctor
+                    for doctor in Doctor.query.options(*doctor_with_user()).filter(
+                        Doctor.id.in_(page_ids),
+                        Doctor.verification_status == VerificationStatus.VERIFIED
+                    ).all()
+                }
+                doctors = [doctors_by_id[doctor_id] for doctor_id in page_ids if doctor_id in doctors_by_id]
+        else:
+            # No search parameters: page through all verified doctors by ID
+            query = Doctor.query.options(*doctor_with_user()).filter(
+                Doctor.verification_status == VerificationStatus.VERIFIED
+            )
+            if after is not None:
+                query = query.filter(Doctor.id > after)
+            doctors = query.order_by(Doctor.id).limit(DOCTORS_PER_PAGE + 1).all()
+            if len(doctors) > DOCTORS_PER_PAGE:
+                doctors = doctors[:DOCTORS_PER_PAGE]
+                next_cursor = doctors[-1].id
+    
+    # Earliest free slot of every doctor on this page
+    next_slots = get_cached_next_available_slots(
+        [doctor.id for doctor in doctors],
+        now.date(),
+        (now + timedelta(days=30)).date(),
+        not_before=now
+    )
+    
+    # Search parameters carried over to the pagination links
+    search_args = {
+        key: value
+        for key, value in [('specialty', specialty), ('location', location), ('language', language), ('sort_by', sort_by)]
+        if value
+    }
+    
+    return render_template('main/find_doctors.html', form=form, doctors=doctors, next_slots=next_slots,
+                           next_cursor=next_cursor, search_args=search_args, is_first_page=after is None)
 
 @main.route('/doctor/<int:doctor_id>')
 def doctor_profile(doctor_id):
@@ -641,21 +903,21 @@ def doctor_profile(doctor_id):
 # Admin routes
 @admin.route('/dashboard')
 @login_required
+@admin_required
 def dashboard():
-    # In a real app, you would check if the user is an admin
     return render_template('admin/dashboard.html')
 
 @admin.route('/doctor-verification')
 @login_required
+@admin_required
 def doctor_verification():
-    # In a real app, you would check if the user is an admin
     doctors = Doctor.query.filter_by(verification_status=VerificationStatus.PENDING).all()
     return render_template('admin/doctor_verification.html', doctors=doctors)
 
 @admin.route('/verify-doctor/<int:doctor_id>/<action>', methods=['POST'])
 @login_required
+@admin_required
 def verify_doctor(doctor_id, action):
-    # In a real app, you would check if the user is an admin
     doctor = Doctor.query.get_or_404(doctor_id)
     
     if action == 'approve':
@@ -668,36 +930,69 @@ def verify_doctor(doctor_id, action):
         flash(f'Doctor {doctor.user.first_name} {doctor.user.last_name} has been rejected.', 'info')
     
     db.session.commit()
+    doctor_search_index.update_doctor(doctor)
     return redirect(url_for('admin.doctor_verification'))
 
 # Appointment routes
 @main.route('/book-appointment/<int:doctor_id>', methods=['GET', 'POST'])
 @login_required
-def book_appointment(doctor_id):
-    if current_user.user_type != UserType.PATIENT:
-        abort(403)
-    
+@patient_required
+def book_appointment(doctor_id, patient):
     doctor = Doctor.query.get_or_404(doctor_id)
+    form = AppointmentBookingForm()
     
-    if request.method == 'POST':
-        date = request.form.get('date')
-        time_slot = request.form.get('time_slot')
-        
-        if not all([date, time_slot]):
-            flash('Please fill all required fields', 'danger')
-            return redirect(url_for('main.book_appointment', doctor_id=doctor_id))
-        
-        # Process booking logic here
-        # ...
-        
-        return redirect(url_for('patient.dashboard'))
+    if form.validate_on_submit():
+        try:
+            start_time, end_time = parse_time_slot(form.time_slot.data)
+        except ValueError:
+            flash('Please select a valid time slot.', 'danger')
+        else:
+            try:
+                book_slot(patient, doctor, form.appointment_date.data, start_time, end_time,
+                          form.reason.data, form.notes.data or None)
+            except SlotUnavailable as e:
+                flash(f'{e} Please choose another time slot.', 'warning')
+            else:
+                flash('Appointment booked successfully.', 'success')
+                return redirect(url_for('patient.appointments'))
+    elif request.method == 'GET':
+        form.appointment_date.data = datetime.now().date()
     
-    available_slots = get_available_slots(doctor.id, datetime.now().date())
     return render_template('main/book_appointment.html',
+                         form=form,
                          doctor=doctor,
-                         available_slots=available_slots,
                          min_date=datetime.now().strftime('%Y-%m-%d'),
-                         max_date=(datetime.now() + timedelta(days=30)).strftime('%Y-%m-%d'))
+                         max_date=(datetime.now() + timedelta(days=current_app.config['BOOKING_DAYS_AHEAD'])).strftime('%Y-%m-%d'))
+
+@main.route('/hold-slot/<int:doctor_id>', methods=['POST'])
+@login_required
+@patient_required
+def hold_appointment_slot(doctor_id, patient):
+    """Hold the selected slot for the patient while they fill in the booking form."""
+    data = request.get_json(silent=True) or request.form
+    try:
+        selected_date = datetime.strptime(data.get('date', ''), '%Y-%m-%d').date()
+        start_time, end_time = parse_time_slot(data.get('time_slot', ''))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid date or time slot'}), 400
+    
+    try:
+        hold = hold_slot(patient, doctor_id, selected_date, start_time, end_time)
+    except SlotUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    
+    return jsonify({
+        'success': True,
+        'expires_at': hold.expires_at.isoformat() + 'Z'
+    })
+
+@main.route('/release-holds', methods=['POST'])
+@login_required
+@patient_required
+def release_appointment_holds(patient):
+    """Release the patient's held slots when they leave the booking form without booking."""
+    release_holds(patient.id)
+    return jsonify({'success': True})
 
 @main.route('/get-available-slots/<int:doctor_id>', methods=['GET', 'POST'])
 @login_required
@@ -707,8 +1002,12 @@ def get_available_slots_route(doctor_id):
         date_str = request.args.get('date')
         selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
         
-        # Get available slots
+        # Get available slots, leaving out those other patients are booking and
+        # those clashing with the patient's own appointments
         available_slots = get_available_slots(doctor_id, selected_date)
+        busy = unavailable_intervals(doctor_id, selected_date, selected_date, current_patient_id())
+        if selected_date in busy:
+            available_slots = [slot for slot in available_slots if not busy[selected_date].overlaps(*slot)]
         
         # Format the slots for display
         formatted_slots = [(format_time_slot(slot), format_time_slot(slot)) for slot in available_slots]
@@ -724,26 +1023,55 @@ def get_available_slots_route(doctor_id):
             'error': str(e)
         }), 500
 
+@main.route('/get-available-slots-range/<int:doctor_id>')
+@login_required
+def get_available_slots_range_route(doctor_id):
+    """Get available appointment slots for a doctor for every date in a range."""
+    try:
+        today = datetime.now().date()
+        start_str = request.args.get('start')
+        end_str = request.args.get('end')
+        start_date = datetime.strptime(start_str, '%Y-%m-%d').date() if start_str else today
+        end_date = datetime.strptime(end_str, '%Y-%m-%d').date() if end_str else start_date + timedelta(days=30)
+        
+        if end_date < start_date:
+            return jsonify({'success': False, 'error': 'End date must not be before start date'}), 400
+        if (end_date - start_date).days >= MAX_RANGE_DAYS:
+            return jsonify({'success': False, 'error': f'Date range cannot exceed {MAX_RANGE_DAYS} days'}), 400
+        
+        # Get available slots for the whole range at once
+        slots_by_date = get_available_slots_range(doctor_id, start_date, end_date)
+        busy = unavailable_intervals(doctor_id, start_date, end_date, current_patient_id())
+        
+        # Format the slots the same way as the single-date endpoint
+        days = {
+            day.strftime('%Y-%m-%d'): [
+                (format_time_slot(slot), format_time_slot(slot))
+                for slot in slots if day not in busy or not busy[day].overlaps(*slot)
+            ]
+            for day, slots in slots_by_date.items()
+        }
+        
+        return jsonify({
+            'success': True,
+            'start': start_date.strftime('%Y-%m-%d'),
+            'end': end_date.strftime('%Y-%m-%d'),
+            'days': days
+        })
+    except Exception as e:
+        current_app.logger.error(f"Error in get_available_slots_range_route: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @patient.route('/appointments')
 @login_required
-def appointments():
+@patient_required
+def appointments(patient):
     """View all patient appointments."""
-    print(f"DEBUG: appointments route called for user: {current_user.id}")
-    print(f"DEBUG: User type: {current_user.user_type}")
-    
-    if current_user.user_type != UserType.PATIENT:
-        print(f"DEBUG: User is not a patient: {current_user.user_type}")
-        flash('Access denied.', 'danger')
-        return redirect(url_for('main.index'))
-    
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
-    if not patient:
-        print(f"DEBUG: Patient profile not found for user: {current_user.id}")
-        flash('Patient profile not found.', 'danger')
-        return redirect(url_for('main.index'))
-    
     # Get all appointments for this patient
-    appointments = Appointment.query.filter_by(patient_id=patient.id).order_by(Appointment.appointment_date.desc()).all()
+    appointments = Appointment.query.options(*appointment_with_doctor()).filter_by(patient_id=patient.id).order_by(Appointment.appointment_date.desc()).all()
     print(f"DEBUG: Found {len(appointments)} appointments for patient: {patient.id}")
     
     # Group appointments by status
@@ -771,17 +1099,9 @@ def appointments():
 
 @patient.route('/cancel-appointment/<int:appointment_id>', methods=['GET', 'POST'])
 @login_required
-def cancel_appointment(appointment_id):
+@patient_required
+def cancel_appointment(appointment_id, patient):
     """Cancel an appointment."""
-    if current_user.user_type != UserType.PATIENT:
-        flash('Access denied.', 'danger')
-        return redirect(url_for('main.index'))
-    
-    patient = Patient.query.filter_by(user_id=current_user.id).first()
-    if not patient:
-        flash('Patient profile not found.', 'danger')
-        return redirect(url_for('main.index'))
-    
     appointment = Appointment.query.get_or_404(appointment_id)
     
     # Ensure the appointment belongs to this patient
@@ -800,28 +1120,22 @@ def cancel_appointment(appointment_id):
         # Update appointment status
         appointment.status = AppointmentStatus.CANCELLED
         appointment.notes = appointment.notes + "\n\nCancellation reason: " + form.reason.data if appointment.notes else "Cancellation reason: " + form.reason.data
+        sync_slot_calendar(appointment.doctor_id, appointment.appointment_date)
         db.session.commit()
+        invalidate_bookings(appointment.doctor_id, appointment.appointment_date)
         
         # Create notifications
         doctor = Doctor.query.get(appointment.doctor_id)
         doctor_user = User.query.get(doctor.user_id)
         
         patient_message = f"Your appointment with Dr. {doctor_user.last_name} on {appointment.appointment_date.strftime('%d/%m/%Y')} has been cancelled."
-        patient_notification = Notification(
-            user_id=current_user.id,
-            title="Appointment Cancelled",
-            message=patient_message
-        )
-        db.session.add(patient_notification)
+        add_notification(current_user.id, "Appointment Cancelled", patient_message)
         
         doctor_message = f"Appointment with {current_user.first_name} {current_user.last_name} on {appointment.appointment_date.strftime('%d/%m/%Y')} at {appointment.start_time.strftime('%H:%M')} has been cancelled."
-        doctor_notification = Notification(
-            user_id=doctor_user.id,
-            title="Appointment Cancelled",
-            message=doctor_message
-        )
-        db.session.add(doctor_notification)
+        add_notification(doctor_user.id, "Appointment Cancelled", doctor_message)
         db.session.commit()
+        publish_unread_count(current_user.id)
+        publish_unread_count(doctor_user.id)
         
         flash('Appointment cancelled successfully.', 'success')
         return redirect(url_for('patient.appointments'))
@@ -830,19 +1144,11 @@ def cancel_appointment(appointment_id):
 
 @doctor.route('/appointments')
 @login_required
-def doctor_appointments():
+@doctor_required
+def doctor_appointments(doctor):
     """View all doctor appointments."""
-    if current_user.user_type != UserType.DOCTOR:
-        flash('Access denied. Doctor privileges required.', 'danger')
-        return redirect(url_for('main.index'))
-    
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-    if not doctor:
-        flash('Doctor profile not found.', 'danger')
-        return redirect(url_for('main.index'))
-    
     # Get all appointments for this doctor
-    appointments = Appointment.query.filter_by(doctor_id=doctor.id).order_by(Appointment.appointment_date.desc()).all()
+    appointments = Appointment.query.options(*appointment_with_patient()).filter_by(doctor_id=doctor.id).order_by(Appointment.appointment_date.desc()).all()
     
     # Group appointments by status and date
     today_appointments = []
@@ -868,17 +1174,9 @@ def doctor_appointments():
 
 @doctor.route('/complete-appointment/<int:appointment_id>', methods=['POST'])
 @login_required
-def complete_appointment(appointment_id):
+@doctor_required
+def complete_appointment(appointment_id, doctor):
     """Mark an appointment as completed."""
-    if current_user.user_type != UserType.DOCTOR:
-        flash('Access denied. Doctor privileges required.', 'danger')
-        return redirect(url_for('main.index'))
-    
-    doctor = Doctor.query.filter_by(user_id=current_user.id).first()
-    if not doctor:
-        flash('Doctor profile not found.', 'danger')
-        return redirect(url_for('main.index'))
-    
     appointment = Appointment.query.get_or_404(appointment_id)
     
     # Ensure the appointment belongs to this doctor
@@ -900,35 +1198,169 @@ def complete_appointment(appointment_id):
     flash('Appointment marked as completed.', 'success')
     return redirect(url_for('doctor.doctor_appointments'))
 
+NOTIFICATIONS_PER_PAGE = 20
+
+def encode_notification_cursor(notification):
+    """Encode the keyset position of a notification for the inbox's 'before' parameter."""
+    return f"{notification.created_at.isoformat()},{notification.id}"
+
+def decode_notification_cursor(cursor):
+    """Decode a 'before' parameter into (created_at, id), or None if it is malformed."""
+    try:
+        created_at, notification_id = cursor.rsplit(',', 1)
+        return datetime.fromisoformat(created_at), int(notification_id)
+    except (AttributeError, ValueError):
+        return None
+
 @main.route('/notifications')
 @login_required
 def notifications():
-    """View all notifications for the current user."""
-    # Get all notifications for this user
-    user_notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc()).all()
+    """View the current user's notifications, newest first, one page at a time."""
+    query = Notification.query.filter(Notification.user_id == current_user.id)
+    
+    # Keyset pagination on (created_at, id)
+    cursor = decode_notification_cursor(request.args.get('before'))
+    if cursor:
+        created_at, notification_id = cursor
+        query = query.filter(or_(
+            Notification.created_at < created_at,
+            and_(Notification.created_at == created_at, Notification.id < notification_id)
+        ))
+    
+    user_notifications = query.order_by(
+        Notification.created_at.desc(), Notification.id.desc()
+    ).limit(NOTIFICATIONS_PER_PAGE + 1).all()
+    
+    next_cursor = None
+    if len(user_notifications) > NOTIFICATIONS_PER_PAGE:
+        user_notifications = user_notifications[:NOTIFICATIONS_PER_PAGE]
+        next_cursor = encode_notification_cursor(user_notifications[-1])
+    
+    # Render first so the page still highlights the ones that were unread
+    page = render_template('main/notifications.html', notifications=user_notifications,
+                           next_cursor=next_cursor, is_first_page=cursor is None)
+    
+    # Then mark everything up to the newest one shown as read in one UPDATE
+    if user_notifications and current_user.unread_notification_count:
+        newest_id = max(notification.id for notification in user_notifications)
+        if mark_notifications_read(current_user.id, up_to_id=newest_id):
+            db.session.commit()
+            publish_unread_count(current_user.id)
     
-    # Mark all as read
-    for notification in user_notifications:
-        if not notification.is_read:
-            notification.is_read = True
+    return page
+
+@main.route('/notifications/mark-read', methods=['POST'])
+@login_required
+def mark_all_notifications_read():
+    """API endpoint to mark all notifications, or all up to an ID, as read."""
+    up_to_id = request.values.get('up_to', type=int)
+    if up_to_id is None and request.is_json:
+        up_to_id = (request.get_json(silent=True) or {}).get('up_to')
+    
+    marked = mark_notifications_read(current_user.id, up_to_id=up_to_id)
+    db.session.commit()
+    publish_unread_count(current_user.id)
+    
+    return jsonify({
+        'success': True,
+        'marked': marked,
+        'count': current_user.unread_notification_count
+    })
+
+@main.route('/notifications/<int:notification_id>/read', methods=['POST'])
+@login_required
+def mark_notification_read(notification_id):
+    """API endpoint to mark a single notification as read."""
+    notification = Notification.query.filter_by(id=notification_id, user_id=current_user.id).first()
+    if not notification:
+        return jsonify({'success': False, 'error': 'Notification not found'}), 404
     
+    marked = mark_notifications_read(current_user.id, notification_id=notification_id)
     db.session.commit()
+    publish_unread_count(current_user.id)
     
-    return render_template('main/notifications.html', notifications=user_notifications)
+    return jsonify({
+        'success': True,
+        'marked': marked,
+        'count': current_user.unread_notification_count
+    })
 
 @main.route('/unread-notifications-count')
 @login_required
 def unread_notifications_count():
     """Get the count of unread notifications for the current user."""
-    count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
-    return jsonify({'count': count})
+    return jsonify({'count': current_user.unread_notification_count})
+
+@main.route('/notifications/stream')
+@login_required
+def notification_stream():
+    """Server-Sent Events stream pushing the unread notification count."""
+    user_id = current_user.id
+    events = open_stream(user_id)
+    if events is None:
+        # This process serves as many streams as it may; the page polls instead
+        return '', 204
+    response = Response(stream_events(user_id, events, current_user.unread_notification_count),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let a reverse proxy buffer the stream
+    return response
+
+@main.route('/sms/status', methods=['POST'])
+def sms_status_callback():
+    """Webhook for SMS providers reporting the delivery status of a message."""
+    expected_token = current_app.config.get('SMS_STATUS_TOKEN')
+    if not expected_token:
+        abort(404)
+    token = request.headers.get('X-SMS-Status-Token') or request.args.get('token', '')
+    if not secrets.compare_digest(token, expected_token):
+        abort(403)
+    
+    data = request.get_json(silent=True) or request.form
+    message_id = data.get('message_id')
+    status = {
+        'delivered': SmsStatus.DELIVERED,
+        'undelivered': SmsStatus.UNDELIVERED,
+        'failed': SmsStatus.UNDELIVERED
+    }.get((data.get('status') or '').lower())
+    if not message_id or status is None:
+        return jsonify({'success': False, 'error': 'message_id and a valid status are required'}), 400
+    
+    provider = data.get('provider') or current_app.config.get('SMS_PROVIDER', 'fake')
+    updated = update_delivery_status(provider, message_id, status, data.get('error'))
+    return jsonify({'success': updated})
 
 # Utility functions
-def format_time_slot(time_obj):
-    """Format a time object as a string like '09:00 - 09:30'."""
-    today = datetime.now().date()
-    end_time = (datetime.combine(today, time_obj) + timedelta(minutes=30)).time()
-    return f"{time_obj.strftime('%H:%M')} - {end_time.strftime('%H:%M')}"
+def current_patient_id():
+    """The patient ID of the logged-in user, or None if they are not a patient."""
+    return current_user.patient.id if current_user.patient else None
+
+def parse_time_ranges(text):
+    """
+    Parse time ranges like '09:00-12:00, 14:00-17:00' into sorted (start_time, end_time) tuples.
+
+    Raises:
+        ValueError: If a range is malformed or ends before it starts
+    """
+    time_ranges = []
+    for part in (text or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            start_str, end_str = part.split('-')
+            start_time = datetime.strptime(start_str.strip(), '%H:%M').time()
+            end_time = datetime.strptime(end_str.strip(), '%H:%M').time()
+        except ValueError:
+            raise ValueError(f"'{part}' is not a time range like 09:00-12:00")
+        if start_time >= end_time:
+            raise ValueError(f"'{part}' ends before it starts")
+        time_ranges.append((start_time, end_time))
+    return sorted(time_ranges)
+
+def format_time_ranges(time_ranges):
+    """Format (start_time, end_time) tuples the way parse_time_ranges reads them."""
+    return ', '.join(f"{start.strftime('%H:%M')}-{end.strftime('%H:%M')}" for start, end in time_ranges)
 
 def parse_time_slot(time_slot_str):
     """Parse a time slot string like '09:00 - 09:30' into start_time and end_time."""
@@ -936,46 +1368,3 @@ def parse_time_slot(time_slot_str):
     start_time = datetime.strptime(start_str, '%H:%M').time()
     end_time = datetime.strptime(end_str, '%H:%M').time()
     return start_time, end_time
-
-def get_available_slots(doctor_id, selected_date):
-    """Get available appointment slots for a doctor on a specific date."""
-    # Get the day of week (0=Monday, 6=Sunday)
-    day_of_week = selected_date.weekday()
-    
-    # Get the doctor's availability for this day
-    availabilities = DoctorAvailability.query.filter_by(
-        doctor_id=doctor_id,
-        day_of_week=day_of_week,
-        is_available=True
-    ).all()
-    
-    if not availabilities:
-        return []
-    
-    # Create time slots every 30 minutes within the doctor's availability
-    all_slots = []
-    for availability in availabilities:
-        current_time = availability.start_time
-        end_time = availability.end_time
-        
-        while current_time < end_time:
-            # Add the slot to the list
-            all_slots.append(current_time)
-            
-            # Move to the next slot (30 minutes later)
-            current_time_dt = datetime.combine(selected_date, current_time)
-            current_time_dt += timedelta(minutes=30)
-            current_time = current_time_dt.time()
-    
-    # Get all booked appointments for this doctor on this date
-    booked_appointments = Appointment.query.filter(
-        Appointment.doctor_id == doctor_id,
-        Appointment.appointment_date == selected_date,
-        Appointment.status != AppointmentStatus.CANCELLED
-    ).all()
-    
-    # Remove booked slots
-    booked_slots = [appointment.start_time for appointment in booked_appointments]
-    available_slots = [slot for slot in all_slots if slot not in booked_slots]
-    
-    return sorted(available_slots)
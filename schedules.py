@@ -0,0 +1,313 @@
+"""
+Bulk import and export of weekly schedules for the Health Appointment System.
+
+A schedule is a list of weekly availability windows, one per CSV line or
+JSON object, for any number of doctors:
+
+    license_number,doctor_id,day,start_time,end_time
+    LIC-1001,12,Monday,09:00,12:00
+    LIC-1001,12,Monday,14:00,17:00
+
+A doctor is identified by ``license_number`` or ``doctor_id`` (either is
+enough), and ``day`` is a day name or 0-6 (0=Monday). JSON input is an
+array of objects with the same keys. ``export_schedules`` writes the same
+format, so an export can be edited and imported again.
+
+An import is validated completely in memory before anything is written:
+every line is parsed, doctors are resolved with one query, and overlapping
+windows of a doctor's day are found with one sweep over the windows sorted
+by (doctor, day, start). If anything is wrong nothing is written and every
+problem is reported. Otherwise the new windows are written with a single
+bulk INSERT in one transaction, replacing the doctors' current windows
+unless asked to add to them.
+"""
+
+import csv
+import io
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import delete, insert, or_, select
+from models import db, Doctor, DoctorAvailability
+from availability import invalidate_availability
+from slot_calendar import rebuild_doctor as rebuild_slot_calendar
+
+SCHEDULE_FIELDS = ['license_number', 'doctor_id', 'day', 'start_time', 'end_time']
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Most windows accepted in one import
+MAX_IMPORT_WINDOWS = 50000
+
+# One window of an imported schedule; line is its line (CSV) or position (JSON) for error messages
+ScheduleWindow = namedtuple('ScheduleWindow', ['line', 'license_number', 'doctor_id', 'day', 'start_time', 'end_time'])
+
+# Outcome of an import: errors is a list of messages, empty when the schedule was applied
+ImportResult = namedtuple('ImportResult', ['doctors', 'windows', 'errors'])
+
+
+class ScheduleError(ValueError):
+    """A schedule file that cannot be read at all."""
+
+
+def parse_day(value):
+    """Parse a day name (or its first three letters) or a number 0-6 into a day_of_week."""
+    value = str(value).strip()
+    if value.isdigit() and 0 <= int(value) <= 6:
+        return int(value)
+    for day, name in enumerate(DAY_NAMES):
+        if value.lower() in (name.lower(), name[:3].lower()):
+            return day
+    raise ValueError(f"unknown day '{value}'")
+
+
+def _parse_time(value, field):
+    try:
+        return datetime.strptime(str(value).strip(), '%H:%M').time()
+    except ValueError:
+        raise ValueError(f"{field} '{value}' is not a time like 09:00")
+
+
+def _read_records(text, fmt):
+    """Yield (line, record) for every record of a CSV or JSON schedule; JSON records may be any value."""
+    if fmt == 'json':
+        try:
+            records = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ScheduleError(f"Invalid JSON: {e}")
+        if not isinstance(records, list):
+            raise ScheduleError("A JSON schedule must be an array of windows")
+        for position, record in enumerate(records, start=1):
+            yield position, record
+    elif fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(text))
+        missing = {'day', 'start_time', 'end_time'} - set(reader.fieldnames or [])
+        if missing:
+            raise ScheduleError(f"Missing CSV columns: {', '.join(sorted(missing))}")
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        raise ScheduleError(f"Unknown schedule format: {fmt}")
+
+
+def detect_format(requested=None, filename=None, content_type=None):
+    """Pick 'csv' or 'json' from an explicit choice, a file name or a content type; CSV by default."""
+    if requested:
+        return requested.lower()
+    if filename and filename.lower().endswith('.json'):
+        return 'json'
+    if content_type and 'json' in content_type:
+        return 'json'
+    return 'csv'
+
+
+def parse_schedule(text, fmt='csv', default_doctor_id=None):
+    """
+    Parse a CSV or JSON schedule.
+
+    Args:
+        text: The schedule
+        fmt: 'csv' or 'json'
+        default_doctor_id: Doctor of the windows that name none
+
+    Returns:
+        A (windows, errors) tuple: the ScheduleWindows that parsed and a
+        message for every one that did not
+
+    Raises:
+        ScheduleError: If the file cannot be read at all
+    """
+    windows = []
+    errors = []
+    for line, record in _read_records(text, fmt):
+        if len(windows) >= MAX_IMPORT_WINDOWS:
+            raise ScheduleError(f"A schedule may have at most {MAX_IMPORT_WINDOWS} windows")
+        if not isinstance(record, dict):
+            errors.append(f"Line {line}: expected an object")
+            continue
+        if not any(str(value or '').strip() for value in record.values()):
+            continue
+        try:
+            license_number = str(record.get('license_number') or '').strip() or None
+            doctor_id = str(record.get('doctor_id') or '').strip()
+            doctor_id = int(doctor_id) if doctor_id else None
+            if license_number is None and doctor_id is None:
+                if default_doctor_id is None:
+                    raise ValueError("license_number or doctor_id is required")
+                doctor_id = default_doctor_id
+            day = parse_day(record.get('day', ''))
+            start_time = _parse_time(record.get('start_time', ''), 'start_time')
+            end_time = _parse_time(record.get('end_time', ''), 'end_time')
+            if start_time >= end_time:
+                raise ValueError("end_time must be after start_time")
+        except ValueError as e:
+            errors.append(f"Line {line}: {e}")
+            continue
+        windows.append(ScheduleWindow(line, license_number, doctor_id, day, start_time, end_time))
+    return windows, errors
+
+
+def find_overlaps(windows):
+    """
+    Find overlapping windows of the same doctor and day with one sweep.
+
+    Windows are sorted by (doctor, day, start); walking them in that order,
+    a window overlaps an earlier one exactly when it starts before the
+    latest end seen so far on the same doctor's day.
+
+    Args:
+        windows: (doctor_id, day, start_time, end_time, label) tuples
+
+    Returns:
+        A list of (label, label) pairs of overlapping windows
+    """
+    overlaps = []
+    current = None  # (doctor_id, day)
+    latest_end = latest_label = None
+    for doctor_id, day, start_time, end_time, label in sorted(windows, key=lambda w: w[:4]):
+        if (doctor_id, day) != current:
+            current = (doctor_id, day)
+            latest_end = latest_label = None
+        elif start_time < latest_end:
+            overlaps.append((latest_label, label))
+        if latest_end is None or end_time > latest_end:
+            latest_end, latest_label = end_time, label
+    return overlaps
+
+
+def _resolve_doctors(windows):
+    """Map every window to a doctor ID, loading the named doctors with one query."""
+    license_numbers = {w.license_number for w in windows if w.license_number}
+    doctor_ids = {w.doctor_id for w in windows if w.doctor_id is not None}
+    if not license_numbers and not doctor_ids:
+        return {}, {}
+
+    conditions = []
+    if license_numbers:
+        conditions.append(Doctor.license_number.in_(license_numbers))
+    if doctor_ids:
+        conditions.append(Doctor.id.in_(doctor_ids))
+    rows = db.session.execute(select(Doctor.id, Doctor.license_number).where(or_(*conditions))).all()
+    by_license = {license_number: doctor_id for doctor_id, license_number in rows}
+    by_id = {doctor_id: license_number for doctor_id, license_number in rows}
+    return by_license, by_id
+
+
+def import_schedules(windows, replace=True, dry_run=False, allowed_doctor_ids=None):
+    """
+    Validate a parsed schedule and write it in one transaction.
+
+    Args:
+        windows: ScheduleWindows from parse_schedule
+        replace: Replace the doctors' current windows (True) or add to them
+        dry_run: Only validate
+        allowed_doctor_ids: If set, windows of other doctors are rejected
+
+    Returns:
+        An ImportResult; nothing is written when its errors are not empty
+    """
+    errors = []
+    by_license, by_id = _resolve_doctors(windows)
+
+    resolved = []  # (doctor_id, window)
+    for window in windows:
+        doctor_id = by_license.get(window.license_number) if window.license_number else window.doctor_id
+        if doctor_id is None or doctor_id not in by_id:
+            errors.append(f"Line {window.line}: unknown doctor {window.license_number or window.doctor_id}")
+        elif window.doctor_id is not None and window.doctor_id != doctor_id:
+            errors.append(f"Line {window.line}: license_number {window.license_number} "
+                          f"does not belong to doctor {window.doctor_id}")
+        elif allowed_doctor_ids is not None and doctor_id not in allowed_doctor_ids:
+            errors.append(f"Line {window.line}: not allowed to change doctor {doctor_id}")
+        else:
+            resolved.append((doctor_id, window))
+
+    doctor_ids = {doctor_id for doctor_id, _ in resolved}
+    sweep = [
+        (doctor_id, window.day, window.start_time, window.end_time, f"line {window.line}")
+        for doctor_id, window in resolved
+    ]
+    if not replace and doctor_ids:
+        existing = db.session.execute(
+            select(
+                DoctorAvailability.doctor_id, DoctorAvailability.day_of_week,
+                DoctorAvailability.start_time, DoctorAvailability.end_time
+            ).where(DoctorAvailability.doctor_id.in_(doctor_ids))
+        )
+        sweep.extend(
+            (doctor_id, day, start_time, end_time,
+             f"the existing {DAY_NAMES[day]} {start_time.strftime('%H:%M')}-{end_time.strftime('%H:%M')} window")
+            for doctor_id, day, start_time, end_time in existing
+        )
+    for first, second in find_overlaps(sweep):
+        errors.append(f"Overlapping windows: {first} and {second}")
+
+    if errors or dry_run:
+        return ImportResult(len(doctor_ids), len(resolved), errors)
+
+    if replace:
+        db.session.execute(
+            delete(DoctorAvailability).where(
+                DoctorAvailability.doctor_id.in_(doctor_ids)
+            ).execution_options(synchronize_session=False)
+        )
+    if resolved:
+        db.session.execute(insert(DoctorAvailability), [
+            {
+                'doctor_id': doctor_id,
+                'day_of_week': window.day,
+                'start_time': window.start_time,
+                'end_time': window.end_time,
+                'is_available': True,
+            }
+            for doctor_id, window in resolved
+        ])
+    db.session.commit()
+
+    for doctor_id in doctor_ids:
+        invalidate_availability(doctor_id)
+        rebuild_slot_calendar(doctor_id)
+    return ImportResult(len(doctor_ids), len(resolved), [])
+
+
+def export_schedules(doctor_ids=None, fmt='csv'):
+    """
+    Export weekly schedules in the import format.
+
+    Args:
+        doctor_ids: Doctors to export, or None for every doctor
+        fmt: 'csv' or 'json'
+
+    Returns:
+        The schedule as a string
+    """
+    query = select(
+        Doctor.license_number, DoctorAvailability.doctor_id, DoctorAvailability.day_of_week,
+        DoctorAvailability.start_time, DoctorAvailability.end_time
+    ).join(Doctor, Doctor.id == DoctorAvailability.doctor_id).where(
+        DoctorAvailability.is_available == True
+    ).order_by(DoctorAvailability.doctor_id, DoctorAvailability.day_of_week, DoctorAvailability.start_time)
+    if doctor_ids is not None:
+        query = query.where(DoctorAvailability.doctor_id.in_(doctor_ids))
+
+    records = [
+        {
+            'license_number': license_number,
+            'doctor_id': doctor_id,
+            'day': DAY_NAMES[day],
+            'start_time': start_time.strftime('%H:%M'),
+            'end_time': end_time.strftime('%H:%M'),
+        }
+        for license_number, doctor_id, day, start_time, end_time in db.session.execute(query)
+    ]
+
+    if fmt == 'json':
+        return json.dumps(records, indent=2)
+    if fmt != 'csv':
+        raise ScheduleError(f"Unknown schedule format: {fmt}")
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=SCHEDULE_FIELDS)
+    writer.writeheader()
+    writer.writerows(records)
+    return output.getvalue()
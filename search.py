@@ -0,0 +1,283 @@
+"""
+In-process search index for doctor discovery.
+
+Verified doctors are indexed by the tokens of their specialty, location and
+bio, and by the canonical languages linked to them in doctor_languages. A
+search intersects the posting sets of every query facet instead of scanning
+the doctors table with leading-wildcard LIKE filters, and ranks the matches
+by how well they fit.
+
+Specialty and location terms match indexed tokens by prefix ("cardio" finds
+"Cardiology"); languages must match a canonical language exactly, so
+"English" no longer matches free text such as "Englishish". The index is
+rebuilt from the database every ``SEARCH_INDEX_TTL`` seconds so that workers
+which did not see an update catch up on their own.
+
+The exact facets, a language and a specialty typed as its canonical name,
+are also resolved against the lookup tables with ``lookup_doctor_ids``, an
+indexed join that sees profile changes other workers made since their index
+was built. The index then only ranks those doctors.
+"""
+
+import re
+import threading
+import time as _time
+from bisect import bisect_left
+
+from flask import current_app
+from models import db, Doctor, Language, Specialty, VerificationStatus, doctor_languages
+from utils import normalize_lookup_name
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Score of a query term matching a token exactly or only by prefix
+EXACT_MATCH_SCORE = 2
+PREFIX_MATCH_SCORE = 1
+
+# Bio matches only help ranking, so they weigh less than facet matches
+BIO_WEIGHT = 0.5
+
+
+def tokenize(text):
+    """Split free text into lowercase word tokens."""
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.casefold())
+
+
+def filter_by_specialty(query, specialty):
+    """Restrict a Doctor query to a canonical specialty through its indexed foreign key."""
+    return query.join(Specialty, Doctor.specialty_id == Specialty.id).filter(
+        Specialty.normalized_name == normalize_lookup_name(specialty)
+    )
+
+
+def filter_by_language(query, language):
+    """Restrict a Doctor query to doctors speaking a language through doctor_languages."""
+    return query.join(doctor_languages, doctor_languages.c.doctor_id == Doctor.id).join(
+        Language, Language.id == doctor_languages.c.language_id
+    ).filter(
+        Language.normalized_name == normalize_lookup_name(language)
+    )
+
+
+def lookup_doctor_ids(specialty=None, language=None):
+    """
+    Find the verified doctors with a canonical specialty and language through the lookup tables.
+
+    The specialty only applies when it is the name of a canonical specialty;
+    other specialty text is left to the index's prefix matching.
+
+    Returns:
+        A set of doctor IDs, or None when neither filter applies
+    """
+    query = db.session.query(Doctor.id).filter(Doctor.verification_status == VerificationStatus.VERIFIED)
+    filtered = False
+    normalized = normalize_lookup_name(specialty)
+    if normalized and db.session.query(Specialty.id).filter_by(normalized_name=normalized).first():
+        query = filter_by_specialty(query, specialty)
+        filtered = True
+    if normalize_lookup_name(language):
+        query = filter_by_language(query, language)
+        filtered = True
+    if not filtered:
+        return None
+    return {doctor_id for doctor_id, in query}
+
+
+class _Field:
+    """Postings for one indexed field: term -> set of doctor IDs."""
+
+    def __init__(self):
+        self.postings = {}
+        self._sorted_terms = None
+
+    def add(self, doctor_id, terms):
+        for term in terms:
+            self.postings.setdefault(term, set()).add(doctor_id)
+        self._sorted_terms = None
+
+    def remove(self, doctor_id, terms):
+        for term in terms:
+            ids = self.postings.get(term)
+            if ids is None:
+                continue
+            ids.discard(doctor_id)
+            if not ids:
+                del self.postings[term]
+        self._sorted_terms = None
+
+    def match(self, query_term):
+        """
+        Find the doctors with a term starting with query_term.
+
+        Returns:
+            A dict mapping doctor ID to the match score
+        """
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        terms = self._sorted_terms
+
+        scores = {}
+        index = bisect_left(terms, query_term)
+        while index < len(terms) and terms[index].startswith(query_term):
+            term = terms[index]
+            score = EXACT_MATCH_SCORE if term == query_term else PREFIX_MATCH_SCORE
+            for doctor_id in self.postings[term]:
+                if scores.get(doctor_id, 0) < score:
+                    scores[doctor_id] = score
+            index += 1
+        return scores
+
+
+class DoctorSearchIndex:
+    """Inverted index over verified doctors."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.specialty = _Field()
+        self.location = _Field()
+        self.bio = _Field()
+        self.languages = _Field()
+        self._documents = {}  # doctor_id -> {field name: terms}
+        self._built_at = None
+
+    def _terms(self, doctor, languages):
+        return {
+            'specialty': set(tokenize(doctor.specialty)),
+            'location': set(tokenize(doctor.location)),
+            'bio': set(tokenize(doctor.bio)),
+            'languages': set(languages),
+        }
+
+    def _add(self, doctor, languages):
+        terms = self._terms(doctor, languages)
+        for name, field_terms in terms.items():
+            getattr(self, name).add(doctor.id, field_terms)
+        self._documents[doctor.id] = terms
+
+    def _remove(self, doctor_id):
+        terms = self._documents.pop(doctor_id, None)
+        if terms is None:
+            return
+        for name, field_terms in terms.items():
+            getattr(self, name).remove(doctor_id, field_terms)
+
+    def rebuild(self):
+        """Reload every verified doctor from the database."""
+        doctors = db.session.query(
+            Doctor.id, Doctor.specialty, Doctor.location, Doctor.bio
+        ).filter(
+            Doctor.verification_status == VerificationStatus.VERIFIED
+        ).all()
+
+        languages = {}
+        rows = db.session.query(doctor_languages.c.doctor_id, Language.normalized_name).join(
+            Language, Language.id == doctor_languages.c.language_id
+        ).all()
+        for doctor_id, language in rows:
+            languages.setdefault(doctor_id, []).append(language)
+
+        with self._lock:
+            self._reset()
+            for doctor in doctors:
+                self._add(doctor, languages.get(doctor.id, []))
+            self._built_at = _time.monotonic()
+
+    def _ensure_fresh(self):
+        ttl = current_app.config.get('SEARCH_INDEX_TTL', 300)
+        if self._built_at is None or _time.monotonic() - self._built_at > ttl:
+            self.rebuild()
+
+    def update_doctor(self, doctor):
+        """
+        Reindex a doctor after their profile or verification status changed.
+
+        Doctors that are not verified are dropped from the index.
+        """
+        with self._lock:
+            if self._built_at is None:
+                # Nothing indexed yet; the first search builds from the database
+                return
+            self._remove(doctor.id)
+            if doctor.verification_status == VerificationStatus.VERIFIED:
+                self._add(doctor, [language.normalized_name for language in doctor.language_list])
+
+    def remove_doctor(self, doctor_id):
+        """Drop a doctor from the index, e.g. when the account is deleted."""
+        with self._lock:
+            self._remove(doctor_id)
+
+    def _facet(self, field, text):
+        """Score the doctors matching every term of one facet query."""
+        result = None
+        for term in tokenize(text):
+            scores = field.match(term)
+            if result is None:
+                result = scores
+            else:
+                result = {
+                    doctor_id: score + scores[doctor_id]
+                    for doctor_id, score in result.items() if doctor_id in scores
+                }
+            if not result:
+                return {}
+        return result or {}
+
+    def search(self, specialty=None, location=None, language=None):
+        """
+        Search verified doctors by specialty, location and language.
+
+        Every non-empty facet must match; matches are ranked by facet score,
+        with specialty terms found in the bio adding a smaller bonus.
+
+        Args:
+            specialty: Free-text specialty query
+            location: Free-text location query
+            language: Language name, matched exactly
+
+        Returns:
+            A list of doctor IDs, best match first
+        """
+        with self._lock:
+            self._ensure_fresh()
+
+            facets = [
+                (self.specialty, specialty),
+                (self.location, location),
+                (self.languages, normalize_lookup_name(language)),
+            ]
+            scores = None
+            for field, text in facets:
+                if not text or not tokenize(text):
+                    continue
+                if field is self.languages:
+                    facet_scores = dict.fromkeys(field.postings.get(text, ()), EXACT_MATCH_SCORE)
+                else:
+                    facet_scores = self._facet(field, text)
+                if scores is None:
+                    scores = facet_scores
+                else:
+                    scores = {
+                        doctor_id: score + facet_scores[doctor_id]
+                        for doctor_id, score in scores.items() if doctor_id in facet_scores
+                    }
+                if not scores:
+                    return []
+
+            if scores is None:
+                scores = dict.fromkeys(self._documents, 0)
+
+            if specialty:
+                for term in tokenize(specialty):
+                    for doctor_id, score in self.bio.match(term).items():
+                        if doctor_id in scores:
+                            scores[doctor_id] += score * BIO_WEIGHT
+
+        return sorted(scores, key=lambda doctor_id: (-scores[doctor_id], doctor_id))
+
+
+doctor_search_index = DoctorSearchIndex()
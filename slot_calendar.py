@@ -0,0 +1,374 @@
+"""
+Materialized slot calendar for the Health Appointment System.
+
+With ``SLOT_CALENDAR_ENABLED`` every bookable slot of every doctor for the
+next ``SLOT_CALENDAR_DAYS`` days is stored as a ``doctor_slots`` row with an
+``is_booked`` flag, and slot lists are read with a single range scan of the
+``(doctor_id, is_booked, slot_date, start_time)`` index instead of being
+computed from the weekly availability rules and the appointments.
+
+The rows are kept in step with their inputs:
+
+- ``rebuild_doctor`` regenerates a doctor's slots after edits of their
+  weekly availability or exceptions.
+- ``sync_bookings`` updates the flags of one day in the transaction that
+  books or cancels an appointment.
+- ``extend_horizon`` drops past days and adds the days that came into the
+  horizon. Run it nightly with ``python manage_db.py run_slot_calendar_refresher``
+  (or ``refresh_slot_calendar`` from cron), which also builds the calendar
+  the first time.
+
+While the calendar is disabled bookings and availability edits are not
+recorded in it, so nothing may be generated then: ``extend_horizon`` does
+nothing, and the refresher empties the table when it finds the flag off.
+Turning the flag on therefore always starts from an empty calendar, which
+the refresher builds in full; until then the live computation is used.
+
+The refresher also purges expired ``appointment_holds`` rows, flag or not:
+an abandoned hold is otherwise only removed when its slot is held again.
+
+Slots are ``DEFAULT_SLOT_MINUTES`` long. Dates beyond the materialized
+horizon, and every date while the calendar is disabled or not yet built, are
+served by the live computation in ``availability``. Booking itself always
+checks the live data.
+"""
+
+import logging
+import threading
+import time as _time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, select, update
+from models import db, DoctorSlot, DoctorAvailability, Appointment, AppointmentHold, AppointmentStatus
+from availability import (
+    DEFAULT_SLOT_MINUTES, to_minutes, from_minutes, interval_mask, iter_free_slots, merge_intervals, apply_exceptions,
+    load_exceptions
+)
+
+logger = logging.getLogger(__name__)
+
+# Rows written per INSERT statement when generating slots
+INSERT_BATCH_SIZE = 1000
+
+# Seconds before the refresher tries again after a failed refresh
+REFRESH_RETRY_DELAY = 300
+
+_lock = threading.Lock()
+_through_cache = None  # (expires_at, last materialized date or None)
+
+
+def is_enabled():
+    return current_app.config.get('SLOT_CALENDAR_ENABLED', False)
+
+
+def horizon_end(today=None):
+    """The last date the calendar should cover."""
+    today = today or datetime.now().date()
+    return today + timedelta(days=current_app.config.get('SLOT_CALENDAR_DAYS', 60) - 1)
+
+
+def _load_weekly_windows(doctor_ids=None):
+    """Weekly windows per doctor as {doctor_id: {day_of_week: [(start, end), ...]}}, merged, in one query."""
+    query = select(
+        DoctorAvailability.doctor_id,
+        DoctorAvailability.day_of_week,
+        DoctorAvailability.start_time,
+        DoctorAvailability.end_time
+    ).where(DoctorAvailability.is_available == True)
+    if doctor_ids is not None:
+        query = query.where(DoctorAvailability.doctor_id.in_(doctor_ids))
+
+    weekly_by_doctor = {}
+    for doctor_id, day_of_week, start_time, end_time in db.session.execute(query):
+        weekly_by_doctor.setdefault(doctor_id, {}).setdefault(day_of_week, []).append(
+            (to_minutes(start_time), to_minutes(end_time))
+        )
+    for weekly in weekly_by_doctor.values():
+        for day_of_week, windows in weekly.items():
+            weekly[day_of_week] = merge_intervals(windows)
+    return weekly_by_doctor
+
+
+def _load_booked_masks(start_date, end_date, doctor_ids=None):
+    """Booked minutes per (doctor_id, date) over a date range, in one query."""
+    query = select(
+        Appointment.doctor_id,
+        Appointment.appointment_date,
+        Appointment.start_time,
+        Appointment.end_time
+    ).where(
+        Appointment.appointment_date >= start_date,
+        Appointment.appointment_date <= end_date,
+        Appointment.status != AppointmentStatus.CANCELLED
+    )
+    if doctor_ids is not None:
+        query = query.where(Appointment.doctor_id.in_(doctor_ids))
+
+    masks = {}
+    for doctor_id, appointment_date, start, end in db.session.execute(query):
+        key = (doctor_id, appointment_date)
+        masks[key] = masks.get(key, 0) | interval_mask(to_minutes(start), to_minutes(end))
+    return masks
+
+
+def _generate(doctor_id, weekly, exceptions, masks, start_date, end_date):
+    """Yield the doctor_slots rows of one doctor for a date range."""
+    day = start_date
+    while day <= end_date:
+        windows = apply_exceptions(weekly.get(day.weekday(), []), exceptions.get((doctor_id, day)))
+        if windows:
+            booked_mask = masks.get((doctor_id, day), 0)
+            for start, end in iter_free_slots(windows, 0, DEFAULT_SLOT_MINUTES):
+                yield {
+                    'doctor_id': doctor_id,
+                    'slot_date': day,
+                    'start_time': from_minutes(start),
+                    'end_time': from_minutes(end),
+                    'is_booked': bool(booked_mask & interval_mask(start, end)),
+                }
+        day += timedelta(days=1)
+
+
+def _insert(rows):
+    """Insert generated rows in batches and return how many were written."""
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            db.session.execute(insert(DoctorSlot), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(DoctorSlot), batch)
+        written += len(batch)
+    return written
+
+
+def _forget_through():
+    global _through_cache
+    with _lock:
+        _through_cache = None
+
+
+def materialized_through():
+    """The last date in the calendar, or None if it is empty."""
+    global _through_cache
+    now = _time.monotonic()
+    with _lock:
+        cached = _through_cache
+    if cached and cached[0] > now:
+        return cached[1]
+
+    through = db.session.execute(select(func.max(DoctorSlot.slot_date))).scalar()
+    with _lock:
+        _through_cache = (now + current_app.config.get('SLOT_CACHE_TTL', 30), through)
+    return through
+
+
+def covers(start_date, end_date):
+    """Check whether slot lists for a date range can be read from the calendar."""
+    if not is_enabled():
+        return False
+    through = materialized_through()
+    return through is not None and start_date >= datetime.now().date() and end_date <= through
+
+
+def rebuild_doctor(doctor_id):
+    """
+    Regenerate a doctor's slots from today to the horizon, e.g. after availability edits.
+
+    Does nothing while the calendar is disabled. Commits.
+
+    Returns:
+        The number of slots written
+    """
+    if not is_enabled():
+        return 0
+    today = datetime.now().date()
+    end_date = max(horizon_end(today), materialized_through() or today)
+
+    db.session.execute(
+        delete(DoctorSlot).where(
+            DoctorSlot.doctor_id == doctor_id,
+            DoctorSlot.slot_date >= today
+        ).execution_options(synchronize_session=False)
+    )
+    weekly = _load_weekly_windows([doctor_id]).get(doctor_id, {})
+    exceptions = load_exceptions([doctor_id], today, end_date)
+    masks = _load_booked_masks(today, end_date, [doctor_id])
+    written = _insert(_generate(doctor_id, weekly, exceptions, masks, today, end_date))
+    db.session.commit()
+    return written
+
+
+def sync_bookings(doctor_id, date):
+    """
+    Bring the booked flags of a doctor's slots on one date in line with the appointments.
+
+    Call before committing a booking or cancellation so both change together.
+    Does nothing while the calendar is disabled. Does not commit.
+    """
+    if not is_enabled():
+        return
+    slots = db.session.execute(
+        select(DoctorSlot.id, DoctorSlot.start_time, DoctorSlot.end_time, DoctorSlot.is_booked).where(
+            DoctorSlot.doctor_id == doctor_id,
+            DoctorSlot.slot_date == date
+        )
+    ).all()
+    if not slots:
+        return
+
+    booked_mask = _load_booked_masks(date, date, [doctor_id]).get((doctor_id, date), 0)
+    changes = {True: [], False: []}
+    for slot_id, start_time, end_time, is_booked in slots:
+        booked = bool(booked_mask & interval_mask(to_minutes(start_time), to_minutes(end_time)))
+        if booked != is_booked:
+            changes[booked].append(slot_id)
+
+    for booked, slot_ids in changes.items():
+        if slot_ids:
+            db.session.execute(
+                update(DoctorSlot).where(DoctorSlot.id.in_(slot_ids)).values(
+                    is_booked=booked
+                ).execution_options(synchronize_session=False)
+            )
+
+
+def clear():
+    """Delete the whole calendar. Commits."""
+    deleted = db.session.execute(delete(DoctorSlot).execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    _forget_through()
+    return deleted
+
+
+def purge_expired_holds(now=None):
+    """Delete the appointment holds that have expired. Commits."""
+    now = now or datetime.utcnow()
+    deleted = db.session.execute(
+        delete(AppointmentHold).where(AppointmentHold.expires_at <= now).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def extend_horizon(today=None):
+    """
+    Drop past slots and generate every doctor's slots up to the horizon.
+
+    Each doctor continues from their own last materialized date, so running
+    it again, or after missed nights, only adds what is missing. Does nothing
+    while the calendar is disabled. Commits.
+
+    Returns:
+        A (deleted, created) tuple of slot counts
+    """
+    if not is_enabled():
+        return 0, 0
+    today = today or datetime.now().date()
+    end_date = horizon_end(today)
+
+    deleted = db.session.execute(
+        delete(DoctorSlot).where(DoctorSlot.slot_date < today).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+
+    last_dates = dict(db.session.execute(
+        select(DoctorSlot.doctor_id, func.max(DoctorSlot.slot_date)).group_by(DoctorSlot.doctor_id)
+    ).all())
+    weekly_by_doctor = _load_weekly_windows()
+    exceptions = load_exceptions(None, today, end_date)
+    # Doctors with extra hours on some dates may have no weekly windows at all
+    for doctor_id, _ in exceptions:
+        weekly_by_doctor.setdefault(doctor_id, {})
+    masks = _load_booked_masks(today, end_date)
+
+    created = 0
+    for doctor_id, weekly in weekly_by_doctor.items():
+        last_date = last_dates.get(doctor_id)
+        start_date = max(today, last_date + timedelta(days=1)) if last_date else today
+        if start_date > end_date:
+            continue
+        created += _insert(_generate(doctor_id, weekly, exceptions, masks, start_date, end_date))
+        db.session.commit()
+
+    _forget_through()
+    return deleted, created
+
+
+def get_free_slots(doctor_id, date):
+    """
+    Get a doctor's free slots on a date from the calendar.
+
+    Returns:
+        A sorted list of (start_time, end_time) tuples
+    """
+    return get_free_slots_range(doctor_id, date, date)[date]
+
+
+def get_free_slots_range(doctor_id, start_date, end_date):
+    """
+    Get a doctor's free slots for every date in a range from the calendar.
+
+    Returns:
+        A dict mapping each date in the range to a sorted list of
+        (start_time, end_time) tuples; fully booked or closed days map to []
+    """
+    dates = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+    slots_by_date = {d: [] for d in dates}
+    rows = db.session.execute(
+        select(DoctorSlot.slot_date, DoctorSlot.start_time, DoctorSlot.end_time).where(
+            DoctorSlot.doctor_id == doctor_id,
+            DoctorSlot.is_booked == False,
+            DoctorSlot.slot_date >= start_date,
+            DoctorSlot.slot_date <= end_date
+        ).order_by(DoctorSlot.slot_date, DoctorSlot.start_time)
+    )
+    for slot_date, start_time, end_time in rows:
+        slots_by_date[slot_date].append((start_time, end_time))
+    return slots_by_date
+
+
+def seconds_until_refresh(now=None):
+    """Seconds from now to the next SLOT_CALENDAR_REFRESH_HOUR o'clock, local time."""
+    now = now or datetime.now()
+    refresh_at = now.replace(hour=current_app.config.get('SLOT_CALENDAR_REFRESH_HOUR', 2),
+                             minute=0, second=0, microsecond=0)
+    if refresh_at <= now:
+        refresh_at += timedelta(days=1)
+    return (refresh_at - now).total_seconds()
+
+
+def run_refresher(app, stop_event=None):
+    """
+    Extend the calendar now and then every night until stop_event is set.
+
+    While the calendar is disabled it is emptied instead, so that enabling
+    it later rebuilds it from scratch rather than serving slots that missed
+    the bookings made meanwhile. Expired holds are purged on every run.
+    """
+    stop_event = stop_event or threading.Event()
+    with app.app_context():
+        while not stop_event.is_set():
+            try:
+                purged = purge_expired_holds()
+                if purged:
+                    logger.info(f"Purged {purged} expired appointment holds")
+                if is_enabled():
+                    deleted, created = extend_horizon()
+                    logger.info(f"Slot calendar refreshed: {deleted} past slots dropped, {created} slots added")
+                else:
+                    deleted = clear()
+                    if deleted:
+                        logger.info(f"Slot calendar disabled: {deleted} slots dropped")
+                wait = seconds_until_refresh()
+            except Exception as e:
+                logger.error(f"Slot calendar refresh failed: {e}")
+                db.session.rollback()
+                wait = REFRESH_RETRY_DELAY
+            finally:
+                db.session.remove()
+            stop_event.wait(wait)
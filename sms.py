@@ -0,0 +1,409 @@
+"""
+Outgoing text messages for the Health Appointment System.
+
+``queue_sms`` stores a message in the ``sms_outbox`` table and returns right
+away. SMS workers claim due messages, hand them to the configured provider in
+batches as large as the provider accepts, and record the outcome. A provider
+is any ``SmsProvider`` subclass registered with ``register_provider`` and
+selected with ``SMS_PROVIDER``; the built-in ``fake`` provider only logs the
+messages and reports them delivered.
+
+Every provider gets a token bucket (``SMS_RATE_LIMIT`` messages per second)
+and a cap on requests in flight (``SMS_MAX_CONCURRENCY``), shared by all the
+workers of a process. A burst of verification messages therefore waits in the
+outbox instead of in web workers, and never goes out faster than the provider
+allows. The limits are per process, so texts are sent from a single process
+by default: the ``sms_worker`` of the Procfile (``python manage_db.py
+run_sms_worker``), with ``SMS_IN_PROCESS`` off so web processes only queue.
+The development configuration turns it on, as ``python app.py`` runs no worker.
+When running several SMS processes, divide the limits by their number.
+
+Delivery receipts are recorded by ``update_delivery_status``, which the
+``main.sms_status_callback`` route calls for provider webhooks.
+"""
+
+import logging
+import random
+import threading
+import time as _time
+import uuid
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_, select, update
+from models import db, SmsOutbox, SmsStatus
+
+logger = logging.getLogger(__name__)
+
+# Messages claimed by a worker at a time, then sent in provider-sized batches
+CLAIM_BATCH_SIZE = 50
+
+# Longest error message kept on a failed outbox row
+MAX_ERROR_LENGTH = 1000
+
+# Messages the fake provider remembers in FakeSmsProvider.sent
+FAKE_SENT_HISTORY = 100
+
+# Outcome of sending one message: status is SENT, DELIVERED or FAILED
+SmsResult = namedtuple('SmsResult', ['message_id', 'status', 'error'])
+
+
+class SmsProvider:
+    """
+    Interface of an SMS provider.
+
+    Subclasses implement send(); providers with a bulk API also override
+    send_batch() and raise max_batch_size.
+    """
+
+    name = None
+    max_batch_size = 1
+
+    def send(self, phone, body):
+        """
+        Send one message.
+
+        Returns:
+            An SmsResult; raise instead for errors that affect the whole request
+        """
+        raise NotImplementedError
+
+    def send_batch(self, messages):
+        """
+        Send up to max_batch_size messages.
+
+        Args:
+            messages: List of (phone, body) tuples
+
+        Returns:
+            A list of SmsResult, one per message, in the same order
+        """
+        return [self.send(phone, body) for phone, body in messages]
+
+
+class FakeSmsProvider(SmsProvider):
+    """In-process provider that logs messages instead of sending them."""
+
+    name = 'fake'
+    max_batch_size = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._counter = 0
+        self.sent = deque(maxlen=FAKE_SENT_HISTORY)
+
+    def fail_next(self, count=1):
+        """Make the next `count` messages fail, to exercise retries."""
+        with self._lock:
+            self._failures += count
+
+    def send_batch(self, messages):
+        results = []
+        for phone, body in messages:
+            with self._lock:
+                if self._failures:
+                    self._failures -= 1
+                    results.append(SmsResult(None, SmsStatus.FAILED, 'Simulated failure'))
+                    continue
+                self._counter += 1
+                message_id = f'fake-{self._counter}'
+                self.sent.append((message_id, phone, body))
+            logger.info(f"FAKE SMS to {phone}: {body}")
+            print(f"FAKE SMS to {phone}: {body}")
+            results.append(SmsResult(message_id, SmsStatus.DELIVERED, None))
+        return results
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = _time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Take `tokens` tokens, sleeping until the bucket has paid them back.
+
+        The bucket may go into debt, so a batch larger than the capacity
+        still waits for its full cost and callers queue up in order.
+        """
+        with self._lock:
+            now = _time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            deficit = -self._tokens
+        if deficit > 0:
+            _time.sleep(deficit / self.rate)
+
+
+_provider_factories = {'fake': FakeSmsProvider}
+_providers = {}
+_limits = {}
+_state_lock = threading.Lock()
+
+_workers_lock = threading.Lock()
+_workers = []
+_wake = threading.Event()
+_stop = threading.Event()
+
+
+def register_provider(name, factory):
+    """Make a provider available under a name usable in SMS_PROVIDER."""
+    with _state_lock:
+        _provider_factories[name] = factory
+        _providers.pop(name, None)
+
+
+def get_provider(name=None):
+    """Get the shared instance of a provider, the configured one by default."""
+    name = name or current_app.config.get('SMS_PROVIDER', 'fake')
+    with _state_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            if name not in _provider_factories:
+                raise ValueError(f"Unknown SMS provider: {name}")
+            provider = _providers[name] = _provider_factories[name]()
+        return provider
+
+
+def _provider_limits(name):
+    """The (rate limiter, concurrency semaphore) pair of a provider in this process."""
+    with _state_lock:
+        limits = _limits.get(name)
+        if limits is None:
+            config = current_app.config
+            limits = _limits[name] = (
+                TokenBucket(config.get('SMS_RATE_LIMIT', 10)),
+                threading.BoundedSemaphore(config.get('SMS_MAX_CONCURRENCY', 4))
+            )
+        return limits
+
+
+def queue_sms(phone, body):
+    """
+    Queue a text message for delivery by the SMS workers.
+
+    Args:
+        phone: Recipient phone number
+        body: Message text
+
+    Returns:
+        The SmsOutbox row, committed
+    """
+    message = SmsOutbox(
+        phone=phone,
+        body=body,
+        provider=current_app.config.get('SMS_PROVIDER', 'fake')
+    )
+    db.session.add(message)
+    db.session.commit()
+
+    if current_app.config.get('SMS_IN_PROCESS', False):
+        start_workers(current_app._get_current_object())
+    _wake.set()
+    return message
+
+
+def _due_filter(now):
+    """Messages ready to send, including claims abandoned by a dead worker."""
+    stale = now - timedelta(seconds=current_app.config.get('SMS_CLAIM_TIMEOUT', 120))
+    return or_(
+        and_(SmsOutbox.status == SmsStatus.PENDING, SmsOutbox.next_attempt_at <= now),
+        and_(SmsOutbox.status == SmsStatus.SENDING, SmsOutbox.claimed_at < stale)
+    )
+
+
+def claim_batch(batch_size=CLAIM_BATCH_SIZE):
+    """
+    Claim a batch of due messages for this worker.
+
+    Returns:
+        The claimed SmsOutbox rows, oldest first
+    """
+    now = datetime.utcnow()
+    candidate_ids = db.session.execute(
+        select(SmsOutbox.id).where(_due_filter(now)).order_by(SmsOutbox.id).limit(batch_size)
+    ).scalars().all()
+    if not candidate_ids:
+        return []
+
+    token = uuid.uuid4().hex
+    db.session.execute(
+        update(SmsOutbox).where(
+            SmsOutbox.id.in_(candidate_ids),
+            _due_filter(now)
+        ).values(
+            status=SmsStatus.SENDING,
+            claimed_by=token,
+            claimed_at=now
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    return SmsOutbox.query.filter_by(claimed_by=token, status=SmsStatus.SENDING).order_by(SmsOutbox.id).all()
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt after the given number of failed attempts."""
+    config = current_app.config
+    delay = config.get('SMS_RETRY_BASE_DELAY', 10) * 2 ** (attempts - 1)
+    delay = min(delay, config.get('SMS_RETRY_MAX_DELAY', 600))
+    return delay * random.uniform(1, 1.1)
+
+
+def _record_failure(message, error, max_attempts):
+    message.last_error = str(error)[:MAX_ERROR_LENGTH]
+    message.claimed_by = None
+    if message.attempts >= max_attempts:
+        message.status = SmsStatus.FAILED
+        logger.error(f"Giving up on SMS {message.id} to {message.phone}: {error}")
+    else:
+        message.status = SmsStatus.PENDING
+        message.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(message.attempts))
+        logger.warning(f"SMS {message.id} to {message.phone} failed, will retry: {error}")
+
+
+def send_batch(messages):
+    """
+    Send claimed messages of one provider, respecting its rate and concurrency limits.
+
+    Returns:
+        A (sent, failed) tuple of message counts
+    """
+    provider = get_provider(messages[0].provider)
+    bucket, in_flight = _provider_limits(provider.name)
+    max_attempts = current_app.config.get('SMS_MAX_ATTEMPTS', 5)
+
+    for message in messages:
+        message.attempts += 1
+
+    bucket.acquire(len(messages))
+    try:
+        with in_flight:
+            results = provider.send_batch([(message.phone, message.body) for message in messages])
+    except Exception as e:
+        for message in messages:
+            _record_failure(message, e, max_attempts)
+        db.session.commit()
+        return 0, len(messages)
+
+    sent = failed = 0
+    now = datetime.utcnow()
+    for message, result in zip(messages, results):
+        if result.status == SmsStatus.FAILED:
+            failed += 1
+            _record_failure(message, result.error, max_attempts)
+            continue
+        sent += 1
+        message.status = result.status
+        message.provider_message_id = result.message_id
+        message.sent_at = now
+        message.last_error = None
+        if result.status == SmsStatus.DELIVERED:
+            message.delivered_at = now
+    db.session.commit()
+    return sent, failed
+
+
+def send_due():
+    """
+    Claim due messages and send them in provider-sized batches.
+
+    Returns:
+        A (sent, failed) tuple of message counts
+    """
+    by_provider = {}
+    for message in claim_batch():
+        by_provider.setdefault(message.provider, []).append(message)
+
+    sent = failed = 0
+    for provider_name, messages in by_provider.items():
+        try:
+            batch_size = max(get_provider(provider_name).max_batch_size, 1)
+        except ValueError as e:
+            max_attempts = current_app.config.get('SMS_MAX_ATTEMPTS', 5)
+            for message in messages:
+                message.attempts += 1
+                _record_failure(message, e, max_attempts)
+            db.session.commit()
+            failed += len(messages)
+            continue
+        for start in range(0, len(messages), batch_size):
+            batch_sent, batch_failed = send_batch(messages[start:start + batch_size])
+            sent += batch_sent
+            failed += batch_failed
+    return sent, failed
+
+
+def update_delivery_status(provider, message_id, status, error=None):
+    """
+    Record a delivery receipt reported by a provider.
+
+    Args:
+        provider: Name of the provider that sent the message
+        message_id: The provider's ID of the message
+        status: SmsStatus.DELIVERED or SmsStatus.UNDELIVERED
+        error: Optional error reported by the provider
+
+    Returns:
+        True if a message was updated
+    """
+    values = {'status': status}
+    if status == SmsStatus.DELIVERED:
+        values['delivered_at'] = datetime.utcnow()
+    if error:
+        values['last_error'] = str(error)[:MAX_ERROR_LENGTH]
+
+    result = db.session.execute(
+        update(SmsOutbox).where(
+            SmsOutbox.provider == provider,
+            SmsOutbox.provider_message_id == message_id
+        ).values(**values).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount > 0
+
+
+def run_worker(app, stop_event=None):
+    """
+    Send queued messages until stop_event is set.
+
+    Sleeps for SMS_POLL_INTERVAL seconds when the outbox is empty, or until
+    queue_sms in the same process wakes it up.
+    """
+    stop_event = stop_event or _stop
+    with app.app_context():
+        poll_interval = app.config.get('SMS_POLL_INTERVAL', 2)
+        while not stop_event.is_set():
+            try:
+                sent, failed = send_due()
+            except Exception as e:
+                logger.error(f"SMS worker error: {e}")
+                db.session.rollback()
+                sent = failed = 0
+            finally:
+                db.session.remove()
+
+            if not sent and not failed:
+                _wake.wait(poll_interval)
+                _wake.clear()
+
+
+def start_workers(app):
+    """Start the in-process SMS worker threads once per process."""
+    with _workers_lock:
+        if _workers:
+            return
+        for number in range(app.config.get('SMS_WORKERS', 2)):
+            worker = threading.Thread(
+                target=run_worker, args=(app,), name=f'sms-worker-{number}', daemon=True
+            )
+            worker.start()
+            _workers.append(worker)
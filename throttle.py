@@ -0,0 +1,182 @@
+"""
+Login throttling for the Health Appointment System.
+
+Failed logins are counted per client IP and per account over sliding
+windows. Once either count goes over its limit, further attempts from that
+IP or for that account are rejected before the user is looked up or a
+password is hashed, for a lockout that doubles with every further failure
+(``LOGIN_BACKOFF_BASE`` up to ``LOGIN_BACKOFF_MAX`` seconds). A successful
+login clears the account's failures.
+
+Counts are kept by a store. ``MemoryThrottleStore`` keeps two counters per
+key (previous and current fixed window) and weights the previous one by how
+much of it still overlaps the sliding window, so memory stays constant per
+key however many attempts arrive. It is per process; plug in a shared store
+with the same methods (e.g. backed by Redis) with ``login_throttle.set_store``
+to enforce the limits across processes.
+
+The IP comes from ``request.remote_addr``; behind a reverse proxy wrap the
+app in Werkzeug's ``ProxyFix`` so that it is the client address.
+"""
+
+import threading
+import time as _time
+
+from flask import current_app
+
+# Keys tracked by the memory store before stale ones are purged
+MAX_TRACKED_KEYS = 100000
+
+
+class MemoryThrottleStore:
+    """In-process sliding window counters and lockouts."""
+
+    def __init__(self, max_keys=MAX_TRACKED_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._counters = {}  # key -> [window_start, previous_count, current_count, window]
+        self._blocks = {}  # key -> blocked until (monotonic seconds)
+
+    @staticmethod
+    def _rotate(entry, now, window):
+        window_start = now - now % window
+        if entry[0] == window_start:
+            return
+        if entry[0] == window_start - window:
+            entry[:3] = [window_start, entry[2], 0]
+        else:
+            entry[:3] = [window_start, 0, 0]
+
+    @staticmethod
+    def _estimate(entry, now, window):
+        overlap = 1 - (now - entry[0]) / window
+        return entry[1] * overlap + entry[2]
+
+    def _purge(self, now):
+        for key in [key for key, entry in self._counters.items() if now - entry[0] >= 2 * entry[3]]:
+            del self._counters[key]
+        for key in [key for key, until in self._blocks.items() if until <= now]:
+            del self._blocks[key]
+        if len(self._counters) > self.max_keys:
+            self._counters.clear()
+
+    def increment(self, key, window, now):
+        """Count one event for a key and return the sliding window count."""
+        with self._lock:
+            entry = self._counters.get(key)
+            if entry is None:
+                if len(self._counters) >= self.max_keys:
+                    self._purge(now)
+                entry = self._counters[key] = [now - now % window, 0, 0, window]
+            self._rotate(entry, now, window)
+            entry[2] += 1
+            return self._estimate(entry, now, window)
+
+    def clear(self, key):
+        with self._lock:
+            self._counters.pop(key, None)
+            self._blocks.pop(key, None)
+
+    def block(self, key, until):
+        with self._lock:
+            self._blocks[key] = max(until, self._blocks.get(key, 0))
+
+    def blocked_until(self, key, now):
+        """The time a key is blocked until, or None if it is not blocked."""
+        with self._lock:
+            until = self._blocks.get(key)
+            if until is None:
+                return None
+            if until <= now:
+                del self._blocks[key]
+                return None
+            return until
+
+
+class LoginThrottle:
+    """Per-IP and per-account limits on failed logins."""
+
+    METRICS = ('attempts', 'rejected_ip', 'rejected_account', 'failures', 'successes', 'lockouts')
+
+    def __init__(self, store=None):
+        self.store = store or MemoryThrottleStore()
+        self._metrics_lock = threading.Lock()
+        self._metrics = dict.fromkeys(self.METRICS, 0)
+
+    def set_store(self, store):
+        """Use another store, e.g. one shared by all processes."""
+        self.store = store
+
+    def _count(self, metric):
+        with self._metrics_lock:
+            self._metrics[metric] += 1
+
+    def metrics(self):
+        """Counters of this process since it started."""
+        with self._metrics_lock:
+            return dict(self._metrics)
+
+    def _limits(self):
+        config = current_app.config
+        return (
+            ('ip', config.get('LOGIN_IP_MAX_FAILURES', 20), config.get('LOGIN_IP_WINDOW', 300)),
+            ('account', config.get('LOGIN_ACCOUNT_MAX_FAILURES', 5), config.get('LOGIN_ACCOUNT_WINDOW', 900)),
+        )
+
+    @staticmethod
+    def _keys(ip, account):
+        return {'ip': f'ip:{ip}', 'account': f'account:{(account or "").strip().lower()}'}
+
+    def check(self, ip, account):
+        """
+        Check whether a login attempt may go ahead.
+
+        Call before looking up the user or checking the password.
+
+        Args:
+            ip: Client IP address
+            account: The email address being logged into
+
+        Returns:
+            0 if the attempt may proceed, else the seconds to wait
+        """
+        self._count('attempts')
+        if not current_app.config.get('LOGIN_THROTTLE_ENABLED', True):
+            return 0
+
+        now = _time.time()
+        keys = self._keys(ip, account)
+        for kind in ('ip', 'account'):
+            until = self.store.blocked_until(keys[kind], now)
+            if until is not None:
+                self._count(f'rejected_{kind}')
+                return int(until - now) + 1
+        return 0
+
+    def failure(self, ip, account):
+        """Record a failed login and lock out the IP or account if over its limit."""
+        self._count('failures')
+        if not current_app.config.get('LOGIN_THROTTLE_ENABLED', True):
+            return
+
+        config = current_app.config
+        base = config.get('LOGIN_BACKOFF_BASE', 30)
+        maximum = config.get('LOGIN_BACKOFF_MAX', 3600)
+        now = _time.time()
+        keys = self._keys(ip, account)
+        for kind, limit, window in self._limits():
+            count = self.store.increment(keys[kind], window, now)
+            if count > limit:
+                # Each failure past the limit doubles the lockout
+                excess = int(count - limit) - 1
+                delay = min(base * 2 ** min(excess, 32), maximum)
+                self.store.block(keys[kind], now + delay)
+                self._count('lockouts')
+
+    def success(self, ip, account):
+        """Record a successful login; the account's failures are forgotten."""
+        self._count('successes')
+        self.store.clear(self._keys(ip, account)['account'])
+
+
+login_throttle = LoginThrottle()
@@ -1,6 +1,6 @@
 from app import create_app, db
 from models import User, UserType
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password
 
 def update_test_users():
     """Update test users to be compatible with the login system"""
@@ -13,8 +13,8 @@ def update_test_users():
         for i, user in enumerate(doctor_users, 1):
             # Skip the first user as we'll use it for testing
             if i == 1:
-                # Update the first doctor's password using werkzeug's check_password_hash compatible format
-                user.password_hash = generate_password_hash('password')
+                # Update the first doctor's password with the configured hashing method
+                user.password_hash = hash_password('password')
                 print(f"Updated Doctor1 (email: {user.email}) with password: 'password'")
         
         # Update patient users
@@ -22,8 +22,8 @@ def update_test_users():
         for i, user in enumerate(patient_users, 1):
             # Skip the first user as we'll use it for testing
             if i == 1:
-                # Update the first patient's password using werkzeug's check_password_hash compatible format
-                user.password_hash = generate_password_hash('password')
+                # Update the first patient's password with the configured hashing method
+                user.password_hash = hash_password('password')
                 print(f"Updated Patient1 (email: {user.email}) with password: 'password'")
         
         # Commit changes
@@ -0,0 +1,109 @@
+"""
+Loading the logged-in user for Flask-Login.
+
+Every authenticated request needs the user and, for most pages, their
+patient or doctor profile. ``load_user_with_profile`` fetches both with a
+single joined query and keeps a detached snapshot of them per process for
+``USER_CACHE_TTL`` seconds. A cache hit attaches a copy of the snapshot to
+the request's session with ``merge(load=False)``, which puts it in the
+identity map without touching the database.
+
+The snapshot leaves out ``unread_notification_count``, which changes all the
+time; reading it loads the current value. Any flush that changes or deletes a
+user, patient or doctor drops that user's snapshot (profile edits, role
+changes, activation, doctor verification), so only other processes can see
+a stale snapshot, for at most the TTL.
+"""
+
+import threading
+import time as _time
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload, make_transient_to_detached
+from models import db, User, Patient, Doctor
+
+# User columns read fresh on every request instead of cached
+VOLATILE_USER_COLUMNS = {'unread_notification_count'}
+
+# Upper bound on cached users before expired ones are purged
+MAX_CACHE_ENTRIES = 10000
+
+_lock = threading.Lock()
+_cache = {}  # user_id -> (expires_at, detached User snapshot)
+
+
+def _cache_ttl():
+    return current_app.config.get('USER_CACHE_TTL', 5)
+
+
+def _copy_columns(model, instance, exclude=()):
+    """A new transient instance with the loaded column values of another."""
+    return model(**{
+        attr.key: getattr(instance, attr.key)
+        for attr in inspect(model).column_attrs if attr.key not in exclude
+    })
+
+
+def _snapshot(user):
+    """Build a detached copy of a user and their profile for the cache."""
+    copy = _copy_columns(User, user, VOLATILE_USER_COLUMNS)
+    copy.patient = _copy_columns(Patient, user.patient) if user.patient else None
+    copy.doctor = _copy_columns(Doctor, user.doctor) if user.doctor else None
+
+    # Mark them as persistent rows that are not in any session, with a clean history
+    for instance in (copy, copy.patient, copy.doctor):
+        if instance is not None:
+            make_transient_to_detached(instance)
+    return copy
+
+
+def load_user_with_profile(user_id):
+    """
+    Load a user and their patient or doctor profile for the current request.
+
+    Args:
+        user_id: The ID of the user
+
+    Returns:
+        The User attached to the current session, or None if it does not exist
+    """
+    ttl = _cache_ttl()
+    now = _time.monotonic()
+    if ttl > 0:
+        with _lock:
+            cached = _cache.get(user_id)
+        if cached and cached[0] > now:
+            return db.session.merge(cached[1], load=False)
+
+    user = User.query.options(
+        joinedload(User.patient),
+        joinedload(User.doctor)
+    ).filter(User.id == user_id).first()
+
+    if user is not None and ttl > 0:
+        snapshot = _snapshot(user)
+        with _lock:
+            if len(_cache) > MAX_CACHE_ENTRIES:
+                for key in [key for key, (expires_at, _) in _cache.items() if expires_at <= now]:
+                    del _cache[key]
+                if len(_cache) > MAX_CACHE_ENTRIES:
+                    _cache.clear()
+            _cache[user_id] = (now + ttl, snapshot)
+    return user
+
+
+def invalidate_user(user_id):
+    """Forget the cached snapshot of a user."""
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+@event.listens_for(Session, 'before_flush')
+def _invalidate_changed_users(session, flush_context, instances):
+    """Drop the snapshots of users whose account or profile is about to change."""
+    for instance in list(session.dirty) + list(session.deleted):
+        if isinstance(instance, User):
+            invalidate_user(instance.id)
+        elif isinstance(instance, (Patient, Doctor)):
+            invalidate_user(instance.user_id)
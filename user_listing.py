@@ -0,0 +1,217 @@
+"""
+Paginated, filtered user listings for the admin JSON API.
+
+Pages are read with keyset pagination: users are ordered newest first by
+(created_at, id) and a page continues strictly after the last row of the
+previous one, which the opaque ``cursor`` encodes. Every page is then one
+index range scan of ``ix_users_created_at`` whatever its depth, unlike
+OFFSET, and rows created meanwhile do not shift later pages. (created_at
+is always set on insert, so the ordering has no NULLs to place.)
+
+Only the columns behind the requested ``fields`` are selected, as plain
+rows rather than ORM objects, and the doctor or patient profile is joined
+only when a requested field or filter needs it.
+"""
+
+import base64
+import binascii
+import enum
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select
+from models import db, User, Patient, Doctor, UserType, VerificationStatus
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Selectable fields: name -> (column, profile model it needs or None)
+USER_FIELDS = {
+    'id': (User.id, None),
+    'email': (User.email, None),
+    'phone': (User.phone, None),
+    'first_name': (User.first_name, None),
+    'last_name': (User.last_name, None),
+    'name': (User.first_name + ' ' + User.last_name, None),
+    'user_type': (User.user_type, None),
+    'is_active': (User.is_active, None),
+    'email_verified': (User.email_verified, None),
+    'phone_verified': (User.phone_verified, None),
+    'created_at': (User.created_at, None),
+    'patient_id': (Patient.id, Patient),
+    'doctor_id': (Doctor.id, Doctor),
+    'specialty': (Doctor.specialty, Doctor),
+    'verification_status': (Doctor.verification_status, Doctor),
+}
+
+# Fields returned when none are requested
+DEFAULT_FIELDS = ['id', 'email', 'name', 'user_type', 'is_active', 'created_at']
+
+
+def encode_cursor(created_at, user_id):
+    """Encode the position after a row as an opaque URL-safe cursor."""
+    position = json.dumps([created_at.isoformat(), user_id])
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor from encode_cursor.
+
+    Returns:
+        A (created_at, user_id) tuple
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, user_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def _parse_enum(enum_type, value, name):
+    members = []
+    for item in value.split(','):
+        try:
+            members.append(enum_type[item.strip().upper()])
+        except KeyError:
+            choices = ', '.join(member.name.lower() for member in enum_type)
+            raise ValueError(f"Invalid {name} '{item.strip()}', expected one of: {choices}")
+    return members
+
+
+def _parse_bool(value, name):
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    raise ValueError(f"Invalid {name} '{value}', expected true or false")
+
+
+def _parse_datetime(value, name, end_of_day=False):
+    """Parse an ISO date or datetime; a plain date as an end bound covers the whole day."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}', expected an ISO date or datetime")
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def parse_fields(value):
+    """
+    Parse a comma-separated fields= projection.
+
+    Raises:
+        ValueError: If a field is unknown
+    """
+    if not value:
+        return list(DEFAULT_FIELDS)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in USER_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(fields))
+
+
+def parse_filters(args):
+    """
+    Turn query string filters into SQL conditions.
+
+    Supported: user_type and verification_status (comma-separated names),
+    is_active (true/false), created_from and created_to (ISO dates or
+    datetimes; created_to is exclusive, a plain date includes that day).
+
+    Args:
+        args: The request's query arguments
+
+    Returns:
+        A (conditions, profile models the conditions need) tuple
+
+    Raises:
+        ValueError: If a filter value is invalid
+    """
+    conditions = []
+    joins = set()
+    if args.get('user_type'):
+        conditions.append(User.user_type.in_(_parse_enum(UserType, args['user_type'], 'user_type')))
+    if args.get('is_active'):
+        conditions.append(User.is_active == _parse_bool(args['is_active'], 'is_active'))
+    if args.get('verification_status'):
+        statuses = _parse_enum(VerificationStatus, args['verification_status'], 'verification_status')
+        conditions.append(Doctor.verification_status.in_(statuses))
+        joins.add(Doctor)
+    if args.get('created_from'):
+        conditions.append(User.created_at >= _parse_datetime(args['created_from'], 'created_from'))
+    if args.get('created_to'):
+        conditions.append(User.created_at < _parse_datetime(args['created_to'], 'created_to', end_of_day=True))
+    return conditions, joins
+
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def list_users(fields=None, conditions=(), joins=(), limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    Get one page of users, newest first.
+
+    Args:
+        fields: Names from USER_FIELDS to return, DEFAULT_FIELDS if None
+        conditions: SQL conditions from parse_filters
+        joins: Profile models the conditions need, from parse_filters
+        limit: Page size, at most MAX_PAGE_SIZE
+        cursor: The next_cursor of the previous page, if any
+
+    Returns:
+        A dict with the page's 'items' (dicts of the requested fields) and
+        'next_cursor', None on the last page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    fields = fields or list(DEFAULT_FIELDS)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    query = select(
+        User.created_at.label('_cursor_created_at'),
+        User.id.label('_cursor_id'),
+        *(USER_FIELDS[field][0].label(field) for field in fields)
+    ).select_from(User).where(*conditions)
+
+    # Doctor filters need an inner join; profile fields alone an outer one
+    inner = set(joins)
+    outer = {USER_FIELDS[field][1] for field in fields if USER_FIELDS[field][1] is not None} - inner
+    for model in (Patient, Doctor):
+        if model in inner:
+            query = query.join(model, model.user_id == User.id)
+        elif model in outer:
+            query = query.outerjoin(model, model.user_id == User.id)
+
+    if cursor:
+        created_at, user_id = decode_cursor(cursor)
+        query = query.where(or_(
+            User.created_at < created_at,
+            and_(User.created_at == created_at, User.id < user_id)
+        ))
+
+    rows = db.session.execute(
+        query.order_by(User.created_at.desc(), User.id.desc()).limit(limit + 1)
+    ).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(last['_cursor_created_at'], last['_cursor_id'])
+
+    items = [{field: _plain(row._mapping[field]) for field in fields} for row in rows]
+    return {'items': items, 'next_cursor': next_cursor}
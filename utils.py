@@ -1,12 +1,19 @@
 import os
 import random
+import re
 import string
-from datetime import datetime, timedelta
+from datetime import datetime
 import uuid
 from flask import current_app, url_for
-from flask_mail import Message
 from werkzeug.utils import secure_filename
-from models import User, VerificationStatus, Notification, DoctorAvailability, Appointment, AppointmentStatus
+from sqlalchemy import case, func, update
+from sqlalchemy.exc import IntegrityError
+from models import db, User, VerificationStatus, Notification, Specialty, Language
+from availability import get_free_slots, get_free_slots_range, DEFAULT_SLOT_MINUTES
+import slot_calendar
+from push import publish_unread_count
+from mailer import queue_email
+from sms import queue_sms
 import logging
 import secrets
 from PIL import Image
@@ -26,12 +33,10 @@ def generate_verification_token():
     """Generate a unique token for email verification."""
     return str(uuid.uuid4())
 
-def send_verification_email(mail, user, token):
-    """Send verification email to user."""
+def send_verification_email(user, token):
+    """Queue the verification email of a user for delivery."""
     verification_url = url_for('auth.verify_email', token=token, _external=True)
-    msg = Message('Verify Your Email Address',
-                  recipients=[user.email])
-    msg.body = f'''To verify your email address, please click on the following link:
+    body = f'''To verify your email address, please click on the following link:
 {verification_url}
 
 If you did not register for this account, please ignore this email.
@@ -44,32 +49,29 @@ If you did not register for this account, please ignore this email.
         return True
     
     try:
-        mail.send(msg)
+        queue_email('Verify Your Email Address', [user.email], body)
         return True
     except Exception as e:
-        logger.error(f"Failed to send email to {user.email}: {str(e)}")
-        print(f"Failed to send email to {user.email}: {str(e)}")
+        logger.error(f"Failed to queue email to {user.email}: {str(e)}")
+        print(f"Failed to queue email to {user.email}: {str(e)}")
         # Return True anyway to allow registration to proceed
         return True
 
 def send_verification_sms(user, code):
-    """
-    Send verification SMS to user.
-    
-    Note: This is a placeholder function. In a real application, 
-    you would integrate with an SMS service provider like Twilio.
-    """
-    # In a real application, you would call an SMS API here
-    print(f"SMS verification code {code} sent to {user.phone}")
-    # For demo purposes, we'll consider the SMS as sent
-    return True
+    """Queue the phone verification code of a user for delivery by SMS."""
+    try:
+        queue_sms(user.phone, f"Your Health Appointment System verification code is {code}")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to queue SMS to {user.phone}: {str(e)}")
+        print(f"Failed to queue SMS to {user.phone}: {str(e)}")
+        # Return True anyway so the user can ask for a new code
+        return True
 
-def send_password_reset_email(mail, user, token):
-    """Send password reset email to user."""
+def send_password_reset_email(user, token):
+    """Queue a password reset email for delivery."""
     reset_url = url_for('auth.reset_password', token=token, _external=True)
-    msg = Message('Password Reset Request',
-                  recipients=[user.email])
-    msg.body = f'''To reset your password, please click on the following link:
+    body = f'''To reset your password, please click on the following link:
 {reset_url}
 
 If you did not request a password reset, please ignore this email.
@@ -81,11 +83,11 @@ If you did not request a password reset, please ignore this email.
         return True
         
     try:
-        mail.send(msg)
+        queue_email('Password Reset Request', [user.email], body)
         return True
     except Exception as e:
-        logger.error(f"Failed to send password reset email to {user.email}: {str(e)}")
-        print(f"Failed to send password reset email to {user.email}: {str(e)}")
+        logger.error(f"Failed to queue password reset email to {user.email}: {str(e)}")
+        print(f"Failed to queue password reset email to {user.email}: {str(e)}")
         # Return True anyway to allow password reset to proceed
         return True
 
@@ -140,9 +142,12 @@ def save_profile_picture(form_picture, user_id):
     # Return the relative path to be stored in the database
     return f'profile_pics/{picture_filename}'
 
-def create_notification(user_id, title, message):
+def add_notification(user_id, title, message):
     """
-    Create a notification for a user.
+    Add a notification for a user without committing.
+    
+    The user's unread counter is incremented in the same transaction, so the
+    caller must commit (and then call publish_unread_count).
     
     Args:
         user_id: The ID of the user to notify
@@ -150,7 +155,7 @@ def create_notification(user_id, title, message):
         message: The notification message
         
     Returns:
-        The created notification object
+        The pending notification object
     """
     notification = Notification(
         user_id=user_id,
@@ -158,78 +163,191 @@ def create_notification(user_id, title, message):
         message=message
     )
     db.session.add(notification)
+    User.query.filter_by(id=user_id).update(
+        {User.unread_notification_count: User.unread_notification_count + 1},
+        synchronize_session=False
+    )
+    return notification
+
+def create_notification(user_id, title, message):
+    """
+    Create a notification for a user.
+    
+    Args:
+        user_id: The ID of the user to notify
+        title: The notification title
+        message: The notification message
+        
+    Returns:
+        The created notification object
+    """
+    notification = add_notification(user_id, title, message)
     db.session.commit()
+    publish_unread_count(user_id)
     return notification
 
-def get_available_slots(doctor_id, date):
+def decrement_unread_count(user_id, amount):
     """
-    Get available appointment slots for a doctor on a specific date.
+    Lower a user's unread counter after notifications were marked as read.
+    
+    Runs as a single UPDATE in the current transaction and never goes below zero.
     
     Args:
-        doctor_id: The ID of the doctor
-        date: The date to check for availability
+        user_id: The ID of the user
+        amount: The number of notifications that went from unread to read
+    """
+    if amount <= 0:
+        return
+    User.query.filter_by(id=user_id).update(
+        {User.unread_notification_count: case(
+            (User.unread_notification_count > amount, User.unread_notification_count - amount),
+            else_=0
+        )},
+        synchronize_session=False
+    )
+
+def mark_notifications_read(user_id, up_to_id=None, notification_id=None):
+    """
+    Mark a user's unread notifications as read with a single UPDATE.
+    
+    The unread counter is lowered in the same transaction; the caller commits
+    (and then calls publish_unread_count).
+    
+    Args:
+        user_id: The ID of the user
+        up_to_id: Optional; only mark notifications with an ID up to this one
+        notification_id: Optional; only mark this notification
         
     Returns:
-        A list of available time slots as (start_time, end_time) tuples
+        The number of notifications that went from unread to read
     """
-    # Get the day of week (0=Monday, 6=Sunday)
-    day_of_week = date.weekday()
+    query = Notification.query.filter(
+        Notification.user_id == user_id,
+        Notification.is_read == False
+    )
+    if up_to_id is not None:
+        query = query.filter(Notification.id <= up_to_id)
+    if notification_id is not None:
+        query = query.filter(Notification.id == notification_id)
     
-    # Get the doctor's availability for that day
-    availabilities = DoctorAvailability.query.filter_by(
-        doctor_id=doctor_id,
-        day_of_week=day_of_week,
-        is_available=True
-    ).all()
+    marked = query.update({Notification.is_read: True}, synchronize_session=False)
+    decrement_unread_count(user_id, marked)
+    return marked
+
+def reconcile_unread_counts():
+    """
+    Recompute every user's unread notification counter from the notifications table.
     
-    if not availabilities:
+    Returns:
+        The number of users whose counter was updated
+    """
+    unread = db.session.query(func.count(Notification.id)).filter(
+        Notification.user_id == User.id,
+        Notification.is_read == False
+    ).scalar_subquery()
+    result = db.session.execute(
+        update(User)
+        .where(User.unread_notification_count != unread)
+        .values(unread_notification_count=unread)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+def normalize_lookup_name(name):
+    """Normalize a specialty or language name for matching (lowercase, single-spaced words)."""
+    if not name:
+        return ''
+    return ' '.join(re.findall(r'\w+', name.casefold()))
+
+def split_languages(languages):
+    """
+    Split a comma-separated languages string into display names.
+    
+    Args:
+        languages: A string such as "Arabic, French"
+        
+    Returns:
+        A list of stripped names, without blanks or duplicates
+    """
+    names = []
+    seen = set()
+    for name in (languages or '').split(','):
+        normalized = normalize_lookup_name(name)
+        if normalized and normalized not in seen:
+            seen.add(normalized)
+            names.append(name.strip())
+    return names
+
+def _get_or_create_lookups(model, names):
+    """Return the lookup rows for the given names, creating any that are missing."""
+    by_normalized = {normalize_lookup_name(name): name for name in names}
+    by_normalized.pop('', None)
+    if not by_normalized:
         return []
     
-    # Get existing appointments for that doctor on that date
-    existing_appointments = Appointment.query.filter_by(
-        doctor_id=doctor_id,
-        appointment_date=date
-    ).filter(
-        Appointment.status != AppointmentStatus.CANCELLED
-    ).all()
+    existing = {
+        row.normalized_name: row
+        for row in model.query.filter(model.normalized_name.in_(list(by_normalized))).all()
+    }
+    for normalized, name in by_normalized.items():
+        if normalized in existing:
+            continue
+        try:
+            # Savepoint so a concurrent insert of the same name doesn't abort the transaction
+            with db.session.begin_nested():
+                row = model(name=name.strip(), normalized_name=normalized)
+                db.session.add(row)
+        except IntegrityError:
+            row = model.query.filter_by(normalized_name=normalized).first()
+        existing[normalized] = row
+    return [existing[normalized] for normalized in by_normalized]
+
+def sync_doctor_lookups(doctor):
+    """
+    Point a doctor's canonical specialty and languages at the lookup tables.
     
-    # Create a list of booked time slots
-    booked_slots = [(app.start_time, app.end_time) for app in existing_appointments]
+    The free-text ``specialty`` and ``languages`` columns stay as entered for
+    display; this keeps ``specialty_id`` and the doctor_languages rows in sync
+    with them. The caller commits.
     
-    # Create a list of all possible time slots based on availability
-    all_slots = []
-    for availability in availabilities:
-        # Create 30-minute slots within the availability period
-        current_time = availability.start_time
-        while current_time < availability.end_time:
-            # Calculate end time of this slot (30 minutes later)
-            slot_end_time = (datetime.combine(date, current_time) + timedelta(minutes=30)).time()
-            
-            # If slot end time exceeds availability end time, use availability end time
-            if slot_end_time > availability.end_time:
-                slot_end_time = availability.end_time
-            
-            # Add this slot to all slots
-            all_slots.append((current_time, slot_end_time))
-            
-            # Move to next slot
-            current_time = slot_end_time
+    Args:
+        doctor: The Doctor whose specialty or languages were set
+    """
+    specialties = _get_or_create_lookups(Specialty, [doctor.specialty] if doctor.specialty else [])
+    doctor.specialty_ref = specialties[0] if specialties else None
+    doctor.language_list = _get_or_create_lookups(Language, split_languages(doctor.languages))
+
+def get_available_slots(doctor_id, date, slot_minutes=DEFAULT_SLOT_MINUTES):
+    """
+    Get available appointment slots for a doctor on a specific date.
+    
+    Read from the materialized slot calendar when it covers the date.
     
-    # Filter out booked slots
-    available_slots = []
-    for slot in all_slots:
-        # Check if this slot overlaps with any booked slot
-        is_available = True
-        for booked in booked_slots:
-            # If slot start time is less than booked end time AND slot end time is greater than booked start time
-            if slot[0] < booked[1] and slot[1] > booked[0]:
-                is_available = False
-                break
+    Args:
+        doctor_id: The ID of the doctor
+        date: The date to check for availability
+        slot_minutes: Length of each slot in minutes
         
-        if is_available:
-            available_slots.append(slot)
+    Returns:
+        A list of available time slots as (start_time, end_time) tuples
+    """
+    if slot_minutes == DEFAULT_SLOT_MINUTES and slot_calendar.covers(date, date):
+        return slot_calendar.get_free_slots(doctor_id, date)
+    return get_free_slots(doctor_id, date, slot_minutes)
+
+def get_available_slots_range(doctor_id, start_date, end_date, slot_minutes=DEFAULT_SLOT_MINUTES):
+    """
+    Get available appointment slots for a doctor for every date in a range.
+    
+    Read from the materialized slot calendar when it covers the range.
     
-    return available_slots
+    Returns:
+        A dict mapping each date to a list of (start_time, end_time) tuples
+    """
+    if slot_minutes == DEFAULT_SLOT_MINUTES and slot_calendar.covers(start_date, end_date):
+        return slot_calendar.get_free_slots_range(doctor_id, start_date, end_date)
+    return get_free_slots_range(doctor_id, start_date, end_date, slot_minutes)
 
 def format_time_slot(slot):
     """